@@ -0,0 +1,160 @@
+import cv2
+import os
+from collections import namedtuple
+from config import *
+from bg_modeling import BgModelingState, create_bg_subtractor, detect_slides_bg_modeling
+from frame_differencing import FrameDiffState, detect_slides_frame_diff
+from pipeline import create_image_writer
+from post_process import SlideDeduplicator
+from utils import get_frame_stride, open_video_capture, scale_frame_count
+
+# Library interface to the capture engines.
+# Slides are yielded as soon as they are detected, with the decoded frame in memory,
+# nothing is printed or written to disk. The video is only read as far as the slides
+# are consumed, so breaking out of the loop stops the processing.
+#
+#     for slide in Video2Slides("Frame_Diff").iter_slides("lecture.mp4"):
+#         print(slide.frame_idx, slide.timestamp, slide.image.shape, slide.hash)
+
+SlideEvent = namedtuple("SlideEvent", ["frame_idx", "timestamp", "image", "hash"])
+
+
+def iter_frame_diff(
+    cap,
+    frame_stride=1,
+    MIN_PERCENT_THRESH=FRAME_DIFF_MIN_PERCENT,
+    ELAPSED_FRAME_THRESH=FRAME_DIFF_ELAPSED_FRAMES,
+    resize_width=FRAME_DIFF_RESIZE_WIDTH,
+    roi=None,
+):
+    # The slides of capture_slides_frame_diff, yields (frame_idx, frame).
+    capture_state = FrameDiffState(
+        MIN_PERCENT_THRESH, scale_frame_count(ELAPSED_FRAME_THRESH, frame_stride)
+    )
+    frames = detect_slides_frame_diff(cap, capture_state, frame_stride, resize_width, roi)
+    for frame_idx, frame, _, captured in frames:
+        # The frame buffers are reused by the detector.
+        if captured:
+            yield frame_idx, frame.copy()
+
+
+def iter_bg_modeling(
+    cap,
+    frame_stride=1,
+    type_bgsub="GMG",
+    history=FRAME_BUFFER_HISTORY,
+    threshold=None,
+    MIN_PERCENT_THRESH=MIN_PERCENT,
+    MAX_PERCENT_THRESH=MAX_PERCENT,
+    roi=None,
+):
+    # The slides of capture_slides_bg_modeling, yields (frame_idx, frame).
+    if threshold is None:
+        threshold = DEC_THRESH if type_bgsub == "GMG" else DIST_THRESH
+
+    bg_sub = create_bg_subtractor(
+        type_bgsub, scale_frame_count(history, frame_stride), threshold
+    )
+    capture_state = BgModelingState(MIN_PERCENT_THRESH, MAX_PERCENT_THRESH)
+    frames = detect_slides_bg_modeling(cap, capture_state, bg_sub, frame_stride, roi)
+    for frame_idx, frame, _, captured in frames:
+        # The frame buffers are reused by the detector.
+        if captured:
+            yield frame_idx, frame.copy()
+
+
+class Video2Slides:
+    def __init__(
+        self,
+        type_bgsub="GMG",
+        analysis_fps=ANALYSIS_FPS,
+        frame_stride=1,
+        dedup=True,
+        hash_size=HASH_SIZE,
+        hash_func=HASH_FUNC,
+        queue_len=HASH_BUFFER_HISTORY,
+        sim_threshold=SIM_THRESHOLD,
+        global_dedup=False,
+        roi=None,
+        **detector_kwargs,
+    ):
+        # roi is a roi.RegionOfInterest, for the resolution of the videos. detector_kwargs
+        # are passed to iter_frame_diff or iter_bg_modeling, e.g. MIN_PERCENT_THRESH.
+        self.type_bgsub = type_bgsub.upper()
+        if self.type_bgsub not in ("FRAME_DIFF", "GMG", "KNN"):
+            raise ValueError("Please choose Frame_Diff, GMG or KNN as detector")
+
+        self.analysis_fps = analysis_fps
+        self.frame_stride = frame_stride
+        self.dedup = dedup
+        self.hash_size = hash_size
+        self.hash_func = HASH_FUNC_DICT[hash_func.lower()]
+        self.queue_len = queue_len
+        self.diff_threshold = int(hash_size * hash_size * (100 - sim_threshold) / 100)
+        self.global_dedup = global_dedup
+        self.roi = roi
+        self.detector_kwargs = dict(detector_kwargs, roi=roi)
+
+    def detect(self, cap, frame_stride):
+        if self.type_bgsub == "FRAME_DIFF":
+            return iter_frame_diff(cap, frame_stride, **self.detector_kwargs)
+
+        return iter_bg_modeling(
+            cap, frame_stride, self.type_bgsub, **self.detector_kwargs
+        )
+
+    def iter_slides(self, video_path):
+        cap = open_video_capture(video_path)
+        if not cap.isOpened():
+            cap.release()
+            raise ValueError(f"Unable to open video file: {video_path}")
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_stride = get_frame_stride(cap, self.analysis_fps, self.frame_stride)
+
+        # Duplicates are dropped before they are yielded, every run has its own history.
+        deduplicator = None
+        if self.dedup:
+            deduplicator = SlideDeduplicator(
+                self.hash_size,
+                self.hash_func,
+                self.queue_len,
+                self.diff_threshold,
+                self.global_dedup,
+                self.roi,
+            )
+
+        try:
+            for frame_idx, frame in self.detect(cap, frame_stride):
+                comp_hash = None
+                if deduplicator is not None:
+                    comp_hash = deduplicator.hash_frame(frame)
+                    if deduplicator.is_duplicate_hash(comp_hash):
+                        continue
+                    comp_hash = comp_hash.tobytes().hex()
+
+                yield SlideEvent(
+                    frame_idx, frame_idx / fps if fps > 0 else None, frame, comp_hash
+                )
+        finally:
+            cap.release()
+
+
+def iter_slides(video_path, type_bgsub="GMG", **kwargs):
+    return Video2Slides(type_bgsub, **kwargs).iter_slides(video_path)
+
+
+def save_slides(slides, output_dir_path, pdf_path=None, pipelined=False, store=None):
+    # Writes slide events like the capture engines do, returns [(frame_idx, path)].
+    # With a slide_store.SlideStore, the slides are appended to it instead of the directory.
+    os.makedirs(output_dir_path, exist_ok=True)
+    writer = create_image_writer(pipelined, pdf_path=pdf_path, store=store)
+    saved = []
+
+    with writer:
+        for i, slide in enumerate(slides):
+            out_file_path = os.path.join(output_dir_path, f"{i + 1:03}.jpg")
+            writer.write(out_file_path, slide.image, slide.frame_idx)
+            saved.append((slide.frame_idx, out_file_path))
+
+    return saved
@@ -1,107 +1,189 @@
 import gradio as gr
-import os
+import threading
 import validators
-from imutils import paths
+import instrumentation
 from config import *
-from download_video import download_video
-from bg_modeling import capture_slides_bg_modeling
-from frame_differencing import capture_slides_frame_diff
-from post_process import remove_duplicates
-from utils import create_output_directory, convert_slides_to_pdf
+from convert_job import convert_video_job
+from jobs import CANCELLED, DONE, FAILED, QUEUED, QueueFullError, JobQueue
+from workspace import WorkspaceManager, start_gc
 
+# Conversions run as jobs in worker processes, the handlers only submit jobs and poll them.
+# Each job works in its own workspace, cleaned up in the background.
+job_queue = None
+workspaces = None
+_lock = threading.Lock()
 
-def process(
-    video_path,
+
+def make_params(
     bg_type,
     frame_buffer_history,
+    analysis_fps,
     hash_size,
     hash_func,
     hash_queue_len,
+    global_dedup,
     sim_threshold,
+    diff_min_percent,
+    diff_elapsed_frames,
+    min_percent,
+    max_percent,
 ):
-    output_dir_path = "output_results"
-    output_dir_path = create_output_directory(video_path, output_dir_path, bg_type)
-
-    if bg_type.lower() == "Frame Diff":
-        capture_slides_frame_diff(video_path, output_dir_path)
-    else:
-        if bg_type.lower() == "gmg":
-            thresh = DEC_THRESH
-        elif bg_type.lower() == "knn":
-            thresh = DIST_THRESH
-
-        capture_slides_bg_modeling(
-            video_path,
-            output_dir_path,
-            type_bgsub=bg_type,
-            history=frame_buffer_history,
-            threshold=thresh,
-            MIN_PERCENT_THRESH=MIN_PERCENT,
-            MAX_PERCENT_THRESH=MAX_PERCENT,
-        )
+    return dict(
+        bg_type=bg_type,
+        frame_buffer_history=frame_buffer_history,
+        analysis_fps=analysis_fps,
+        hash_size=hash_size,
+        hash_func=hash_func,
+        hash_queue_len=hash_queue_len,
+        global_dedup=global_dedup,
+        sim_threshold=sim_threshold,
+        diff_min_percent=diff_min_percent,
+        diff_elapsed_frames=diff_elapsed_frames,
+        min_percent=min_percent,
+        max_percent=max_percent,
+    )
 
-    # Perform post-processing using difference hashing technique to remove duplicate slides.
-    hash_func = HASH_FUNC_DICT.get(hash_func.lower())
 
-    diff_threshold = int(hash_size * hash_size * (100 - sim_threshold) / 100)
-    remove_duplicates(
-        output_dir_path, hash_size, hash_func, hash_queue_len, diff_threshold
-    )
+def format_status(job):
+    if job["status"] == QUEUED:
+        return f"Waiting for a worker, {job['position']} jobs ahead"
+    if job["status"] == DONE:
+        return "Done!"
+    if job["status"] == FAILED:
+        return f"Failed: {job['error']}"
+    if job["status"] == CANCELLED:
+        return "Cancelled"
+
+    return f"{job['stage'] or 'Starting'}... {job['progress']:.0%}"
+
+
+def collect_garbage():
+    workspaces.collect(job_queue.is_active)
+    job_queue.store.delete_finished(workspaces.ttl)
+
+
+def get_job_queue():
+    # Started on first use instead of at import, so the handlers also work when the
+    # module is imported, as by `gradio app.py` in reload mode.
+    global job_queue, workspaces
+    with _lock:
+        if job_queue is None:
+            workspaces = WorkspaceManager()
+            job_queue = JobQueue(convert_video_job)
+            start_gc(collect_garbage)
+
+    return job_queue
+
+
+def get_workspaces():
+    get_job_queue()
+    return workspaces
+
 
-    pdf_path = convert_slides_to_pdf(output_dir_path)
+def submit_job(params):
+    if get_workspaces().is_full():
+        raise gr.Error("The server is out of disk space, please try again in a few minutes")
 
-    # Remove unneccessary files
-    os.remove(video_path)
-    for image_path in paths.list_images(output_dir_path):
-        os.remove(image_path)
-    return pdf_path
+    try:
+        job_id = get_job_queue().submit(dict(workspace_root=workspaces.root, **params))
+    except QueueFullError:
+        raise gr.Error("The server is busy, please try again in a few minutes")
+
+    return job_id, format_status(job_queue.get(job_id))
+
+
+def poll_job(job_id):
+    # Runs every second, the job id is cleared once the job is over.
+    if not job_id:
+        return gr.update(), gr.update(), job_id
+
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return "", gr.update(), None
+
+    status = format_status(job)
+    if job["status"] == DONE:
+        return status, job["result"]["pdf_path"], None
+    if job["status"] in (FAILED, CANCELLED):
+        return status, None, None
+
+    return status, gr.update(), job_id
+
+
+def cancel_job(job_id):
+    if job_id and get_job_queue().cancel(job_id):
+        return "Cancelling..."
+
+    return gr.update()
 
 
 def process_file(
     file_obj,
     bg_type,
     frame_buffer_history,
+    analysis_fps,
     hash_size,
     hash_func,
     hash_queue_len,
+    global_dedup,
     sim_threshold,
+    diff_min_percent,
+    diff_elapsed_frames,
+    min_percent,
+    max_percent,
 ):
-    return process(
-        file_obj.name,
+    params = make_params(
         bg_type,
         frame_buffer_history,
+        analysis_fps,
         hash_size,
         hash_func,
         hash_queue_len,
+        global_dedup,
         sim_threshold,
+        diff_min_percent,
+        diff_elapsed_frames,
+        min_percent,
+        max_percent,
     )
+    return submit_job(dict(video_path=file_obj.name, **params))
 
 
 def process_via_url(
     url,
     bg_type,
     frame_buffer_history,
+    analysis_fps,
     hash_size,
     hash_func,
     hash_queue_len,
+    global_dedup,
     sim_threshold,
+    diff_min_percent,
+    diff_elapsed_frames,
+    min_percent,
+    max_percent,
 ):
-    if validators.url(url):
-        video_path = download_video(url)
-        if video_path is None:
-            raise gr.Error("An error occurred while downloading the video, please try again later")
-        return process(
-            video_path,
-            bg_type,
-            frame_buffer_history,
-            hash_size,
-            hash_func,
-            hash_queue_len,
-            sim_threshold,
-        )
-    else:
+    if not validators.url(url):
         raise gr.Error("Please enter a valid video URL")
 
+    # The video is downloaded by the job worker.
+    params = make_params(
+        bg_type,
+        frame_buffer_history,
+        analysis_fps,
+        hash_size,
+        hash_func,
+        hash_queue_len,
+        global_dedup,
+        sim_threshold,
+        diff_min_percent,
+        diff_elapsed_frames,
+        min_percent,
+        max_percent,
+    )
+    return submit_job(dict(url=url, **params))
+
 
 with gr.Blocks(css="style.css") as demo:
     with gr.Row(elem_classes=["container"]):
@@ -125,7 +207,7 @@ with gr.Blocks(css="style.css") as demo:
         with gr.Column(scale=1):
             with gr.Accordion("Advanced parameters"):
                 bg_type = gr.Dropdown(
-                    ["Frame Diff", "GMG", "KNN"],
+                    ["Frame Diff", "GMG", "KNN", "Keyframe"],
                     value="GMG",
                     label="Background subtraction",
                     info="Type of background subtraction to be used",
@@ -138,6 +220,46 @@ with gr.Blocks(css="style.css") as demo:
                     label="Frame buffer history",
                     info="Length of the frame buffer history to model background.",
                 )
+                analysis_fps = gr.Slider(
+                    minimum=0,
+                    maximum=30,
+                    value=ANALYSIS_FPS,
+                    step=1,
+                    label="Analysis FPS",
+                    info="Number of frames per second to analyze, 0 to analyze every frame",
+                )
+                diff_min_percent = gr.Slider(
+                    minimum=0.01,
+                    maximum=1,
+                    value=FRAME_DIFF_MIN_PERCENT,
+                    step=0.01,
+                    label="Frame Diff motion threshold",
+                    info="Percentage of changed pixels between frames detected as motion by Frame Diff and Keyframe",
+                )
+                diff_elapsed_frames = gr.Slider(
+                    minimum=5,
+                    maximum=200,
+                    value=FRAME_DIFF_ELAPSED_FRAMES,
+                    step=5,
+                    label="Frame Diff elapsed frames",
+                    info="Number of frames Frame Diff waits after motion starts before capturing the slide",
+                )
+                min_percent = gr.Slider(
+                    minimum=0.01,
+                    maximum=1,
+                    value=MIN_PERCENT,
+                    step=0.01,
+                    label="GMG/KNN motion threshold",
+                    info="Percentage of foreground pixels over which GMG and KNN detect motion, to capture the next slide",
+                )
+                max_percent = gr.Slider(
+                    minimum=0.001,
+                    maximum=0.1,
+                    value=MAX_PERCENT,
+                    step=0.001,
+                    label="GMG/KNN motion stopped threshold",
+                    info="Percentage of foreground pixels under which GMG and KNN consider motion to have stopped, capturing the slide",
+                )
                 # Post process
                 hash_func = gr.Dropdown(
                     ["Difference hashing", "Perceptual hashing", "Average hashing"],
@@ -161,6 +283,11 @@ with gr.Blocks(css="style.css") as demo:
                     label="Hash queue len",
                     info="Number of history images used to find out duplicate image",
                 )
+                global_dedup = gr.Checkbox(
+                    value=False,
+                    label="Global deduplication",
+                    info="Compare each image against every kept image instead of the hash queue",
+                )
                 sim_threshold = gr.Slider(
                     minimum=90,
                     maximum=100,
@@ -181,7 +308,13 @@ with gr.Blocks(css="style.css") as demo:
                     )
                 with gr.Column(scale=1, min_width=160):
                     upload_button = gr.UploadButton("Browse File", file_types=["video"])
+            with gr.Row():
+                with gr.Column(scale=3):
+                    job_status = gr.Markdown("")
+                with gr.Column(scale=1, min_width=160):
+                    cancel_button = gr.Button("Cancel")
             file_output = gr.File(file_types=[".pdf"], label="Output PDF")
+            job_id = gr.State(None)
             gr.Examples(
                 [
                     [
@@ -202,12 +335,18 @@ with gr.Blocks(css="style.css") as demo:
             file_url,
             bg_type,
             frame_buffer_history,
+            analysis_fps,
             hash_size,
             hash_func,
             hash_queue_len,
+            global_dedup,
             sim_threshold,
+            diff_min_percent,
+            diff_elapsed_frames,
+            min_percent,
+            max_percent,
         ],
-        file_output,
+        [job_id, job_status],
     )
     upload_button.upload(
         process_file,
@@ -215,12 +354,28 @@ with gr.Blocks(css="style.css") as demo:
             upload_button,
             bg_type,
             frame_buffer_history,
+            analysis_fps,
             hash_size,
             hash_func,
             hash_queue_len,
+            global_dedup,
             sim_threshold,
+            diff_min_percent,
+            diff_elapsed_frames,
+            min_percent,
+            max_percent,
         ],
-        file_output,
+        [job_id, job_status],
     )
+    cancel_button.click(cancel_job, job_id, job_status)
+    demo.load(poll_job, job_id, [job_status, file_output, job_id], every=1)
+
+if __name__ == "__main__":
+    # Stage timings are only recorded when the metrics endpoint is enabled.
+    if METRICS_PORT:
+        instrumentation.enable()
+        instrumentation.start_metrics_server(METRICS_PORT)
 
-demo.queue(concurrency_count=4).launch()
+    # Jobs interrupted by the last shutdown are queued again right away.
+    get_job_queue()
+    demo.queue(concurrency_count=4).launch()
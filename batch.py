@@ -0,0 +1,314 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stderr, redirect_stdout
+import cv2
+import validators
+from imutils import paths
+from config import BATCH_OPENCV_THREADS, BATCH_WORKERS
+from slide_store import SlideStore, find_store
+from utils import sanitize_file_name
+from video_2_slides import build_parser, main as convert_video
+
+# Converts many videos with one pool of worker processes, so the interpreter startup
+# and imports are paid once per worker instead of once per video.
+# Every item runs the same steps as video_2_slides.py, with the batch options as defaults
+# and the parameters of its manifest entry on top.
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov", ".webm", ".m4v", ".flv", ".wmv")
+TRUE_STRINGS = ("1", "true", "yes", "y")
+
+
+def get_actions(parser):
+    return {action.dest: action for action in parser._actions if action.dest != "help"}
+
+
+def parse_param(action, value):
+    # CSV cells are strings, they are converted like the command line would.
+    if isinstance(value, str):
+        if isinstance(action, argparse._StoreTrueAction):
+            value = value.strip().lower() in TRUE_STRINGS
+        elif action.type is not None:
+            value = action.type(value)
+
+    if action.choices is not None and value not in action.choices:
+        raise ValueError(f"Invalid value {value!r} for {action.dest}")
+
+    return value
+
+
+def make_item(entry, actions):
+    if isinstance(entry, str):
+        entry = dict(video_path=entry)
+
+    item = {}
+    for key, value in entry.items():
+        dest = key.strip().replace("-", "_")
+        if value is None or value == "":
+            continue
+        if dest not in actions:
+            raise ValueError(f"Unknown parameter {key!r} in manifest entry {entry}")
+        item[dest] = parse_param(actions[dest], value)
+
+    if "video_path" not in item:
+        raise ValueError(f"Missing video_path in manifest entry {entry}")
+
+    return item
+
+
+def load_manifest(manifest_path):
+    if manifest_path.lower().endswith(".csv"):
+        with open(manifest_path, newline="") as f:
+            return list(csv.DictReader(f))
+
+    with open(manifest_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def list_items(input_path, parser):
+    # A manifest with per-item parameters, a directory of videos, or a glob pattern.
+    if os.path.isfile(input_path) and input_path.lower().endswith((".csv", ".jsonl")):
+        entries = load_manifest(input_path)
+    elif os.path.isdir(input_path):
+        entries = sorted(
+            paths.list_files(input_path, validExts=VIDEO_EXTENSIONS)
+        )
+    else:
+        entries = sorted(glob.glob(input_path, recursive=True))
+        entries = [path for path in entries if path.lower().endswith(VIDEO_EXTENSIONS)]
+
+    actions = get_actions(parser)
+    return [make_item(entry, actions) for entry in entries]
+
+
+def get_opencv_threads(num_workers, opencv_threads=BATCH_OPENCV_THREADS):
+    if opencv_threads > 0:
+        return opencv_threads
+
+    return max(1, (os.cpu_count() or 1) // num_workers)
+
+
+def init_worker(opencv_threads):
+    # Workers share the CPU cores, OpenCV would otherwise start one thread per core in each.
+    cv2.setNumThreads(opencv_threads)
+
+
+def get_result(output_dir_path):
+    store_path = find_store(output_dir_path)
+    if store_path is not None:
+        with SlideStore(store_path) as store:
+            num_slides = len(store)
+    else:
+        num_slides = len(list(paths.list_images(output_dir_path)))
+    pdf_paths = sorted(paths.list_files(output_dir_path, validExts=(".pdf",)))
+
+    return num_slides, pdf_paths[0] if pdf_paths else None
+
+
+def process_item(index, item, base_args, log_path):
+    args = argparse.Namespace(**{**vars(base_args), **item})
+    result = dict(
+        index=index,
+        video_path=args.video_path,
+        params={key: value for key, value in item.items() if key != "video_path"},
+        status="failed",
+        error=None,
+        output_dir=None,
+        num_slides=0,
+        pdf_path=None,
+        log_path=log_path,
+    )
+
+    start = time.perf_counter()
+    with open(log_path, "w") as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            output_dir_path = convert_video(args)
+            result["output_dir"] = output_dir_path
+            result["num_slides"], result["pdf_path"] = get_result(output_dir_path)
+            result["status"] = "done"
+        except SystemExit as e:
+            result["error"] = f"Exited with status {e.code}"
+        except Exception as e:
+            traceback.print_exc()
+            result["error"] = f"{type(e).__name__}: {e}"
+
+    result["seconds"] = time.perf_counter() - start
+
+    return result
+
+
+def load_done(results_path):
+    # Items converted by a previous run of the same batch, with the same parameters.
+    done = set()
+    if not os.path.exists(results_path):
+        return done
+
+    with open(results_path) as f:
+        for line in f:
+            result = json.loads(line)
+            if result["status"] == "done":
+                done.add(json.dumps([result["video_path"], result["params"]], sort_keys=True))
+
+    return done
+
+
+def warn_output_collisions(items, base_args):
+    # Videos with the same file name would be written to the same output directory.
+    seen = {}
+    for index, item in enumerate(items):
+        if validators.url(item["video_path"]):
+            continue
+
+        vid_file_name = os.path.basename(item["video_path"]).split(".")[0]
+        key = (
+            item.get("out_dir", base_args.out_dir),
+            vid_file_name,
+            item.get("type", base_args.type),
+        )
+        if key in seen:
+            print(
+                f"Warnings: items {seen[key]} and {index} write to the same output directory, "
+                "set a different out_dir for one of them"
+            )
+        seen.setdefault(key, index)
+
+
+def run_batch(
+    items,
+    base_args,
+    results_path,
+    num_workers=BATCH_WORKERS,
+    opencv_threads=BATCH_OPENCV_THREADS,
+    skip_done=False,
+):
+    log_dir = os.path.splitext(results_path)[0] + "_logs"
+    os.makedirs(log_dir, exist_ok=True)
+
+    done = load_done(results_path) if skip_done else set()
+    pending = []
+    for index, item in enumerate(items):
+        params = {key: value for key, value in item.items() if key != "video_path"}
+        if json.dumps([item["video_path"], params], sort_keys=True) in done:
+            continue
+        pending.append((index, item))
+
+    print(f"Converting {len(pending)} of {len(items)} videos with {num_workers} workers...")
+    if len(pending) < len(items):
+        print(f"Skipped {len(items) - len(pending)} videos converted by a previous run")
+    print("***" * 10, "\n")
+
+    opencv_threads = get_opencv_threads(num_workers, opencv_threads)
+    results = []
+    start = time.perf_counter()
+
+    # Results are appended as soon as each video is done, so an interrupted batch
+    # still has a manifest of what was converted.
+    with open(results_path, "a" if skip_done else "w") as results_file, ProcessPoolExecutor(
+        max_workers=num_workers, initializer=init_worker, initargs=(opencv_threads,)
+    ) as executor:
+        futures = []
+        for index, item in pending:
+            log_name = sanitize_file_name(
+                os.path.splitext(os.path.basename(item["video_path"]))[0]
+            )
+            log_path = os.path.join(log_dir, f"{index:04}_{log_name}.log")
+            futures.append(
+                executor.submit(process_item, index, item, base_args, log_path)
+            )
+
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                results_file.write(json.dumps(result) + "\n")
+                results_file.flush()
+
+                print(
+                    f"[{len(results)}/{len(pending)}] {result['status']:<6} "
+                    f"{result['num_slides']:4d} slides {result['seconds']:8.1f}s  "
+                    f"{result['video_path']}"
+                )
+                if result["error"]:
+                    print(f"    {result['error']} (see {result['log_path']})")
+        except KeyboardInterrupt:
+            print("Interrupted, waiting for the running videos to finish...")
+            executor.shutdown(cancel_futures=True)
+            raise
+
+    num_failed = sum(result["status"] != "done" for result in results)
+    print("---" * 10)
+    print(
+        f"Converted {len(results) - num_failed} videos, {num_failed} failed, "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    print("Results:", results_path)
+
+    return results
+
+
+def build_batch_parser():
+    # Abbreviations are disabled, they could swallow options meant for video_2_slides.py.
+    parser = argparse.ArgumentParser(
+        allow_abbrev=False,
+        description="This script converts a directory, glob or manifest of videos into slides with a pool of worker processes. "
+        "Any other option of video_2_slides.py is used as the default parameters of every video."
+    )
+    parser.add_argument(
+        "input",
+        help="Directory of videos, glob pattern (quoted), or CSV/JSONL manifest. Manifest entries have a video_path (file or url) "
+        "and optionally any video_2_slides.py option, e.g. type or threshold",
+        type=str,
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        help="Number of videos converted at the same time",
+        default=BATCH_WORKERS,
+        type=int,
+    )
+    parser.add_argument(
+        "--opencv-threads",
+        help="Number of OpenCV threads per worker, 0 to split the CPU cores evenly between workers",
+        default=BATCH_OPENCV_THREADS,
+        type=int,
+    )
+    parser.add_argument(
+        "--results",
+        default="batch_results.jsonl",
+        help="Path to the JSONL results manifest, the log of each video is saved next to it",
+        type=str,
+    )
+    parser.add_argument(
+        "--skip-done",
+        action="store_true",
+        default=False,
+        help="flag to skip the videos already converted according to the results manifest, and append to it",
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    batch_args, video_args = build_batch_parser().parse_known_args()
+    parser = build_parser()
+    base_args = parser.parse_args(video_args)
+
+    items = list_items(batch_args.input, parser)
+    if not items:
+        print("No videos found:", batch_args.input)
+        exit(1)
+
+    warn_output_collisions(items, base_args)
+    run_batch(
+        items,
+        base_args,
+        batch_args.results,
+        max(1, batch_args.workers),
+        batch_args.opencv_threads,
+        batch_args.skip_done,
+    )
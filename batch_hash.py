@@ -0,0 +1,113 @@
+import imagehash
+import numpy as np
+import scipy.fftpack
+from PIL import Image
+
+# Vectorized versions of the imagehash functions.
+# Each image is still converted and downsampled by PIL, so the hashes match imagehash
+# bit for bit, but everything after the downsampling runs on the whole stacked batch.
+# Hashes are stored bit-packed, one row of uint64 words per image.
+
+try:
+    ANTIALIAS = Image.Resampling.LANCZOS
+except AttributeError:
+    ANTIALIAS = Image.ANTIALIAS
+
+HASH_METHODS = {
+    imagehash.dhash: "dhash",
+    imagehash.phash: "phash",
+    imagehash.average_hash: "ahash",
+}
+
+HIGHFREQ_FACTOR = 4
+
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def downsample_images(images, size):
+    pixels = np.empty((len(images), size[1], size[0]), dtype=np.uint8)
+
+    for i, image in enumerate(images):
+        pixels[i] = np.asarray(image.convert("L").resize(size, ANTIALIAS))
+
+    return pixels
+
+
+def dhash_bits(images, hash_size):
+    pixels = downsample_images(images, (hash_size + 1, hash_size))
+
+    return pixels[:, :, 1:] > pixels[:, :, :-1]
+
+
+def ahash_bits(images, hash_size):
+    pixels = downsample_images(images, (hash_size, hash_size))
+    avg = pixels.mean(axis=(1, 2))
+
+    return pixels > avg[:, None, None]
+
+
+def phash_bits(images, hash_size):
+    img_size = hash_size * HIGHFREQ_FACTOR
+    pixels = downsample_images(images, (img_size, img_size))
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(pixels, axis=1), axis=2)
+    dctlowfreq = dct[:, :hash_size, :hash_size]
+    med = np.median(dctlowfreq.reshape(len(images), -1), axis=1)
+
+    return dctlowfreq > med[:, None, None]
+
+
+HASH_BITS_FUNCS = {
+    "dhash": dhash_bits,
+    "phash": phash_bits,
+    "ahash": ahash_bits,
+}
+
+
+def pack_bits(bits):
+    bits = bits.reshape(len(bits), -1)
+    num_words = -(-bits.shape[1] // 64)
+
+    packed = np.zeros((len(bits), num_words * 8), dtype=np.uint8)
+    packed[:, : -(-bits.shape[1] // 8)] = np.packbits(bits, axis=1)
+
+    return packed.view(np.uint64)
+
+
+def unpack_bits(hashes, hash_size):
+    bits = np.unpackbits(hashes.view(np.uint8), axis=1)
+
+    return bits[:, : hash_size * hash_size].astype(bool)
+
+
+def batch_hash(images, hash_size=8, hashfunc=imagehash.dhash):
+    if hash_size < 2:
+        raise ValueError("Hash size must be greater than or equal to 2")
+
+    method = HASH_METHODS.get(hashfunc, hashfunc)
+    if method in HASH_BITS_FUNCS:
+        bits = HASH_BITS_FUNCS[method](images, hash_size)
+    else:
+        # Fall back to hashing the images one by one for custom hash functions.
+        bits = np.stack([hashfunc(image, hash_size=hash_size).hash for image in images])
+
+    return pack_bits(bits)
+
+
+def to_image_hash(packed_hash, hash_size):
+    bits = unpack_bits(packed_hash[None], hash_size)[0]
+
+    return imagehash.ImageHash(bits.reshape(hash_size, hash_size))
+
+
+def popcount(words):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+
+    # numpy < 2.0 has no popcount ufunc, count the bits of each byte with a table.
+    bytes_ = words.view(np.uint8).reshape(*words.shape[:-1], -1)
+    return POPCOUNT_TABLE[bytes_].sum(axis=-1, dtype=np.int64)
+
+
+def hamming_distances(packed_hash, hashes):
+    # Hamming distance between one hash and every row of a hash array.
+    return popcount(np.bitwise_xor(hashes, packed_hash))
@@ -0,0 +1,245 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import instrumentation
+from config import *
+from bg_modeling import capture_slides_bg_modeling
+from frame_differencing import capture_slides_frame_diff
+from keyframe_scan import capture_slides_keyframes
+from post_process import remove_duplicates
+from roi import load_roi
+from synthetic_video import SCENARIOS, load_or_generate, score_slides
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ENGINES = ["Frame_Diff", "GMG", "KNN", "Keyframe"]
+
+
+def get_peak_rss_mb():
+    if resource is None:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    if sys.platform == "darwin":
+        peak_rss /= 1024
+
+    return peak_rss / 1024
+
+
+def capture(video_path, output_dir_path, engine, roi=None):
+    # Same parameters as video_2_slides.py.
+    if engine == "Frame_Diff":
+        return capture_slides_frame_diff(video_path, output_dir_path, roi=roi)
+    if engine == "Keyframe":
+        return capture_slides_keyframes(video_path, output_dir_path, roi=roi)
+
+    return capture_slides_bg_modeling(
+        video_path,
+        output_dir_path,
+        type_bgsub=engine,
+        history=FRAME_BUFFER_HISTORY,
+        threshold=DEC_THRESH if engine == "GMG" else DIST_THRESH,
+        MIN_PERCENT_THRESH=MIN_PERCENT,
+        MAX_PERCENT_THRESH=MAX_PERCENT,
+        roi=roi,
+    )
+
+
+def run_engine(video_path, output_dir_path, engine, verbose=False, roi=None):
+    shutil.rmtree(output_dir_path, ignore_errors=True)
+    os.makedirs(output_dir_path)
+
+    diff_threshold = int(HASH_SIZE * HASH_SIZE * (100 - SIM_THRESHOLD) / 100)
+    devnull = open(os.devnull, "w")
+    quiet = contextlib.ExitStack()
+    if not verbose:
+        quiet.enter_context(contextlib.redirect_stdout(devnull))
+        quiet.enter_context(contextlib.redirect_stderr(devnull))
+
+    # The time of every stage, e.g. decode or color_conversion, shows which one a
+    # regression comes from.
+    instrumentation.enable()
+
+    with quiet:
+        start = time.perf_counter()
+        slides = capture(video_path, output_dir_path, engine, roi)
+        capture_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        remove_duplicates(
+            output_dir_path,
+            HASH_SIZE,
+            HASH_FUNC_DICT[HASH_FUNC],
+            HASH_BUFFER_HISTORY,
+            diff_threshold,
+            roi=roi,
+        )
+        dedup_time = time.perf_counter() - start
+
+    stages = instrumentation.profiler.get_report()["timers"]
+    instrumentation.disable()
+    devnull.close()
+    kept_frames = [frame_idx for frame_idx, path in slides if os.path.exists(path)]
+    shutil.rmtree(output_dir_path, ignore_errors=True)
+
+    return dict(
+        captured_frames=[frame_idx for frame_idx, _ in slides],
+        kept_frames=kept_frames,
+        capture_seconds=capture_time,
+        dedup_seconds=dedup_time,
+        stages=stages,
+        peak_rss_mb=get_peak_rss_mb(),
+    )
+
+
+def run_isolated(*args):
+    # Every run gets a fresh process, so its peak RSS is its own.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_engine, *args).result()
+
+
+def get_environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        commit = None
+
+    return dict(
+        commit=commit or None,
+        date=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        platform=platform.platform(),
+        python=platform.python_version(),
+        opencv=cv2.__version__,
+        cpu_count=os.cpu_count(),
+    )
+
+
+def compare_results(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {
+            (r["scenario"], r["engine"]): r for r in json.load(f)["results"]
+        }
+
+    print("---" * 10)
+    print(f"Compared with {baseline_path}:")
+    for result in results:
+        base = baseline.get((result["scenario"], result["engine"]))
+        if base is None:
+            continue
+
+        print(
+            f"  {result['scenario']:<14} {result['engine']:<10} "
+            f"speed {result['fps'] / base['fps']:.2f}x, "
+            f"precision {result['precision'] - base['precision']:+.2f}, "
+            f"recall {result['recall'] - base['recall']:+.2f}"
+        )
+        print_stage_changes(result.get("stages", {}), base.get("stages", {}))
+
+
+def print_stage_changes(stages, base_stages):
+    # Stages sorted by the time they gained, the largest regression first.
+    changes = []
+    for name in set(stages) | set(base_stages):
+        seconds = stages.get(name, {}).get("seconds", 0.0)
+        base_seconds = base_stages.get(name, {}).get("seconds", 0.0)
+        changes.append((seconds - base_seconds, name, seconds, base_seconds))
+
+    for diff, name, seconds, base_seconds in sorted(changes, reverse=True):
+        print(
+            f"    {name:<24} {base_seconds:8.3f}s -> {seconds:8.3f}s ({diff:+.3f}s)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the speed and accuracy of the capture engines on synthetic lecture videos."
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS)
+    )
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES)
+    parser.add_argument(
+        "--scale",
+        default=1.0,
+        type=float,
+        help="Multiply the duration of every slide, use a small value for a quick run",
+    )
+    parser.add_argument("--video-dir", default="bench_videos", type=str)
+    parser.add_argument("-o", "--output", default="bench_results.json", type=str)
+    parser.add_argument(
+        "--compare", help="Previous results file to compare against", type=str
+    )
+    parser.add_argument(
+        "--auto-roi",
+        action="store_true",
+        default=False,
+        help="Ignore the regions that keep moving, as video_2_slides.py --auto-roi",
+    )
+    parser.add_argument("--verbose", action="store_true", default=False)
+    args = parser.parse_args()
+
+    results = []
+    for scenario in args.scenarios:
+        video_path, ground_truth = load_or_generate(
+            args.video_dir, scenario, args.scale
+        )
+        num_frames = ground_truth["num_frames"]
+        roi = load_roi(video_path, auto=True) if args.auto_roi else None
+
+        for engine in args.engines:
+            output_dir_path = os.path.join(args.video_dir, ".output", scenario, engine)
+            run = run_isolated(video_path, output_dir_path, engine, args.verbose, roi)
+            precision, recall = score_slides(run["kept_frames"], ground_truth)
+
+            result = dict(
+                scenario=scenario,
+                engine=engine,
+                num_frames=num_frames,
+                resolution=f"{ground_truth['width']}x{ground_truth['height']}",
+                num_slides=len(ground_truth["slides"]),
+                num_captured=len(run["captured_frames"]),
+                num_kept=len(run["kept_frames"]),
+                fps=num_frames / run["capture_seconds"],
+                precision=precision,
+                recall=recall,
+                roi=repr(roi) if roi is not None else None,
+                **run,
+            )
+            results.append(result)
+
+            print(
+                f"{scenario:<14} {engine:<10} {result['fps']:8.1f} frames/s  "
+                f"capture {run['capture_seconds']:6.2f}s  "
+                f"dedup {run['dedup_seconds']:5.2f}s  "
+                f"rss {run['peak_rss_mb'] or 0:6.1f}MB  "
+                f"precision {precision:.2f}  recall {recall:.2f}"
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(dict(environment=get_environment(), results=results), f, indent=2)
+    print("Results saved to", args.output)
+
+    if args.compare:
+        compare_results(results, args.compare)
@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from collections import deque
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_hash import batch_hash, hamming_distances, to_image_hash
+from config import HASH_FUNC_DICT, HASH_SIZE, HASH_BUFFER_HISTORY
+
+
+def generate_slides(num_images, width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    images = []
+
+    for i in range(num_images):
+        image = Image.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((0, 0, width, height // 8), fill=tuple(rng.integers(0, 255, 3)))
+        draw.text((width // 20, height // 20), f"Slide {i}", fill="black")
+
+        for _ in range(rng.integers(3, 8)):
+            x0, y0 = rng.integers(0, width // 2), rng.integers(height // 6, height - 40)
+            x1, y1 = x0 + rng.integers(40, width // 2), y0 + rng.integers(10, 60)
+            draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.integers(0, 255, 3)))
+
+        images.append(image)
+
+    return images
+
+
+def bench_imagehash(images, hash_size, hashfunc, queue_len):
+    start = time.perf_counter()
+    hashes = [hashfunc(image, hash_size=hash_size) for image in images]
+    hash_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hash_queue = deque([], maxlen=queue_len)
+    distances = []
+    for comp_hash in hashes:
+        distances.append([img_hash - comp_hash for img_hash in hash_queue])
+        hash_queue.append(comp_hash)
+    dist_time = time.perf_counter() - start
+
+    return hashes, distances, hash_time, dist_time
+
+
+def bench_batch_hash(images, hash_size, hashfunc, queue_len):
+    start = time.perf_counter()
+    hashes = batch_hash(images, hash_size, hashfunc)
+    hash_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    distances = []
+    for i, comp_hash in enumerate(hashes):
+        window = hashes[max(0, i - queue_len) : i]
+        distances.append(hamming_distances(comp_hash, window).tolist())
+    dist_time = time.perf_counter() - start
+
+    return hashes, distances, hash_time, dist_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare imagehash with the vectorized batch hashing engine."
+    )
+    parser.add_argument("-n", "--num-images", default=1000, type=int)
+    parser.add_argument("--width", default=1280, type=int)
+    parser.add_argument("--height", default=720, type=int)
+    parser.add_argument("-hs", "--hash-size", default=HASH_SIZE, type=int)
+    parser.add_argument("-q", "--queue-len", default=HASH_BUFFER_HISTORY, type=int)
+    args = parser.parse_args()
+
+    print(f"Generating {args.num_images} slides of {args.width}x{args.height}...")
+    images = generate_slides(args.num_images, args.width, args.height)
+
+    for name in ["dhash", "phash", "ahash"]:
+        hashfunc = HASH_FUNC_DICT[name]
+        ref_hashes, ref_dists, ref_hash_time, ref_dist_time = bench_imagehash(
+            images, args.hash_size, hashfunc, args.queue_len
+        )
+        hashes, dists, hash_time, dist_time = bench_batch_hash(
+            images, args.hash_size, hashfunc, args.queue_len
+        )
+
+        identical = all(
+            to_image_hash(packed_hash, args.hash_size) == ref_hash
+            for packed_hash, ref_hash in zip(hashes, ref_hashes)
+        )
+        identical = identical and dists == ref_dists
+
+        print("---" * 10)
+        print(f"{name} (hash size {args.hash_size}), identical: {identical}")
+        print(f"  imagehash: hashing {ref_hash_time:.3f}s, distances {ref_dist_time:.3f}s")
+        print(f"  batch:     hashing {hash_time:.3f}s, distances {dist_time:.3f}s")
+        print(
+            f"  speedup:   hashing {ref_hash_time / hash_time:.2f}x, "
+            f"distances {ref_dist_time / dist_time:.2f}x"
+        )
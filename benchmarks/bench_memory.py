@@ -0,0 +1,226 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import *
+from bg_modeling import capture_slides_bg_modeling
+from frame_differencing import capture_slides_frame_diff
+from synthetic_video import generate_video
+from bench_engines import get_environment, get_peak_rss_mb
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Memory use of the capture engines on a 4K video. tracemalloc follows the numpy
+# arrays, which is where OpenCV allocates the frames returned to Python, and RSS is
+# sampled while the engine runs. Allocator churn shows as minor page faults: every
+# full resolution frame allocated anew is mapped and faulted in again.
+
+ENGINES = ["Frame_Diff", "GMG", "KNN"]
+VIDEO_PARAMS = dict(width=3840, height=2160, num_slides=4, slide_secs=5)
+
+
+def get_rss_mb():
+    # Current RSS, only available on Linux.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except OSError:
+        return None
+
+
+def get_minor_faults():
+    if resource is None:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+
+
+class RssSampler:
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            rss = get_rss_mb()
+            if rss is not None:
+                self.samples.append(rss)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def capture(video_path, output_dir_path, engine, pipelined=False):
+    # Same parameters as video_2_slides.py.
+    if engine == "Frame_Diff":
+        return capture_slides_frame_diff(
+            video_path, output_dir_path, pipelined=pipelined
+        )
+
+    return capture_slides_bg_modeling(
+        video_path,
+        output_dir_path,
+        type_bgsub=engine,
+        history=FRAME_BUFFER_HISTORY,
+        threshold=DEC_THRESH if engine == "GMG" else DIST_THRESH,
+        MIN_PERCENT_THRESH=MIN_PERCENT,
+        MAX_PERCENT_THRESH=MAX_PERCENT,
+        pipelined=pipelined,
+    )
+
+
+def run_engine(video_path, output_dir_path, engine, pipelined=False, verbose=False):
+    shutil.rmtree(output_dir_path, ignore_errors=True)
+    os.makedirs(output_dir_path)
+
+    devnull = open(os.devnull, "w")
+    quiet = contextlib.ExitStack()
+    if not verbose:
+        quiet.enter_context(contextlib.redirect_stdout(devnull))
+        quiet.enter_context(contextlib.redirect_stderr(devnull))
+
+    start_faults = get_minor_faults()
+    tracemalloc.start()
+    with quiet, RssSampler() as sampler:
+        start = time.perf_counter()
+        slides = capture(video_path, output_dir_path, engine, pipelined)
+        capture_time = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    faults = get_minor_faults()
+
+    devnull.close()
+    shutil.rmtree(output_dir_path, ignore_errors=True)
+
+    # The first samples include the decoder start up, the spread of the others shows
+    # whether memory stays flat.
+    samples = sampler.samples[len(sampler.samples) // 10 :]
+    return dict(
+        num_captured=len(slides),
+        capture_seconds=capture_time,
+        traced_peak_mb=traced_peak / 1024**2,
+        peak_rss_mb=get_peak_rss_mb(),
+        rss_min_mb=min(samples) if samples else None,
+        rss_max_mb=max(samples) if samples else None,
+        minor_faults=faults - start_faults if faults is not None else None,
+    )
+
+
+def run_isolated(*args):
+    # Every run gets a fresh process, so its peak RSS is its own.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_engine, *args).result()
+
+
+def load_or_generate(video_dir):
+    video_path = os.path.join(video_dir, "memory_4k.mp4")
+    gt_path = os.path.splitext(video_path)[0] + ".json"
+
+    if os.path.exists(video_path) and os.path.exists(gt_path):
+        with open(gt_path) as f:
+            return video_path, json.load(f)
+
+    os.makedirs(video_dir, exist_ok=True)
+    print(f"Generating {video_path}...")
+    return video_path, generate_video(video_path, **VIDEO_PARAMS)
+
+
+def compare_results(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {
+            (r["engine"], r["pipelined"]): r for r in json.load(f)["results"]
+        }
+
+    print("---" * 10)
+    print(f"Compared with {baseline_path}:")
+    for result in results:
+        base = baseline.get((result["engine"], result["pipelined"]))
+        if base is None:
+            continue
+
+        print(
+            f"  {result['engine']:<10} {'pipelined' if result['pipelined'] else '':<9} "
+            f"speed {result['fps'] / base['fps']:.2f}x, "
+            f"traced peak {result['traced_peak_mb'] - base['traced_peak_mb']:+.1f}MB, "
+            f"peak rss {result['peak_rss_mb'] - base['peak_rss_mb']:+.1f}MB, "
+            f"faults/frame {result['faults_per_frame'] - base['faults_per_frame']:+.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the memory use and allocator churn of the capture engines on a 4K video."
+    )
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES)
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        default=False,
+        help="Also measure the engines with decoding and encoding on separate threads",
+    )
+    parser.add_argument("--video-dir", default="bench_videos", type=str)
+    parser.add_argument("-o", "--output", default="memory_results.json", type=str)
+    parser.add_argument(
+        "--compare", help="Previous results file to compare against", type=str
+    )
+    parser.add_argument("--verbose", action="store_true", default=False)
+    args = parser.parse_args()
+
+    video_path, ground_truth = load_or_generate(args.video_dir)
+    num_frames = ground_truth["num_frames"]
+
+    results = []
+    for pipelined in [False, True] if args.pipeline else [False]:
+        for engine in args.engines:
+            output_dir_path = os.path.join(args.video_dir, ".output", "memory", engine)
+            run = run_isolated(
+                video_path, output_dir_path, engine, pipelined, args.verbose
+            )
+
+            result = dict(
+                engine=engine,
+                pipelined=pipelined,
+                num_frames=num_frames,
+                resolution=f"{ground_truth['width']}x{ground_truth['height']}",
+                fps=num_frames / run["capture_seconds"],
+                faults_per_frame=(run["minor_faults"] or 0) / num_frames,
+                **run,
+            )
+            results.append(result)
+
+            print(
+                f"{engine:<10} {'pipelined' if pipelined else '':<9} "
+                f"{result['fps']:6.1f} frames/s  "
+                f"traced peak {run['traced_peak_mb']:7.1f}MB  "
+                f"rss {run['rss_min_mb'] or 0:6.1f}-{run['rss_max_mb'] or 0:6.1f}MB  "
+                f"peak rss {run['peak_rss_mb'] or 0:6.1f}MB  "
+                f"faults/frame {result['faults_per_frame']:6.0f}"
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(dict(environment=get_environment(), results=results), f, indent=2)
+    print("Results saved to", args.output)
+
+    if args.compare:
+        compare_results(results, args.compare)
@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import cv2
+import numpy as np
+
+# Synthetic lecture videos with known ground truth.
+# Every video is a sequence of slides separated by cuts or fades. Slides can reveal
+# their bullets one at a time, and a moving webcam overlay can be drawn in a corner.
+# The ground truth lists every stable state of the slide area as a [start, end) frame
+# interval, a captured frame is correct if it falls in a state nobody captured yet.
+
+SCENARIOS = {
+    "cuts_720p": dict(width=1280, height=720, num_slides=8, slide_secs=10),
+    "fades_720p": dict(width=1280, height=720, num_slides=8, slide_secs=10, fade_secs=1),
+    "bullets_720p": dict(
+        width=1280, height=720, num_slides=6, slide_secs=15, bullet_secs=3
+    ),
+    "webcam_720p": dict(width=1280, height=720, num_slides=8, slide_secs=10, webcam=True),
+    "cuts_1080p": dict(width=1920, height=1080, num_slides=6, slide_secs=10),
+    "long_480p": dict(width=854, height=480, num_slides=40, slide_secs=15),
+}
+
+
+def draw_slide(width, height, index, num_bullets, rng):
+    slide = np.full((height, width, 3), 255, dtype=np.uint8)
+    scale = height / 720
+
+    # A colored title bar and a chart make every slide look different to perceptual hashes.
+    color = tuple(int(c) for c in rng.integers(0, 200, 3))
+    cv2.rectangle(slide, (0, 0), (width, int(110 * scale)), color, -1)
+    cv2.putText(
+        slide,
+        f"Lecture slide {index + 1}",
+        (int(40 * scale), int(75 * scale)),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        2 * scale,
+        (255, 255, 255),
+        max(1, int(4 * scale)),
+    )
+
+    chart_x = int(width * 0.6)
+    for i, value in enumerate(rng.uniform(0.2, 1.0, 5)):
+        x0 = chart_x + int(i * width * 0.07)
+        y1 = int(height * 0.9)
+        y0 = y1 - int(value * height * 0.55)
+        bar_color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(slide, (x0, y0), (x0 + int(width * 0.05), y1), bar_color, -1)
+
+    # One image per revealed bullet, the last one being the complete slide.
+    states = []
+    for num_shown in range(num_bullets + 1):
+        state = slide.copy()
+        for j in range(num_shown):
+            cv2.putText(
+                state,
+                f"- point {j + 1}: {int(rng.integers(10**5, 10**6))}",
+                (int(60 * scale), int((200 + j * 80) * scale)),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                1.2 * scale,
+                (40, 40, 40),
+                max(1, int(3 * scale)),
+            )
+        states.append(state)
+
+    return states
+
+
+def draw_webcam(frame, frame_idx, rng):
+    # A talking head: a moving blob over sensor noise in the bottom right corner.
+    height, width = frame.shape[:2]
+    cam_w, cam_h = width // 5, height // 5
+    x0, y0 = width - cam_w - 10, height - cam_h - 10
+
+    cam = rng.integers(60, 90, (cam_h, cam_w, 3), dtype=np.uint8)
+    center = (
+        cam_w // 2 + int(cam_w * 0.15 * np.sin(frame_idx / 7)),
+        cam_h // 2 + int(cam_h * 0.1 * np.cos(frame_idx / 11)),
+    )
+    cv2.circle(cam, center, cam_h // 3, (150, 180, 220), -1)
+    frame[y0 : y0 + cam_h, x0 : x0 + cam_w] = cam
+
+
+def generate_video(
+    video_path,
+    width=1280,
+    height=720,
+    fps=30,
+    num_slides=8,
+    slide_secs=10,
+    fade_secs=0,
+    bullet_secs=0,
+    webcam=False,
+    seed=0,
+):
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(
+        video_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+    )
+
+    slide_frames = int(slide_secs * fps)
+    fade_frames = int(fade_secs * fps)
+    bullet_frames = int(bullet_secs * fps)
+    num_bullets = 0
+    if bullet_frames:
+        num_bullets = min(5, (slide_frames - fade_frames) // bullet_frames - 1)
+
+    states = []
+    frame_idx = 0
+    prev_image = None
+
+    for index in range(num_slides):
+        slide_states = draw_slide(width, height, index, num_bullets, rng)
+        if not bullet_frames:
+            slide_states = slide_states[-1:]
+
+        for i in range(slide_frames):
+            # Fade from the last image of the previous slide.
+            if prev_image is not None and i < fade_frames:
+                alpha = (i + 1) / (fade_frames + 1)
+                image = cv2.addWeighted(prev_image, 1 - alpha, slide_states[0], alpha, 0)
+                state = None
+            else:
+                state = 0
+                if bullet_frames:
+                    state = min((i - fade_frames) // bullet_frames, len(slide_states) - 1)
+                image = slide_states[state]
+
+            # Record the stable states as frame intervals.
+            if state is not None:
+                last = states[-1] if states else None
+                if last and (last["slide"], last["state"]) == (index, state):
+                    last["end_frame"] = frame_idx + 1
+                else:
+                    states.append(
+                        dict(
+                            slide=index,
+                            state=state,
+                            start_frame=frame_idx,
+                            end_frame=frame_idx + 1,
+                        )
+                    )
+
+            frame = image.copy()
+            if webcam:
+                draw_webcam(frame, frame_idx, rng)
+            writer.write(frame)
+            frame_idx += 1
+
+        prev_image = slide_states[-1]
+
+    writer.release()
+
+    ground_truth = dict(
+        fps=fps,
+        num_frames=frame_idx,
+        width=width,
+        height=height,
+        slides=states,
+    )
+    with open(os.path.splitext(video_path)[0] + ".json", "w") as f:
+        json.dump(ground_truth, f, indent=2)
+
+    return ground_truth
+
+
+def load_or_generate(video_dir, scenario, scale=1.0):
+    # Videos are generated once and reused by later benchmark runs.
+    params = dict(SCENARIOS[scenario])
+    for key in ("slide_secs", "bullet_secs"):
+        if key in params:
+            params[key] *= scale
+    suffix = "" if scale == 1.0 else f"_x{scale:g}"
+    video_path = os.path.join(video_dir, f"{scenario}{suffix}.mp4")
+    gt_path = os.path.splitext(video_path)[0] + ".json"
+
+    if os.path.exists(video_path) and os.path.exists(gt_path):
+        with open(gt_path) as f:
+            return video_path, json.load(f)
+
+    os.makedirs(video_dir, exist_ok=True)
+    print(f"Generating {video_path}...")
+    return video_path, generate_video(video_path, **params)
+
+
+def score_slides(frame_indices, ground_truth):
+    # Each stable state can be matched once, extra captures in it count as duplicates.
+    slides = ground_truth["slides"]
+    starts = np.array([s["start_frame"] for s in slides])
+    matched = set()
+    num_correct = 0
+
+    for frame_idx in frame_indices:
+        i = np.searchsorted(starts, frame_idx, side="right") - 1
+        if i >= 0 and frame_idx < slides[i]["end_frame"] and i not in matched:
+            matched.add(i)
+            num_correct += 1
+
+    precision = num_correct / len(frame_indices) if frame_indices else 0.0
+    recall = len(matched) / len(slides) if slides else 0.0
+
+    return precision, recall
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic lecture videos with ground truth slide timestamps."
+    )
+    parser.add_argument("-o", "--out-dir", default="bench_videos", type=str)
+    parser.add_argument(
+        "--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS)
+    )
+    parser.add_argument(
+        "--scale",
+        default=1.0,
+        type=float,
+        help="Multiply the duration of every slide and bullet",
+    )
+    args = parser.parse_args()
+
+    for scenario in args.scenarios:
+        video_path, ground_truth = load_or_generate(args.out_dir, scenario, args.scale)
+        print(
+            f"{video_path}: {ground_truth['num_frames']} frames, "
+            f"{len(ground_truth['slides'])} slides"
+        )
@@ -1,8 +1,129 @@
+import contextlib
 import cv2
 import os
-import sys
-from tqdm import tqdm
-from utils import resize_image_frame
+from checkpoint import (
+    make_checkpoint,
+    remove_checkpoint,
+    restore_checkpoint,
+    save_checkpoint,
+)
+from config import CHECKPOINT_INTERVAL, RESUME_WARMUP_FRAMES
+from instrumentation import timed
+from motion_signal import MotionSignal
+from pipeline import create_frame_reader, create_image_writer
+from progress import ProgressBar
+from utils import (
+    BufferPool,
+    get_frame_stride,
+    open_video_capture,
+    resize_image_frame,
+    scale_frame_count,
+    seek_video,
+)
+
+BG_RESIZE_WIDTH = 640  # Width of the frames fed to the background subtractor.
+
+
+def create_bg_subtractor(type_bgsub, history, threshold):
+    if type_bgsub == "GMG":
+        return cv2.bgsegm.createBackgroundSubtractorGMG(
+            initializationFrames=history, decisionThreshold=threshold
+        )
+    elif type_bgsub == "KNN":
+        return cv2.createBackgroundSubtractorKNN(
+            history=history, dist2Threshold=threshold, detectShadows=False
+        )
+
+    raise ValueError("Please choose GMG or KNN as background subtraction method")
+
+
+def preprocess_bg_frame(frame, resize_width=BG_RESIZE_WIDTH, roi=None, buffers=None):
+    # Only the ROI is analyzed, at the same scale as the full frame would be.
+    if roi is not None:
+        frame = roi.crop(frame)
+        resize_width = roi.scale_width(resize_width)
+
+    # Resize the frame keeping aspect ratio.
+    return resize_image_frame(frame, resize_width, buffers=buffers)
+
+
+def get_foreground_percent(bg_sub, frame, mask=None, buffers=None):
+    # Apply each frame through the background subtractor.
+    fg_mask = buffers.get("fg_mask", frame.shape[:2]) if buffers is not None else None
+    fg_mask = timed("background_subtraction", bg_sub.apply, frame, fg_mask)
+    if mask is not None:
+        cv2.bitwise_and(fg_mask, mask, dst=fg_mask)
+
+    # Compute the percentage of the Foreground mask, among the pixels of the mask if any.
+    num_non_zero = timed("nonzero_count", cv2.countNonZero, fg_mask)
+    num_pixels = fg_mask.size if mask is None else cv2.countNonZero(mask)
+    return (num_non_zero / (1.0 * max(1, num_pixels))) * 100
+
+
+class BgModelingState:
+    # Capture a frame once motion stops, then wait for motion before capturing again.
+    def __init__(self, MIN_PERCENT_THRESH, MAX_PERCENT_THRESH):
+        self.MIN_PERCENT_THRESH = MIN_PERCENT_THRESH
+        self.MAX_PERCENT_THRESH = MAX_PERCENT_THRESH
+        self.capture_frame = False
+
+    def update(self, p_non_zero):
+        # %age of non-zero pixels < MAX_PERCENT_THRESH, implies motion has stopped.
+        # Therefore, capture the frame.
+        if p_non_zero < self.MAX_PERCENT_THRESH and not self.capture_frame:
+            self.capture_frame = True
+            return True
+
+        # p_non_zero >= MIN_PERCENT_THRESH, indicates motion/animations.
+        # Hence wait till the motion across subsequent frames has settled down.
+        elif self.capture_frame and p_non_zero >= self.MIN_PERCENT_THRESH:
+            self.capture_frame = False
+
+        return False
+
+    def state_dict(self):
+        return dict(capture_frame=self.capture_frame)
+
+    def load_state_dict(self, state):
+        self.capture_frame = state["capture_frame"]
+
+
+def detect_slides_bg_modeling(
+    cap,
+    capture_state,
+    bg_sub,
+    frame_stride=1,
+    roi=None,
+    pipelined=False,
+    frame_idx=-1,
+    end_frame=None,
+    update_start=0,
+):
+    # Background modeling over cap, positioned right after frame frame_idx. Yields
+    # (frame_idx, frame, p_non_zero, captured) for every analyzed frame. The capture
+    # state is only updated from frame update_start on. A frame is only valid until the
+    # next one is yielded, nothing is printed or written.
+
+    # The analysis images are allocated once and reused for every frame.
+    buffers = BufferPool()
+
+    # Decoding runs on its own thread in pipelined mode.
+    with create_frame_reader(cap, frame_stride, pipelined) as reader:
+        while True:
+            ret, frame = reader.read()
+            if not ret:
+                break
+
+            frame_idx += frame_stride
+            if end_frame is not None and frame_idx >= end_frame:
+                break
+
+            # The original frame is left untouched, it is only copied if it is saved.
+            analyzed = preprocess_bg_frame(frame, roi=roi, buffers=buffers)
+            mask = roi.get_mask(analyzed.shape) if roi is not None else None
+            p_non_zero = get_foreground_percent(bg_sub, analyzed, mask, buffers)
+            captured = frame_idx >= update_start and capture_state.update(p_non_zero)
+            yield frame_idx, frame, p_non_zero, captured
 
 
 def capture_slides_bg_modeling(
@@ -13,71 +134,145 @@ def capture_slides_bg_modeling(
     threshold,
     MIN_PERCENT_THRESH,
     MAX_PERCENT_THRESH,
+    analysis_fps=None,
+    frame_stride=1,
+    pipelined=False,
+    start_frame=0,
+    end_frame=None,
+    warmup_frames=0,
+    deduplicator=None,
+    checkpoint_path=None,
+    checkpoint_interval=CHECKPOINT_INTERVAL,
+    resume=False,
+    signal_path=None,
+    pdf_path=None,
+    store=None,
+    roi=None,
 ):
     print(f"Using {type_bgsub} for Background Modeling...")
     print("---" * 10)
 
-    if type_bgsub == "GMG":
-        bg_sub = cv2.bgsegm.createBackgroundSubtractorGMG(
-            initializationFrames=history, decisionThreshold=threshold
-        )
-    elif type_bgsub == "KNN":
-        bg_sub = cv2.createBackgroundSubtractorKNN(
-            history=history, dist2Threshold=threshold, detectShadows=False
-        )
-    else:
-        raise ValueError("Please choose GMG or KNN as background subtraction method")
-
-    capture_frame = False
-    screenshots_count = 0
-
     # Capture video frames.
-    cap = cv2.VideoCapture(video_path)
+    cap = open_video_capture(video_path)
 
     if not cap.isOpened():
-        print("Unable to open video file: ", video_path)
-        sys.exit()
+        cap.release()
+        raise ValueError(f"Unable to open video file: {video_path}")
+
+    # Only every frame_stride-th frame is analyzed, so the background model history
+    # is rescaled to cover the same duration in seconds.
+    frame_stride = get_frame_stride(cap, analysis_fps, frame_stride)
+    history = scale_frame_count(history, frame_stride)
+    if frame_stride > 1:
+        print(f"Analyzing every {frame_stride} frames...")
+
+    bg_sub = create_bg_subtractor(type_bgsub, history, threshold)
+    capture_state = BgModelingState(MIN_PERCENT_THRESH, MAX_PERCENT_THRESH)
+    screenshots_count = 0
+    slides = []
 
+    # Continue after the last checkpoint, the background model is rebuilt
+    # from the frames just before it.
+    restored = None
+    if resume and checkpoint_path is not None:
+        restored = restore_checkpoint(
+            checkpoint_path, video_path, capture_state, deduplicator
+        )
+    if restored is not None:
+        # A whole number of strides keeps the analyzed frames on the same grid as
+        # an uninterrupted run.
+        start_frame = restored["frame_idx"] + 1
+        warmup_frames = max(warmup_frames, RESUME_WARMUP_FRAMES)
+        warmup_frames = -(-warmup_frames // frame_stride) * frame_stride
+        screenshots_count = restored["screenshots_count"]
+        slides = [tuple(slide) for slide in restored["slides"]]
+
+    # Frames before start_frame only warm up the background model, they are never saved.
     num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    prog_bar = tqdm(total=num_frames)
+    seek_frame = seek_video(cap, start_frame, warmup_frames)
+    frame_idx = seek_frame - 1
+    last_checkpoint = frame_idx
 
-    # Loop over subsequent frames.
-    while cap.isOpened():
-        ret, frame = cap.read()
+    # The motion signal can only be replayed if it covers the whole video. The reader
+    # skips frame_stride - 1 frames before every analyzed frame.
+    signal = None
+    if signal_path is not None and start_frame == 0 and end_frame is None:
+        signal = MotionSignal(seek_frame + frame_stride - 1, frame_stride)
+    prog_bar = ProgressBar(total=(end_frame or num_frames) - seek_frame)
 
-        if not ret:
-            break
+    # A restored capture state is already up to date, so the warm-up frames must not
+    # advance it again.
+    frames = detect_slides_bg_modeling(
+        cap,
+        capture_state,
+        bg_sub,
+        frame_stride,
+        roi,
+        pipelined,
+        frame_idx,
+        end_frame,
+        update_start=start_frame if restored is not None else 0,
+    )
 
-        # Create a copy of the original frame.
-        orig_frame = frame.copy()
-        # Resize the frame keeping aspect ratio.
-        frame = resize_image_frame(frame, resize_width=640)
+    # JPEG encoding runs on its own threads in pipelined mode.
+    writer = create_image_writer(pipelined, pdf_path=pdf_path, store=store)
 
-        # Apply each frame through the background subtractor.
-        fg_mask = bg_sub.apply(frame)
+    with contextlib.closing(frames), writer:
+        # The PDF starts over with the slides saved before the checkpoint.
+        for _, out_file_path in slides:
+            writer.add_saved_image(out_file_path)
 
-        # Compute the percentage of the Foreground mask."
-        p_non_zero = (cv2.countNonZero(fg_mask) / (1.0 * fg_mask.size)) * 100
+        for frame_idx, frame, p_non_zero, captured in frames:
+            if signal is not None:
+                signal.append(p_non_zero)
 
-        # %age of non-zero pixels < MAX_PERCENT_THRESH, implies motion has stopped.
-        # Therefore, capture the frame.
-        if p_non_zero < MAX_PERCENT_THRESH and not capture_frame:
-            capture_frame = True
+            # Duplicates are dropped before they are ever encoded.
+            if (
+                captured
+                and frame_idx >= start_frame
+                and (deduplicator is None or not deduplicator.is_duplicate_frame(frame))
+            ):
+                screenshots_count += 1
 
-            screenshots_count += 1
+                png_filename = f"{screenshots_count:03}.jpg"
+                out_file_path = os.path.join(output_dir_path, png_filename)
+                writer.write(out_file_path, frame, frame_idx)
+                slides.append((frame_idx, out_file_path))
+                prog_bar.set_postfix_str(f"Total Screenshots: {screenshots_count}")
 
-            png_filename = f"{screenshots_count:03}.jpg"
-            out_file_path = os.path.join(output_dir_path, png_filename)
-            cv2.imwrite(out_file_path, orig_frame, [cv2.IMWRITE_JPEG_QUALITY, 75])
-            prog_bar.set_postfix_str(f"Total Screenshots: {screenshots_count}")
+            prog_bar.update(frame_stride)
 
-        # p_non_zero >= MIN_PERCENT_THRESH, indicates motion/animations.
-        # Hence wait till the motion across subsequent frames has settled down.
-        elif capture_frame and p_non_zero >= MIN_PERCENT_THRESH:
-            capture_frame = False
-        
-        prog_bar.update(1)
+            if (
+                checkpoint_path is not None
+                and frame_idx - last_checkpoint >= checkpoint_interval
+            ):
+                # Only record slides that are already on disk.
+                writer.flush()
+                save_checkpoint(
+                    checkpoint_path,
+                    make_checkpoint(
+                        video_path,
+                        frame_idx,
+                        screenshots_count,
+                        slides,
+                        capture_state,
+                        deduplicator,
+                    ),
+                )
+                last_checkpoint = frame_idx
 
     # Release progress bar and video capture object.
     prog_bar.close()
     cap.release()
+
+    if signal is not None:
+        signal.save(signal_path, "bg_modeling")
+
+    # The run is complete, there is nothing left to resume.
+    if checkpoint_path is not None:
+        remove_checkpoint(checkpoint_path)
+
+    if deduplicator is not None:
+        print("Duplicate frames skipped:", deduplicator.num_duplicates)
+
+    return slides
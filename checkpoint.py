@@ -0,0 +1,80 @@
+import json
+import os
+from imutils import paths
+
+# Checkpoints record how far a capture engine got through a video, the state of its
+# capture state machine, the duplicate hash history and the slides already saved,
+# so that a crashed or pre-empted run can resume close to where it stopped.
+
+
+def get_checkpoint_path(output_dir_path):
+    return os.path.join(output_dir_path, ".checkpoint.json")
+
+
+def save_checkpoint(checkpoint_path, state):
+    # Write to a temporary file first, so a crash never leaves a truncated checkpoint.
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return
+
+    try:
+        with open(checkpoint_path) as f:
+            return json.load(f)
+    except ValueError:
+        print("Ignoring corrupted checkpoint:", checkpoint_path)
+        return
+
+
+def remove_checkpoint(checkpoint_path):
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+def has_checkpoint(checkpoint_path, video_path):
+    state = load_checkpoint(checkpoint_path)
+    return state is not None and state["video_path"] == video_path
+
+
+def restore_checkpoint(checkpoint_path, video_path, capture_state, deduplicator=None):
+    state = load_checkpoint(checkpoint_path)
+
+    if state is None or state["video_path"] != video_path:
+        print("No checkpoint found, starting from the beginning...")
+        return
+
+    capture_state.load_state_dict(state["capture_state"])
+    if deduplicator is not None and "deduplicator" in state:
+        deduplicator.load_state_dict(state["deduplicator"])
+
+    # Slides saved after the last checkpoint are captured again.
+    saved_files = {os.path.abspath(file_path) for _, file_path in state["slides"]}
+    output_dir_path = os.path.dirname(checkpoint_path)
+    for image_path in paths.list_images(output_dir_path):
+        if os.path.abspath(image_path) not in saved_files:
+            os.remove(image_path)
+
+    print(f"Resuming from frame {state['frame_idx']}...")
+
+    return state
+
+
+def make_checkpoint(
+    video_path, frame_idx, screenshots_count, slides, capture_state, deduplicator=None
+):
+    state = dict(
+        video_path=video_path,
+        frame_idx=frame_idx,
+        screenshots_count=screenshots_count,
+        slides=slides,
+        capture_state=capture_state.state_dict(),
+    )
+    if deduplicator is not None:
+        state["deduplicator"] = deduplicator.state_dict()
+
+    return state
@@ -3,6 +3,29 @@ import imagehash
 # -------------- Initializations ---------------------
 
 DOWNLOAD_DIR = "downloads"
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # Size of the chunks streamed to disk while downloading.
+DOWNLOAD_TIMEOUT = 30  # Seconds to wait for the server before giving up.
+DOWNLOAD_CONNECTIONS = 4  # Number of concurrent byte range requests, 1 to download in a single stream.
+DOWNLOAD_PART_SIZE = 16 << 20  # Size of each byte range requested in parallel.
+DOWNLOAD_RETRIES = 3  # Number of attempts for each byte range.
+
+CACHE_DIR = "cache"  # Directory of the result cache.
+CACHE_MAX_SIZE_MB = 2048  # Least recently used results are evicted above this size.
+
+METRICS_PORT = 0  # Port of the Prometheus metrics endpoint served next to the Gradio app, 0 to disable.
+
+JOB_DB_PATH = "jobs.db"  # SQLite store of the Gradio app jobs.
+JOB_WORKERS = 2  # Number of worker processes running the Gradio app jobs.
+MAX_QUEUED_JOBS = 32  # New jobs are rejected while this many jobs are waiting for a worker.
+JOB_PROGRESS_INTERVAL = 1.0  # Seconds between progress updates and cancellation checks of a running job.
+
+WORKSPACE_ROOT = "workspaces"  # Directory of the per-job workspaces of the Gradio app.
+WORKSPACE_MAX_SIZE_MB = 10240  # Finished workspaces are evicted above this size, new jobs are rejected while running jobs use more.
+WORKSPACE_TTL = 3600  # Seconds the result of a finished job is kept.
+WORKSPACE_GC_INTERVAL = 60  # Seconds between two garbage collection passes over the workspaces.
+
+BATCH_WORKERS = 2  # Number of videos converted at the same time in batch mode.
+BATCH_OPENCV_THREADS = 0  # OpenCV threads per batch worker, 0 to split the CPU cores evenly between workers.
 
 FRAME_BUFFER_HISTORY = 15  # Length of the frame buffer history to model background.
 DEC_THRESH = (
@@ -17,6 +40,40 @@ MAX_PERCENT = (
     0.01  # %age threshold to determine if the motion across frames has stopped.
 )
 
+FRAME_DIFF_MIN_PERCENT = 0.06  # %age threshold of changed pixels between frames to detect motion with frame differencing.
+FRAME_DIFF_ELAPSED_FRAMES = 85  # Number of frames frame differencing waits after motion starts before capturing the slide.
+
+ANALYSIS_FPS = 0  # Number of frames per second to analyze, 0 to analyze every frame.
+
+FRAME_DIFF_RESIZE_WIDTH = 0  # Width of the frames analyzed by frame differencing, 0 to analyze at full resolution.
+
+PIPELINE_QUEUE_SIZE = 16  # Maximum number of frames buffered between pipeline stages.
+PIPELINE_WRITERS = 2  # Number of threads used to encode slide images in pipelined mode.
+
+SLIDE_IMAGE_QUALITY = 75  # JPEG and WebP quality of the saved slides.
+SLIDE_STORE_FORMAT = "jpg"  # Image format of the slides in a slide store: jpg, webp or png.
+
+SEGMENT_WARMUP_FRAMES = 180  # Number of frames processed before each segment to prime the detector state.
+CHECKPOINT_INTERVAL = 3000  # Number of video frames between two checkpoints.
+RESUME_WARMUP_FRAMES = 180  # Number of frames before a checkpoint replayed to rebuild the background model.
+REPLAY_SEEK_FRAMES = 30  # Frames further apart than this are reached by seeking instead of grabbing when replaying.
+
+COARSE_ANALYSIS_FPS = 2  # Number of frames per second scanned by the coarse pass of two-pass detection.
+COARSE_RESIZE_WIDTH = 160  # Width of the frames scanned by the coarse pass.
+COARSE_MARGIN_FRAMES = 60  # Number of frames added around each window refined at full rate.
+
+PACKET_SIZE_RATIO = 4  # Inter frames this many times bigger than the median one are treated as slide changes.
+KEYFRAME_GROUP_FRAMES = 15  # Changes closer than this number of frames belong to the same transition.
+KEYFRAME_SETTLE_FRAMES = 15  # Number of frames waited after a transition before capturing the slide.
+
+ENSEMBLE_DETECTORS = "Frame_Diff,GMG,KNN"  # Detectors run together on a single decode by --type Ensemble.
+ENSEMBLE_VOTE_WINDOW = 3  # Number of seconds within which the detectors' captures count as votes for the same slide.
+
+ROI_AUTO_SAMPLES = 20  # Number of frame pairs compared by --auto-roi to find the regions that keep moving.
+ROI_AUTO_GAP_SECS = 1  # Number of seconds between the two frames of each pair.
+ROI_AUTO_CHANGE_RATIO = 0.5  # Pixels changing in at least this fraction of the pairs are ignored.
+ROI_AUTO_WIDTH = 320  # Width of the frames compared by --auto-roi.
+
 # Post processing
 
 SIM_THRESHOLD = (
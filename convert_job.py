@@ -0,0 +1,236 @@
+import os
+import shutil
+from config import *
+from download_video import download_video
+from bg_modeling import capture_slides_bg_modeling
+from frame_differencing import capture_slides_frame_diff
+from keyframe_scan import capture_slides_keyframes
+from motion_signal import load_motion_signal
+from post_process import SlideDeduplicator
+from replay import replay_slides
+from result_cache import ResultCache, make_cache_key
+from workspace import INPUT_DIR, RESULT_DIR, SLIDES_DIR, WorkspaceManager
+
+# The conversion run by the Gradio app jobs, in the job worker processes.
+
+result_cache = None
+
+
+def get_result_cache():
+    # Created on first use, so importing the module doesn't create the cache directory.
+    global result_cache
+    if result_cache is None:
+        result_cache = ResultCache()
+
+    return result_cache
+
+
+def get_thresholds(
+    bg_type, diff_min_percent, diff_elapsed_frames, min_percent, max_percent
+):
+    # Detection thresholds of the capture state machine, the only parameters a replay of
+    # the motion signal can change.
+    if bg_type.lower() in ("frame diff", "keyframe"):
+        return dict(
+            MIN_PERCENT_THRESH=diff_min_percent, ELAPSED_FRAME_THRESH=diff_elapsed_frames
+        )
+
+    return dict(MIN_PERCENT_THRESH=min_percent, MAX_PERCENT_THRESH=max_percent)
+
+
+def extract_slides(
+    video_path,
+    output_dir_path,
+    pdf_path,
+    bg_type,
+    frame_buffer_history,
+    analysis_fps,
+    hash_size,
+    hash_func,
+    hash_queue_len,
+    global_dedup,
+    sim_threshold,
+    thresholds,
+    signal_path=None,
+):
+    # Remove duplicate slides with difference hashing while capturing,
+    # so duplicates are never written to disk and the PDF is written as slides come.
+    hash_func = HASH_FUNC_DICT.get(hash_func.lower())
+
+    diff_threshold = int(hash_size * hash_size * (100 - sim_threshold) / 100)
+    deduplicator = SlideDeduplicator(
+        hash_size, hash_func, hash_queue_len, diff_threshold, global_dedup
+    )
+
+    # Changing only the deduplication settings replays the motion signal saved
+    # by a previous run on the same video instead of analyzing it again.
+    signal, signal_meta = load_motion_signal(signal_path) if signal_path else (None, None)
+
+    if signal is not None:
+        replay_slides(
+            video_path,
+            output_dir_path,
+            signal,
+            signal_meta,
+            deduplicator=deduplicator,
+            pdf_path=pdf_path,
+            **thresholds,
+        )
+    elif bg_type.lower() == "frame diff":
+        capture_slides_frame_diff(
+            video_path,
+            output_dir_path,
+            analysis_fps=analysis_fps,
+            resize_width=FRAME_DIFF_RESIZE_WIDTH,
+            deduplicator=deduplicator,
+            signal_path=signal_path,
+            pdf_path=pdf_path,
+            **thresholds,
+        )
+    elif bg_type.lower() == "keyframe":
+        capture_slides_keyframes(
+            video_path,
+            output_dir_path,
+            analysis_fps=analysis_fps,
+            resize_width=FRAME_DIFF_RESIZE_WIDTH,
+            deduplicator=deduplicator,
+            signal_path=signal_path,
+            pdf_path=pdf_path,
+            **thresholds,
+        )
+    else:
+        if bg_type.lower() == "gmg":
+            thresh = DEC_THRESH
+        elif bg_type.lower() == "knn":
+            thresh = DIST_THRESH
+
+        capture_slides_bg_modeling(
+            video_path,
+            output_dir_path,
+            type_bgsub=bg_type,
+            history=frame_buffer_history,
+            threshold=thresh,
+            analysis_fps=analysis_fps,
+            deduplicator=deduplicator,
+            signal_path=signal_path,
+            pdf_path=pdf_path,
+            **thresholds,
+        )
+
+    return pdf_path
+
+
+def process(
+    video_path,
+    workspace_path,
+    bg_type,
+    frame_buffer_history,
+    analysis_fps,
+    hash_size,
+    hash_func,
+    hash_queue_len,
+    global_dedup,
+    sim_threshold,
+    diff_min_percent=FRAME_DIFF_MIN_PERCENT,
+    diff_elapsed_frames=FRAME_DIFF_ELAPSED_FRAMES,
+    min_percent=MIN_PERCENT,
+    max_percent=MAX_PERCENT,
+):
+    # Slide images are only needed to build the PDF, the result directory holds the PDF
+    # alone, which is what the cache stores.
+    output_dir_path = os.path.join(workspace_path, SLIDES_DIR)
+    result_dir_path = os.path.join(workspace_path, RESULT_DIR)
+    pdf_path = os.path.join(result_dir_path, bg_type + ".pdf")
+    thresholds = get_thresholds(
+        bg_type, diff_min_percent, diff_elapsed_frames, min_percent, max_percent
+    )
+
+    params = dict(
+        type=bg_type,
+        frame_buffer_history=frame_buffer_history,
+        analysis_fps=analysis_fps,
+        hash_size=hash_size,
+        hash_func=hash_func,
+        hash_queue_len=hash_queue_len,
+        global_dedup=global_dedup,
+        sim_threshold=sim_threshold,
+        resize_width=FRAME_DIFF_RESIZE_WIDTH,
+        dec_thresh=DEC_THRESH,
+        dist_thresh=DIST_THRESH,
+        **thresholds,
+    )
+    cache_key = make_cache_key(video_path, params)
+
+    signal_params = dict(
+        type=bg_type,
+        frame_buffer_history=frame_buffer_history,
+        analysis_fps=analysis_fps,
+        resize_width=FRAME_DIFF_RESIZE_WIDTH,
+        dec_thresh=DEC_THRESH,
+        dist_thresh=DIST_THRESH,
+    )
+    result_cache = get_result_cache()
+    signal_path = result_cache.get_signal_path(make_cache_key(video_path, signal_params))
+
+    # Popular videos are served from the result cache without being processed again.
+    if not result_cache.get(cache_key, result_dir_path):
+        pdf_path = extract_slides(
+            video_path,
+            output_dir_path,
+            pdf_path,
+            bg_type,
+            frame_buffer_history,
+            analysis_fps,
+            hash_size,
+            hash_func,
+            hash_queue_len,
+            global_dedup,
+            sim_threshold,
+            thresholds,
+            signal_path,
+        )
+        result_cache.put(cache_key, result_dir_path)
+
+    return pdf_path
+
+
+def get_input_video(video_path, url, input_dir_path, job):
+    if url is not None:
+        job.set_stage("Downloading video")
+        video_path = download_video(url, input_dir_path)
+        if video_path is None:
+            raise ValueError(
+                "An error occurred while downloading the video, please try again later"
+            )
+
+        return video_path
+
+    # Uploads are moved into the workspace. A job run again after a restart
+    # finds its upload there already.
+    input_path = os.path.join(input_dir_path, os.path.basename(video_path))
+    if not os.path.exists(input_path):
+        shutil.move(video_path, input_path)
+
+    return input_path
+
+
+def convert_video_job(params, job):
+    # params holds either the path of an uploaded video or a video url,
+    # the workspace root and the parameters of process().
+    params = dict(params)
+    workspaces = WorkspaceManager(params.pop("workspace_root", WORKSPACE_ROOT))
+    workspace_path = workspaces.create(job.job_id)
+
+    # The workspace is cleaned up by the garbage collector once the job is over.
+    try:
+        video_path = get_input_video(
+            params.pop("video_path", None),
+            params.pop("url", None),
+            os.path.join(workspace_path, INPUT_DIR),
+            job,
+        )
+
+        job.set_stage("Extracting slides")
+        return dict(pdf_path=process(video_path, workspace_path, **params))
+    finally:
+        workspaces.finish(job.job_id)
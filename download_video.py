@@ -1,21 +1,225 @@
+import hashlib
+import json
 import mimetypes
 import re
 import tempfile
+import threading
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 from pytube import YouTube
-from config import DOWNLOAD_DIR
+from config import (
+    DOWNLOAD_DIR,
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_CONNECTIONS,
+    DOWNLOAD_PART_SIZE,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_TIMEOUT,
+)
+from instrumentation import count, timed
+from streaming import StreamingDownload
 
 
-def download_video_from_url(url, output_dir=DOWNLOAD_DIR):
+class DownloadManifest:
+    # Records the progress of every byte range next to the partial file,
+    # so an interrupted download resumes instead of starting again.
+    def __init__(self, manifest_path, url, size, parts):
+        self.manifest_path = manifest_path
+        self.url = url
+        self.size = size
+        self.parts = parts
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, manifest_path, url, size):
+        try:
+            with open(manifest_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("url") != url or data.get("size") != size:
+            return None
+        return cls(manifest_path, url, size, data["parts"])
+
+    def save(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"url": self.url, "size": self.size, "parts": self.parts}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def update(self, part, num_bytes):
+        with self.lock:
+            part["done"] += num_bytes
+            self.save()
+
+
+def create_session(num_connections):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=num_connections
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def get_range_info(session, url):
+    # Return the content length and type if the server accepts byte ranges.
+    response = session.head(url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+    if response.status_code != 200:
+        return
+    if response.headers.get("accept-ranges", "").lower() != "bytes":
+        return
+
+    size = int(response.headers.get("content-length", 0))
+    if size <= 0:
+        return
+    return size, response.headers.get("content-type", "")
+
+
+def get_range_start(response):
+    # First byte of a partial response, None if Content-Range is missing or malformed.
+    match = re.match(r"bytes (\d+)-\d+/", response.headers.get("content-range", ""))
+    if match is None:
+        return
+    return int(match.group(1))
+
+
+def download_part(session, url, file_path, part, manifest):
+    end = part["end"]
+
+    for attempt in range(DOWNLOAD_RETRIES):
+        offset = part["start"] + part["done"]
+        if offset > end:
+            return
+
+        try:
+            with session.get(
+                url,
+                headers={"Range": f"bytes={offset}-{end}"},
+                stream=True,
+                timeout=DOWNLOAD_TIMEOUT,
+            ) as response:
+                if response.status_code != 206:
+                    raise requests.exceptions.RequestException(
+                        f"Expected a partial response, got {response.status_code}"
+                    )
+                # A server answering with other bytes than requested would corrupt the file.
+                if get_range_start(response) != offset:
+                    raise requests.exceptions.RequestException(
+                        f"Expected bytes from {offset}, got {response.headers.get('content-range')}"
+                    )
+
+                with open(file_path, "r+b") as file:
+                    file.seek(offset)
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        # Never write past the end of the part, into the next one.
+                        chunk = chunk[: end + 1 - part["start"] - part["done"]]
+                        if not chunk:
+                            break
+                        file.write(chunk)
+                        file.flush()
+                        manifest.update(part, len(chunk))
+                        count("download_bytes", len(chunk))
+        except requests.exceptions.RequestException:
+            # Retry from the last byte written, unless this was the last attempt.
+            if attempt == DOWNLOAD_RETRIES - 1:
+                raise
+
+    if part["start"] + part["done"] != end + 1:
+        raise requests.exceptions.RequestException(
+            f"Incomplete byte range {part['start']}-{end}"
+        )
+
+
+def download_video_ranged(session, url, output_dir, size, content_type, num_connections):
+    if "video" not in content_type:
+        print("The given URL is not a valid video URL")
+        return
+    file_extension = mimetypes.guess_extension(content_type) or ""
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # The file name is derived from the url, so running again finds the partial file,
+    # or the complete one. The download is renamed once every byte range is received.
+    url_hash = hashlib.sha1(url.encode()).hexdigest()[:16]
+    file_path = os.path.join(output_dir, url_hash + file_extension)
+    part_path = file_path + ".part"
+    manifest_path = file_path + ".parts.json"
+
+    if os.path.exists(file_path) and os.path.getsize(file_path) == size:
+        print("Reusing the downloaded video...")
+        return file_path
+
+    manifest = None
+    if os.path.exists(part_path):
+        manifest = DownloadManifest.load(manifest_path, url, size)
+
+    if manifest is not None:
+        print("Resuming partial download...")
+    else:
+        parts = [
+            {"start": start, "end": min(start + DOWNLOAD_PART_SIZE, size) - 1, "done": 0}
+            for start in range(0, size, DOWNLOAD_PART_SIZE)
+        ]
+        manifest = DownloadManifest(manifest_path, url, size, parts)
+
+        with open(part_path, "wb") as file:
+            file.truncate(size)
+        manifest.save()
+
+    print(f"Downloading {len(manifest.parts)} byte ranges over {num_connections} connections...")
+    with ThreadPoolExecutor(max_workers=num_connections) as executor:
+        futures = [
+            executor.submit(download_part, session, url, part_path, part, manifest)
+            for part in manifest.parts
+        ]
+        for future in futures:
+            future.result()
+
+    # Verify that every byte range was received before dropping the manifest.
+    for part in manifest.parts:
+        if part["start"] + part["done"] != part["end"] + 1:
+            raise requests.exceptions.RequestException(
+                f"Incomplete byte range {part['start']}-{part['end']}"
+            )
+    os.replace(part_path, file_path)
+    os.remove(manifest_path)
+
+    return file_path
+
+
+def download_video_from_url(
+    url, output_dir=DOWNLOAD_DIR, progressive=False, num_connections=1
+):
     try:
-        response = requests.get(url)
+        # Progressive reads need the file written in order, so they use a single stream.
+        if num_connections > 1 and not progressive:
+            with create_session(num_connections) as session:
+                range_info = get_range_info(session, url)
+                if range_info is not None:
+                    return timed(
+                        "download",
+                        download_video_ranged,
+                        session,
+                        url,
+                        output_dir,
+                        *range_info,
+                        num_connections,
+                    )
+            print("The server doesn't support range requests, using a single stream...")
+
+        # Stream the response so the video is never fully buffered in memory.
+        response = requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
         response.raise_for_status()  # Check if the request was successful
 
         content_type = response.headers.get("content-type")
         if "video" not in content_type:
             print("The given URL is not a valid video URL")
+            response.close()
             return
         file_extension = mimetypes.guess_extension(content_type)
 
@@ -25,9 +229,22 @@ def download_video_from_url(url, output_dir=DOWNLOAD_DIR):
             delete=False, suffix=file_extension, dir=output_dir
         )
         temp_file_path = temp_file.name
+        temp_file.close()
 
-        with open(temp_file_path, "wb") as file:
-            file.write(response.content)
+        def write_chunks():
+            with response, open(temp_file_path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    file.write(chunk)
+                    # Make the bytes visible to a capture reading the partial file.
+                    file.flush()
+                    count("download_bytes", len(chunk))
+                    yield len(chunk)
+
+        if progressive:
+            # Return right away, the capture engines read the file while it downloads.
+            StreamingDownload(temp_file_path).start(write_chunks)
+        else:
+            timed("download", lambda: sum(write_chunks()))
         return temp_file_path
 
     except requests.exceptions.RequestException as e:
@@ -47,7 +264,8 @@ def download_video_from_youtube(url, output_dir=DOWNLOAD_DIR):
 
         os.makedirs(output_dir, exist_ok=True)
 
-        video_path = video.download(output_dir)
+        video_path = timed("download", video.download, output_dir)
+        count("download_bytes", os.path.getsize(video_path))
         return video_path
 
     except Exception as e:
@@ -55,7 +273,12 @@ def download_video_from_youtube(url, output_dir=DOWNLOAD_DIR):
         return
 
 
-def download_video(url, output_dir=DOWNLOAD_DIR):
+def download_video(
+    url,
+    output_dir=DOWNLOAD_DIR,
+    progressive=False,
+    num_connections=DOWNLOAD_CONNECTIONS,
+):
     parsed_url = urlparse(url)
     domain = parsed_url.netloc.lower()
     domain = re.sub(r"\.", "", domain) # Match for both youtube and youtu.be
@@ -65,7 +288,9 @@ def download_video(url, output_dir=DOWNLOAD_DIR):
     if "youtube" in domain:
         video_path = download_video_from_youtube(url, output_dir)
     else:
-        video_path = download_video_from_url(url, output_dir)
+        video_path = download_video_from_url(
+            url, output_dir, progressive, num_connections
+        )
 
     if video_path:
         print(f"Saving file at: {video_path}")
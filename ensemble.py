@@ -0,0 +1,324 @@
+import contextlib
+import cv2
+import json
+import os
+from bg_modeling import (
+    BG_RESIZE_WIDTH,
+    BgModelingState,
+    create_bg_subtractor,
+    get_foreground_percent,
+    preprocess_bg_frame,
+)
+from config import *
+from frame_differencing import (
+    FrameDiffState,
+    get_diff_percent,
+    get_kernel_size,
+    preprocess_frame,
+)
+from instrumentation import timed
+from pipeline import create_image_writer
+from progress import ProgressBar
+from utils import get_frame_stride, open_video_capture, read_frame, scale_frame_count
+
+# Runs several detectors over a single decode of the video. Every analyzed frame is
+# decoded once and handed to every detector, the downscaled and grayscale versions of
+# the frame are computed once per frame whichever detectors ask for them. Each detector
+# makes the same decisions as its own engine, and its slides can be saved separately
+# or merged: a merged slide is captured once enough detectors agree on it.
+#
+# With a frame stride, all detectors analyze the frames capture_slides_bg_modeling
+# does: stride - 1, 2 * stride - 1... capture_slides_frame_diff analyzes frames 0,
+# stride, 2 * stride... instead, so the Frame_Diff slides of an ensemble are found
+# stride - 1 frames later than by the engine alone.
+
+VOTE_DIR = "Ensemble"
+
+
+class FrameBuffers:
+    # The preprocessed versions of the current frame, shared by the detectors.
+    def __init__(self, frame, roi=None):
+        self.frame = frame
+        self.roi = roi
+        self.cache = {}
+
+    def get(self, key, func, *args):
+        if key not in self.cache:
+            self.cache[key] = func(*args)
+
+        return self.cache[key]
+
+    def bg(self):
+        return self.get(("bg",), preprocess_bg_frame, self.frame, BG_RESIZE_WIDTH, self.roi)
+
+    def gray(self, resize_width=None):
+        return self.get(
+            ("gray", resize_width), preprocess_frame, self.frame, resize_width, self.roi
+        )
+
+    def get_mask(self, frame):
+        return self.roi.get_mask(frame.shape) if self.roi is not None else None
+
+    def hash(self, deduplicator):
+        key = ("hash", deduplicator.hash_size, deduplicator.hashfunc)
+        return self.get(key, deduplicator.hash_frame, self.frame)
+
+
+class FrameDiffDetector:
+    # Same decisions as capture_slides_frame_diff, on the frames of the ensemble.
+    def __init__(
+        self,
+        frame_width,
+        frame_stride=1,
+        MIN_PERCENT_THRESH=FRAME_DIFF_MIN_PERCENT,
+        ELAPSED_FRAME_THRESH=FRAME_DIFF_ELAPSED_FRAMES,
+        resize_width=None,
+        roi=None,
+    ):
+        # Only the ROI is analyzed, at the same scale as the full frame would be.
+        if roi is not None:
+            frame_width = roi.width
+            resize_width = roi.scale_width(resize_width)
+
+        self.name = "Frame_Diff"
+        self.resize_width = resize_width
+        self.capture_state = FrameDiffState(
+            MIN_PERCENT_THRESH, scale_frame_count(ELAPSED_FRAME_THRESH, frame_stride)
+        )
+        kernel_size = get_kernel_size(frame_width, resize_width)
+        self.kernel = cv2.getStructuringElement(
+            cv2.MORPH_ELLIPSE, (kernel_size, kernel_size)
+        )
+        self.prev_frame = None
+
+    def update(self, buffers):
+        curr_frame = buffers.gray(self.resize_width)
+        prev_frame, self.prev_frame = self.prev_frame, curr_frame
+
+        # The 1st frame is always a slide.
+        if prev_frame is None:
+            return True
+
+        return self.capture_state.update(
+            get_diff_percent(
+                curr_frame, prev_frame, self.kernel, buffers.get_mask(curr_frame)
+            )
+        )
+
+
+class BgModelingDetector:
+    # Same decisions as capture_slides_bg_modeling.
+    def __init__(
+        self,
+        type_bgsub,
+        frame_stride=1,
+        history=FRAME_BUFFER_HISTORY,
+        threshold=None,
+        MIN_PERCENT_THRESH=MIN_PERCENT,
+        MAX_PERCENT_THRESH=MAX_PERCENT,
+    ):
+        if threshold is None:
+            threshold = DEC_THRESH if type_bgsub == "GMG" else DIST_THRESH
+
+        self.name = type_bgsub
+        self.bg_sub = create_bg_subtractor(
+            type_bgsub, scale_frame_count(history, frame_stride), threshold
+        )
+        self.capture_state = BgModelingState(MIN_PERCENT_THRESH, MAX_PERCENT_THRESH)
+
+    def update(self, buffers):
+        frame = buffers.bg()
+        return self.capture_state.update(
+            get_foreground_percent(self.bg_sub, frame, buffers.get_mask(frame))
+        )
+
+
+def create_detector(
+    type_bgsub,
+    frame_width,
+    frame_stride=1,
+    resize_width=None,
+    roi=None,
+    thresholds=None,
+):
+    # thresholds are the keyword arguments of the detector's capture state machine.
+    thresholds = thresholds or {}
+    if type_bgsub == "Frame_Diff":
+        return FrameDiffDetector(
+            frame_width, frame_stride, resize_width=resize_width, roi=roi, **thresholds
+        )
+    elif type_bgsub in ("GMG", "KNN"):
+        return BgModelingDetector(type_bgsub, frame_stride, **thresholds)
+
+    raise ValueError(f"{type_bgsub} can't be run in an ensemble, use Frame_Diff, GMG or KNN")
+
+
+class SlideVote:
+    # Captures from different detectors within window frames count as votes for the same
+    # slide, which is captured when the min_votes-th detector captures it.
+    def __init__(self, min_votes, window):
+        self.min_votes = min_votes
+        self.window = window
+        self.candidates = []
+
+    def update(self, frame_idx, names):
+        self.candidates = [
+            candidate
+            for candidate in self.candidates
+            if frame_idx - candidate["frame_idx"] <= self.window
+        ]
+
+        captured = False
+        for name in names:
+            # A detector votes for the oldest slide it hasn't voted for yet.
+            candidate = next(
+                (c for c in self.candidates if name not in c["votes"]), None
+            )
+            if candidate is None:
+                candidate = dict(frame_idx=frame_idx, votes=set(), captured=False)
+                self.candidates.append(candidate)
+
+            candidate["votes"].add(name)
+            if not candidate["captured"] and len(candidate["votes"]) >= self.min_votes:
+                candidate["captured"] = True
+                captured = True
+
+        return captured
+
+
+def capture_slides_ensemble(
+    video_path,
+    output_dir_paths,
+    analysis_fps=None,
+    frame_stride=1,
+    pipelined=False,
+    resize_width=None,
+    min_votes=None,
+    vote_window=ENSEMBLE_VOTE_WINDOW,
+    deduplicators=None,
+    pdf_paths=None,
+    stores=None,
+    report_path=None,
+    roi=None,
+    thresholds=None,
+):
+    # output_dir_paths maps each detector, and VOTE_DIR to merge their slides by vote,
+    # to its output directory. deduplicators, pdf_paths, stores and thresholds are
+    # keyed the same way. Returns the slides of each of them.
+    deduplicators = deduplicators or {}
+    pdf_paths = pdf_paths or {}
+    stores = stores or {}
+    thresholds = thresholds or {}
+
+    cap = open_video_capture(video_path)
+
+    if not cap.isOpened():
+        cap.release()
+        raise ValueError(f"Unable to open video file: {video_path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_stride = get_frame_stride(cap, analysis_fps, frame_stride)
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    detectors = [
+        create_detector(
+            name, frame_width, frame_stride, resize_width, roi, thresholds.get(name)
+        )
+        for name in output_dir_paths
+        if name != VOTE_DIR
+    ]
+
+    # A majority of the detectors has to agree by default.
+    vote = None
+    if VOTE_DIR in output_dir_paths:
+        min_votes = min_votes or len(detectors) // 2 + 1
+        vote = SlideVote(min_votes, round(vote_window * fps) if fps > 0 else 1)
+
+    writers = {
+        name: create_image_writer(
+            pipelined, pdf_path=pdf_paths.get(name), store=stores.get(name)
+        )
+        for name in output_dir_paths
+    }
+    slides = {name: [] for name in output_dir_paths}
+
+    print("Using", ", ".join(detector.name for detector in detectors), "on a single decode...")
+    if frame_stride > 1:
+        print(f"Analyzing every {frame_stride} frames...")
+    if vote is not None:
+        print(f"Capturing slides found by at least {min_votes} detectors...")
+    print("---" * 10)
+
+    def save(name, frame_idx, buffers):
+        deduplicator = deduplicators.get(name)
+        if deduplicator is not None and deduplicator.is_duplicate_hash(
+            buffers.hash(deduplicator)
+        ):
+            return
+
+        filename = f"{len(slides[name]) + 1:03}.jpg"
+        out_file_path = os.path.join(output_dir_paths[name], filename)
+        writers[name].write(out_file_path, buffers.frame, frame_idx)
+        slides[name].append((frame_idx, out_file_path))
+
+    num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    prog_bar = ProgressBar(total=num_frames)
+    frame_idx = -1
+    # Every frame is decoded into the same buffer, the saved ones are copied by the
+    # pipelined writers.
+    frame = None
+
+    with contextlib.ExitStack() as stack:
+        for writer in writers.values():
+            stack.enter_context(writer)
+
+        while True:
+            ret, decoded = read_frame(cap, frame_stride, frame)
+            if not ret:
+                break
+            frame = decoded
+            frame_idx += frame_stride
+
+            buffers = FrameBuffers(frame, roi)
+            captured = [d.name for d in detectors if d.update(buffers)]
+            for name in captured:
+                save(name, frame_idx, buffers)
+
+            if vote is not None and vote.update(frame_idx, captured):
+                save(VOTE_DIR, frame_idx, buffers)
+
+            if captured:
+                counts = ", ".join(f"{name}: {len(slides[name])}" for name in slides)
+                prog_bar.set_postfix_str(f"Total Screenshots: {counts}")
+            prog_bar.update(frame_stride)
+
+    prog_bar.close()
+    cap.release()
+
+    for name, detector_slides in slides.items():
+        print(f"{name}: {len(detector_slides)} slides saved to {output_dir_paths[name]}")
+
+    if report_path is not None:
+        save_ensemble_report(report_path, slides, fps)
+
+    return slides
+
+
+def save_ensemble_report(report_path, slides, fps):
+    # Frame index and time of every slide captured by each detector, to compare them.
+    # Duplicates removed by post-processing afterwards are still listed.
+    report = {
+        name: [
+            dict(
+                frame_idx=frame_idx,
+                timestamp=round(frame_idx / fps, 3) if fps > 0 else None,
+                image=os.path.basename(out_file_path),
+            )
+            for frame_idx, out_file_path in detector_slides
+        ]
+        for name, detector_slides in slides.items()
+    }
+
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    return report
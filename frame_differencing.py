@@ -1,91 +1,320 @@
+import contextlib
 import cv2
 import os
-import sys
-from tqdm import tqdm
+from checkpoint import (
+    make_checkpoint,
+    remove_checkpoint,
+    restore_checkpoint,
+    save_checkpoint,
+)
+from config import (
+    CHECKPOINT_INTERVAL,
+    FRAME_DIFF_ELAPSED_FRAMES,
+    FRAME_DIFF_MIN_PERCENT,
+)
+from instrumentation import timed
+from motion_signal import MotionSignal
+from pipeline import create_frame_reader, create_image_writer
+from progress import ProgressBar
+from utils import (
+    BufferPool,
+    get_frame_stride,
+    open_video_capture,
+    resize_image_frame,
+    scale_frame_count,
+    seek_video,
+)
 
 
-def capture_slides_frame_diff(
-    video_path, output_dir_path, MIN_PERCENT_THRESH=0.06, ELAPSED_FRAME_THRESH=85
-):
-    prev_frame = None
-    curr_frame = None
-    screenshots_count = 0
-    capture_frame = False
-    frame_elapsed = 0
+def preprocess_frame(frame, resize_width=None, roi=None, buffers=None, name="gray"):
+    # Crop and subsample before the color conversion so only the analyzed pixels are read.
+    if roi is not None:
+        frame = roi.crop(frame)
 
-    # Initialize kernel.
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+    # Nearest neighbour keeps the contrast of thin text strokes, which area
+    # interpolation would average below the binary threshold.
+    if resize_width and frame.shape[1] > resize_width:
+        frame = resize_image_frame(frame, resize_width, cv2.INTER_NEAREST, buffers)
 
-    # Capture video frames
-    cap = cv2.VideoCapture(video_path)
+    dst = buffers.get(name, frame.shape[:2]) if buffers is not None else None
+    return timed("color_conversion", cv2.cvtColor, frame, cv2.COLOR_BGR2GRAY, dst=dst)
 
-    if not cap.isOpened():
-        print("Unable to open video file: ", video_path)
-        sys.exit()
 
-    success, first_frame = cap.read()
-    num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    prog_bar = tqdm(total=num_frames)
+def get_kernel_size(frame_width, resize_width=None, kernel_size=7):
+    # Scale the dilation kernel with the frame so that the percentage of non-zero
+    # pixels, and therefore the percent thresholds, mean the same at any resolution.
+    if resize_width and frame_width > resize_width:
+        kernel_size = max(1, round(kernel_size * resize_width / frame_width))
+
+    # Keep the kernel odd so it stays centered.
+    return kernel_size | 1
+
+
+def get_diff_mask(curr_frame, prev_frame, kernel, buffers=None):
+    diff, dilated = None, None
+    if buffers is not None:
+        diff = buffers.get("diff", curr_frame.shape)
+        dilated = buffers.get("dilated", curr_frame.shape)
+
+    frame_diff = cv2.absdiff(curr_frame, prev_frame, dst=diff)
+    cv2.threshold(frame_diff, 80, 255, cv2.THRESH_BINARY, dst=frame_diff)
+
+    # Perform dilation to capture motion.
+    return cv2.dilate(frame_diff, kernel, dst=dilated)
+
 
-    print("Using frame differencing for Background Subtraction...")
-    print("---" * 10)
+def get_diff_percent(curr_frame, prev_frame, kernel, mask=None, buffers=None):
+    # Percentage of pixels that changed between two preprocessed frames,
+    # among the pixels of the mask if there is one.
+    frame_diff = timed(
+        "frame_difference", get_diff_mask, curr_frame, prev_frame, kernel, buffers
+    )
+    if mask is not None:
+        cv2.bitwise_and(frame_diff, mask, dst=frame_diff)
+    num_non_zero = timed("nonzero_count", cv2.countNonZero, frame_diff)
+    num_pixels = curr_frame.size if mask is None else cv2.countNonZero(mask)
+
+    return (num_non_zero / (1.0 * max(1, num_pixels))) * 100
+
+
+class FrameDiffState:
+    # Capture a frame once ELAPSED_FRAME_THRESH frames have passed since motion started.
+    def __init__(self, MIN_PERCENT_THRESH=FRAME_DIFF_MIN_PERCENT, ELAPSED_FRAME_THRESH=FRAME_DIFF_ELAPSED_FRAMES):
+        self.MIN_PERCENT_THRESH = MIN_PERCENT_THRESH
+        self.ELAPSED_FRAME_THRESH = ELAPSED_FRAME_THRESH
+        self.capture_frame = False
+        self.frame_elapsed = 0
+
+    def update(self, p_non_zero):
+        if p_non_zero >= self.MIN_PERCENT_THRESH and not self.capture_frame:
+            self.capture_frame = True
+        elif self.capture_frame:
+            self.frame_elapsed += 1
+
+        if self.frame_elapsed >= self.ELAPSED_FRAME_THRESH:
+            self.capture_frame = False
+            self.frame_elapsed = 0
+            return True
+
+        return False
+
+    def state_dict(self):
+        return dict(capture_frame=self.capture_frame, frame_elapsed=self.frame_elapsed)
+
+    def load_state_dict(self, state):
+        self.capture_frame = state["capture_frame"]
+        self.frame_elapsed = state["frame_elapsed"]
+
+
+def detect_slides_frame_diff(
+    cap,
+    capture_state,
+    frame_stride=1,
+    resize_width=None,
+    roi=None,
+    pipelined=False,
+    frame_idx=0,
+    end_frame=None,
+    update_start=0,
+):
+    # Frame differencing over cap, positioned at frame frame_idx. Yields
+    # (frame_idx, frame, p_non_zero, captured) for every analyzed frame, the 1st frame
+    # of the video is always a slide and has no p_non_zero. The capture state is only
+    # updated from frame update_start on. A frame is only valid until the next one is
+    # yielded, nothing is printed or written.
+    success, first_frame = timed("decode", cap.read)
+    if not success:
+        return
 
-    # The 1st frame should always be present in the output directory.
-    # Hence capture and save the 1st frame.
-    if success:
-        # Convert frame to grayscale.
-        first_frame_gray = cv2.cvtColor(first_frame, cv2.COLOR_BGR2GRAY)
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
 
-        prev_frame = first_frame_gray
+    # Only the ROI is analyzed, at the same scale as the full frame would be.
+    mask = None
+    if roi is not None:
+        frame_width = roi.width
+        resize_width = roi.scale_width(resize_width)
 
-        screenshots_count += 1
+    kernel_size = get_kernel_size(frame_width, resize_width)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
 
-        filename = f"{screenshots_count:03}.jpg"
-        out_file_path = os.path.join(output_dir_path, filename)
+    # The analysis images are allocated once, the previous and current grayscale
+    # frames take turns in two buffers.
+    buffers = BufferPool()
+    gray_names = ["gray0", "gray1"]
 
-        # Save frame.
-        cv2.imwrite(out_file_path, first_frame, [cv2.IMWRITE_JPEG_QUALITY, 75])
-        prog_bar.update(1)
+    # Downscale the frame and convert it to grayscale for analysis.
+    # The full resolution frame is only kept to be saved.
+    prev_frame = preprocess_frame(first_frame, resize_width, roi, buffers, gray_names[0])
+    gray_names.reverse()
+    if roi is not None:
+        mask = roi.get_mask(prev_frame.shape)
 
-    # Loop over subsequent frames.
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+    yield frame_idx, first_frame, None, frame_idx == 0
 
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        curr_frame = frame_gray
+    # Decoding runs on its own thread in pipelined mode.
+    with create_frame_reader(cap, frame_stride, pipelined) as reader:
+        while True:
+            ret, frame = reader.read()
+            if not ret:
+                break
 
-        if (prev_frame is not None) and (curr_frame is not None):
-            frame_diff = cv2.absdiff(curr_frame, prev_frame)
-            _, frame_diff = cv2.threshold(frame_diff, 80, 255, cv2.THRESH_BINARY)
+            frame_idx += frame_stride
+            if end_frame is not None and frame_idx >= end_frame:
+                break
 
-            # Perform dilation to capture motion.
-            frame_diff = cv2.dilate(frame_diff, kernel)
+            curr_frame = preprocess_frame(frame, resize_width, roi, buffers, gray_names[0])
+            gray_names.reverse()
 
             # Compute the percentage of non-zero pixels in the frame.
-            p_non_zero = (cv2.countNonZero(frame_diff) / (1.0 * frame_gray.size)) * 100
+            p_non_zero = get_diff_percent(curr_frame, prev_frame, kernel, mask, buffers)
+            captured = frame_idx >= update_start and capture_state.update(p_non_zero)
+            yield frame_idx, frame, p_non_zero, captured
 
-            if p_non_zero >= MIN_PERCENT_THRESH and not capture_frame:
-                capture_frame = True
-            elif capture_frame:
-                frame_elapsed += 1
+            prev_frame = curr_frame
 
-            if frame_elapsed >= ELAPSED_FRAME_THRESH:
-                capture_frame = False
-                frame_elapsed = 0
 
+def capture_slides_frame_diff(
+    video_path,
+    output_dir_path,
+    MIN_PERCENT_THRESH=FRAME_DIFF_MIN_PERCENT,
+    ELAPSED_FRAME_THRESH=FRAME_DIFF_ELAPSED_FRAMES,
+    analysis_fps=None,
+    frame_stride=1,
+    pipelined=False,
+    start_frame=0,
+    end_frame=None,
+    warmup_frames=0,
+    resize_width=None,
+    deduplicator=None,
+    checkpoint_path=None,
+    checkpoint_interval=CHECKPOINT_INTERVAL,
+    resume=False,
+    signal_path=None,
+    pdf_path=None,
+    store=None,
+    roi=None,
+):
+    screenshots_count = 0
+    slides = []
+
+    # Capture video frames
+    cap = open_video_capture(video_path)
+
+    if not cap.isOpened():
+        cap.release()
+        raise ValueError(f"Unable to open video file: {video_path}")
+
+    # Only every frame_stride-th frame is analyzed, so the elapsed frame threshold
+    # is rescaled to keep the same duration in seconds.
+    frame_stride = get_frame_stride(cap, analysis_fps, frame_stride)
+    ELAPSED_FRAME_THRESH = scale_frame_count(ELAPSED_FRAME_THRESH, frame_stride)
+    capture_state = FrameDiffState(MIN_PERCENT_THRESH, ELAPSED_FRAME_THRESH)
+
+    # Continue after the last checkpoint, the frames before it only prime prev_frame.
+    restored = None
+    if resume and checkpoint_path is not None:
+        restored = restore_checkpoint(
+            checkpoint_path, video_path, capture_state, deduplicator
+        )
+    if restored is not None:
+        # The first frame read is the last analyzed frame, which keeps the analyzed
+        # frames on the same grid as an uninterrupted run.
+        start_frame = restored["frame_idx"] + frame_stride
+        warmup_frames = frame_stride
+        screenshots_count = restored["screenshots_count"]
+        slides = [tuple(slide) for slide in restored["slides"]]
+
+    # Frames before start_frame only warm up the detector state, they are never saved.
+    num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frame_idx = seek_video(cap, start_frame, warmup_frames)
+    last_checkpoint = frame_idx
+    prog_bar = ProgressBar(total=(end_frame or num_frames) - frame_idx)
+
+    # The motion signal can only be replayed if it covers the whole video.
+    signal = None
+    if signal_path is not None and start_frame == 0 and end_frame is None:
+        signal = MotionSignal(frame_idx + frame_stride, frame_stride)
+
+    # A restored capture state is already up to date, so the warm-up frames must not
+    # advance it again.
+    frames = detect_slides_frame_diff(
+        cap,
+        capture_state,
+        frame_stride,
+        resize_width,
+        roi,
+        pipelined,
+        frame_idx,
+        end_frame,
+        update_start=start_frame if restored is not None else 0,
+    )
+
+    # JPEG encoding runs on its own threads in pipelined mode.
+    writer = create_image_writer(pipelined, pdf_path=pdf_path, store=store)
+
+    with contextlib.closing(frames), writer:
+        # The PDF starts over with the slides saved before the checkpoint.
+        for _, out_file_path in slides:
+            writer.add_saved_image(out_file_path)
+
+        print("Using frame differencing for Background Subtraction...")
+        if frame_stride > 1:
+            print(f"Analyzing every {frame_stride} frames...")
+        print("---" * 10)
+
+        for frame_idx, frame, p_non_zero, captured in frames:
+            if signal is not None and p_non_zero is not None:
+                signal.append(p_non_zero)
+
+            # Duplicates are dropped before they are ever encoded.
+            if (
+                captured
+                and frame_idx >= start_frame
+                and (deduplicator is None or not deduplicator.is_duplicate_frame(frame))
+            ):
                 screenshots_count += 1
 
                 filename = f"{screenshots_count:03}.jpg"
                 out_file_path = os.path.join(output_dir_path, filename)
 
-                cv2.imwrite(out_file_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 75])
+                writer.write(out_file_path, frame, frame_idx)
+                slides.append((frame_idx, out_file_path))
                 prog_bar.set_postfix_str(f"Total Screenshots: {screenshots_count}")
 
-        prev_frame = curr_frame
-        prog_bar.update(1)
+            # The 1st frame is the only one read without a stride.
+            prog_bar.update(1 if p_non_zero is None else frame_stride)
+
+            if (
+                checkpoint_path is not None
+                and frame_idx - last_checkpoint >= checkpoint_interval
+            ):
+                # Only record slides that are already on disk.
+                writer.flush()
+                save_checkpoint(
+                    checkpoint_path,
+                    make_checkpoint(
+                        video_path,
+                        frame_idx,
+                        screenshots_count,
+                        slides,
+                        capture_state,
+                        deduplicator,
+                    ),
+                )
+                last_checkpoint = frame_idx
 
     # Release progress bar and video capture object.
     prog_bar.close()
     cap.release()
+
+    if signal is not None:
+        signal.save(signal_path, "frame_diff")
+
+    # The run is complete, there is nothing left to resume.
+    if checkpoint_path is not None:
+        remove_checkpoint(checkpoint_path)
+
+    if deduplicator is not None:
+        print("Duplicate frames skipped:", deduplicator.num_duplicates)
+
+    return slides
@@ -0,0 +1,93 @@
+import sys
+
+# BK-tree over packed perceptual hashes.
+# Every child is keyed by its Hamming distance to the parent, so by the triangle
+# inequality a radius query only has to visit children whose key is within
+# radius of the query distance, instead of comparing against every stored hash.
+
+
+def hash_to_int(packed_hash):
+    return int.from_bytes(packed_hash.tobytes(), "little")
+
+
+if sys.version_info >= (3, 10):
+
+    def hamming_distance(hash_a, hash_b):
+        return (hash_a ^ hash_b).bit_count()
+
+else:
+
+    def hamming_distance(hash_a, hash_b):
+        return bin(hash_a ^ hash_b).count("1")
+
+
+class BKTree:
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        # Yield (hash, item) for every stored hash, hashes as python ints.
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node_hash, item, children = nodes.pop()
+            yield node_hash, item
+            nodes.extend(children.values())
+
+    def add(self, packed_hash, item=None):
+        node_hash = hash_to_int(packed_hash)
+        new_node = (node_hash, item, {})
+        self.size += 1
+
+        if self.root is None:
+            self.root = new_node
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(node_hash, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = new_node
+                return
+            node = child
+
+    def query(self, packed_hash, radius):
+        # Return (distance, item) for every stored hash within radius.
+        query_hash = hash_to_int(packed_hash)
+        results = []
+
+        candidates = [self.root] if self.root is not None else []
+        while candidates:
+            node_hash, item, children = candidates.pop()
+            distance = hamming_distance(query_hash, node_hash)
+
+            if distance <= radius:
+                results.append((distance, item))
+
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    candidates.append(child)
+
+        return results
+
+    def contains(self, packed_hash, radius):
+        # Same as query, but stops at the first hash within radius.
+        query_hash = hash_to_int(packed_hash)
+
+        candidates = [self.root] if self.root is not None else []
+        while candidates:
+            node_hash, _, children = candidates.pop()
+            distance = hamming_distance(query_hash, node_hash)
+
+            if distance <= radius:
+                return True
+
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    candidates.append(child)
+
+        return False
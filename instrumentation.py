@@ -0,0 +1,175 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Opt-in per-stage timings and counters.
+# Instrumented code calls timed(name, func, *args) instead of func(*args). While the
+# profiler is disabled that is a single extra function call and flag check, so the
+# hot loops can stay instrumented in production.
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.start_time = time.perf_counter()
+
+    def add_time(self, name, seconds, calls=1):
+        with self.lock:
+            total, num_calls = self.timers.get(name, (0.0, 0))
+            self.timers[name] = (total + seconds, num_calls + calls)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def get_report(self):
+        with self.lock:
+            timers = dict(self.timers)
+            counters = dict(self.counters)
+            wall_time = time.perf_counter() - self.start_time
+
+        report = dict(
+            wall_seconds=wall_time,
+            timers={
+                name: dict(
+                    seconds=total, calls=num_calls, mean_ms=1000 * total / num_calls
+                )
+                for name, (total, num_calls) in sorted(timers.items())
+            },
+            counters=dict(sorted(counters.items())),
+        )
+
+        if "download" in timers and "download_bytes" in counters:
+            report["download_bytes_per_sec"] = counters["download_bytes"] / max(
+                timers["download"][0], 1e-9
+            )
+
+        return report
+
+
+profiler = Profiler()
+
+
+def enable():
+    profiler.reset()
+    profiler.enabled = True
+
+
+def disable():
+    profiler.enabled = False
+
+
+def is_enabled():
+    return profiler.enabled
+
+
+def timed(name, func, *args, **kwargs):
+    if not profiler.enabled:
+        return func(*args, **kwargs)
+
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.add_time(name, time.perf_counter() - start)
+
+
+def add_time(name, seconds, calls=1):
+    if profiler.enabled:
+        profiler.add_time(name, seconds, calls)
+
+
+def count(name, value=1):
+    if profiler.enabled:
+        profiler.count(name, value)
+
+
+def merge_report(report):
+    # Adds the timings and counters recorded by another process.
+    if not profiler.enabled:
+        return
+
+    for name, timer in report["timers"].items():
+        profiler.add_time(name, timer["seconds"], timer["calls"])
+    for name, value in report["counters"].items():
+        profiler.count(name, value)
+
+
+def save_report(report_path):
+    report = profiler.get_report()
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    return report
+
+
+def print_report(report=None):
+    report = report or profiler.get_report()
+
+    print("---" * 5, "Stage timings", "---" * 5)
+    for name, timer in sorted(
+        report["timers"].items(), key=lambda item: -item[1]["seconds"]
+    ):
+        print(
+            f"{name:<24} {timer['seconds']:9.3f}s {timer['calls']:9d} calls "
+            f"{timer['mean_ms']:9.3f}ms/call"
+        )
+    for name, value in report["counters"].items():
+        print(f"{name:<24} {value}")
+    print(f"{'wall time':<24} {report['wall_seconds']:9.3f}s")
+    print("***" * 10, "\n")
+
+
+def format_prometheus(prefix="video2slides"):
+    # Prometheus text exposition format.
+    report = profiler.get_report()
+    lines = []
+
+    # Samples of a metric family have to be listed together.
+    for metric, key in [
+        ("stage_seconds_total", "seconds"),
+        ("stage_calls_total", "calls"),
+    ]:
+        lines.append(f"# TYPE {prefix}_{metric} counter")
+        for name, timer in report["timers"].items():
+            lines.append(f'{prefix}_{metric}{{stage="{name}"}} {timer[key]}')
+
+    for name, value in report["counters"].items():
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = format_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    # Serve the counters at http://host:port/metrics from a background thread.
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics at http://{host}:{port}/metrics")
+
+    return server
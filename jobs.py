@@ -0,0 +1,341 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing, contextmanager
+from functools import partial
+import instrumentation
+import progress
+from config import JOB_DB_PATH, JOB_PROGRESS_INTERVAL, JOB_WORKERS, MAX_QUEUED_JOBS
+
+# Jobs are stored in SQLite, so their state survives restarts and can be read from any
+# process. A dispatcher thread hands the queued jobs to a pool of worker processes,
+# highest priority first and never more than there are free workers, so a queued job
+# can still be cancelled or overtaken. Workers write the progress of their job to the
+# store themselves and stop at the next progress update once it is cancelled.
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    params TEXT NOT NULL,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at);
+"""
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobStore:
+    def __init__(self, db_path=JOB_DB_PATH):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with closing(self.connect()) as conn:
+            # Write-ahead logging lets the server read while the workers write progress.
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def connect(self):
+        # Autocommit mode, multi-statement updates open their own transaction.
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        with closing(self.connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def execute(self, sql, params=()):
+        with closing(self.connect()) as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def add(self, params, priority=0, max_queued=None):
+        job_id = uuid.uuid4().hex
+
+        # Counting and inserting in the same transaction keeps the limit exact.
+        with self.transaction() as conn:
+            if max_queued is not None:
+                (num_queued,) = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)
+                ).fetchone()
+                if num_queued >= max_queued:
+                    raise QueueFullError(f"{num_queued} jobs are already waiting")
+
+            conn.execute(
+                "INSERT INTO jobs (id, status, priority, params, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, priority, json.dumps(params), time.time()),
+            )
+
+        return job_id
+
+    def get(self, job_id):
+        rows = self.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return
+
+        job = dict(rows[0])
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+
+        # Number of queued jobs that will run before this one.
+        if job["status"] == QUEUED:
+            (job["position"],) = self.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND "
+                "(priority > ? OR (priority = ? AND created_at < ?))",
+                (QUEUED, job["priority"], job["priority"], job["created_at"]),
+            )[0]
+
+        return job
+
+    def count(self, status):
+        return self.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,))[0][0]
+
+    def claim_next(self):
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY priority DESC, created_at LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                return
+
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                (RUNNING, time.time(), row["id"]),
+            )
+
+        return self.get(row["id"])
+
+    def set_progress(self, job_id, stage, fraction):
+        # Returns whether the job was cancelled in the meantime.
+        with closing(self.connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, progress = ? WHERE id = ?",
+                (stage, fraction, job_id),
+            )
+            (cancel_requested,) = conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+
+        return bool(cancel_requested)
+
+    def finish(self, job_id, status, result=None, error=None):
+        self.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, "
+            "progress = CASE WHEN ? THEN 1 ELSE progress END WHERE id = ?",
+            (
+                status,
+                json.dumps(result) if result is not None else None,
+                error,
+                time.time(),
+                status == DONE,
+                job_id,
+            ),
+        )
+
+    def cancel(self, job_id):
+        # Queued jobs are cancelled right away, running jobs at their next progress update.
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT status FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return False
+
+            if row["status"] == QUEUED:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                    (CANCELLED, time.time(), job_id),
+                )
+            elif row["status"] == RUNNING:
+                conn.execute(
+                    "UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,)
+                )
+            else:
+                return False
+
+        return True
+
+    def delete_finished(self, max_age):
+        # Finished jobs are kept as long as their workspace.
+        self.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ?",
+            (DONE, FAILED, CANCELLED, time.time() - max_age),
+        )
+
+    def requeue_interrupted(self):
+        # Jobs that were running when the server stopped are run again from the start.
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE status = ? AND cancel_requested = 1",
+                (CANCELLED, time.time(), RUNNING),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = NULL, progress = 0, started_at = NULL WHERE status = ?",
+                (QUEUED, RUNNING),
+            )
+
+
+class JobContext:
+    # Handed to the job function in the worker process to report its progress.
+    def __init__(self, store, job_id, interval=JOB_PROGRESS_INTERVAL):
+        self.store = store
+        self.job_id = job_id
+        self.interval = interval
+        self.stage = None
+        self.last_update = 0
+
+    def set_stage(self, stage):
+        self.stage = stage
+        self.report(0.0, force=True)
+
+    def update(self, done, total):
+        self.report(done / total if total else 0.0)
+
+    def report(self, fraction, force=False):
+        # Progress bars update on every frame, the store only every interval.
+        now = time.monotonic()
+        if not force and now - self.last_update < self.interval:
+            return
+
+        self.last_update = now
+        if self.store.set_progress(self.job_id, self.stage, min(fraction, 1.0)):
+            raise JobCancelled()
+
+
+def run_job(func, db_path, job_id, params, collect_metrics=False):
+    # Runs in a worker process. The stage timings of the job are sent back to the
+    # server, which serves the metrics.
+    store = JobStore(db_path)
+    context = JobContext(store, job_id)
+    progress.set_progress_callback(context.update)
+    if collect_metrics:
+        instrumentation.enable()
+
+    try:
+        result = func(params, context)
+        store.finish(job_id, DONE, result=result)
+    except JobCancelled:
+        store.finish(job_id, CANCELLED)
+    except (Exception, SystemExit) as e:
+        traceback.print_exc()
+        store.finish(job_id, FAILED, error=f"{type(e).__name__}: {e}")
+    finally:
+        progress.set_progress_callback(None)
+
+    return instrumentation.profiler.get_report() if collect_metrics else None
+
+
+class JobQueue:
+    def __init__(
+        self,
+        func,
+        store=None,
+        num_workers=JOB_WORKERS,
+        max_queued=MAX_QUEUED_JOBS,
+    ):
+        # func(params, context) runs in the worker processes, it has to be importable
+        # from a module and return a JSON serializable result.
+        self.func = func
+        self.store = store or JobStore()
+        self.num_workers = num_workers
+        self.max_queued = max_queued
+        self.executor = ProcessPoolExecutor(max_workers=num_workers)
+        self.free_workers = threading.Semaphore(num_workers)
+        self.wakeup = threading.Event()
+
+        self.store.requeue_interrupted()
+        threading.Thread(target=self.dispatch, daemon=True).start()
+
+    def submit(self, params, priority=0):
+        job_id = self.store.add(params, priority, self.max_queued)
+        instrumentation.count("jobs_submitted")
+        self.wakeup.set()
+
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def cancel(self, job_id):
+        return self.store.cancel(job_id)
+
+    def is_active(self, job_id):
+        job = self.store.get(job_id)
+        return job is not None and job["status"] in (QUEUED, RUNNING)
+
+    def dispatch(self):
+        while True:
+            self.free_workers.acquire()
+
+            job = self.store.claim_next()
+            while job is None:
+                self.wakeup.wait(1.0)
+                self.wakeup.clear()
+                job = self.store.claim_next()
+
+            args = (
+                self.func,
+                self.store.db_path,
+                job["id"],
+                job["params"],
+                instrumentation.is_enabled(),
+            )
+            try:
+                future = self.executor.submit(run_job, *args)
+            except BrokenProcessPool:
+                # A crashed worker breaks the whole pool, start a new one.
+                self.executor = ProcessPoolExecutor(max_workers=self.num_workers)
+                future = self.executor.submit(run_job, *args)
+            future.add_done_callback(partial(self.on_done, job["id"]))
+
+    def on_done(self, job_id, future):
+        self.free_workers.release()
+
+        try:
+            report = future.result()
+        except Exception as e:
+            # The worker process died before recording the outcome, e.g. out of memory.
+            self.store.finish(job_id, FAILED, error=f"Worker crashed: {e!r}")
+        else:
+            if report is not None:
+                instrumentation.merge_report(report)
+
+        job = self.store.get(job_id)
+        instrumentation.count(f"jobs_{job['status']}")
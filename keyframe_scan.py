@@ -0,0 +1,234 @@
+import cv2
+import os
+import numpy as np
+from config import (
+    COARSE_RESIZE_WIDTH,
+    FRAME_DIFF_MIN_PERCENT,
+    KEYFRAME_GROUP_FRAMES,
+    KEYFRAME_SETTLE_FRAMES,
+    PACKET_SIZE_RATIO,
+)
+from frame_differencing import (
+    capture_slides_frame_diff,
+    get_diff_percent,
+    get_kernel_size,
+    preprocess_frame,
+)
+from pipeline import create_image_writer
+from replay import read_frames
+
+# Encoders spend few bits on frames that repeat the previous one and start every
+# group of pictures with a keyframe, which decodes on its own. Slide changes are
+# found by decoding and comparing only the keyframes, then located within their group
+# with the compressed packet sizes, which are read from the container without decoding.
+# Only the frames just after each change are decoded again to capture the slide.
+# Packets come in decoding order, which is at most a few frames off the display order
+# when the video has B-frames, the settle delay absorbs that.
+
+
+def read_packet_info(video_path):
+    if not hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME"):
+        return
+
+    cap = cv2.VideoCapture(video_path)
+
+    # A negative format makes the FFmpeg backend return the encoded packets.
+    if not cap.isOpened() or not cap.set(cv2.CAP_PROP_FORMAT, -1):
+        cap.release()
+        return
+
+    sizes = []
+    keyframes = []
+    while True:
+        ret, packet = cap.read()
+        if not ret:
+            break
+
+        sizes.append(packet.size)
+        keyframes.append(bool(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME)))
+
+    cap.release()
+
+    # Without keyframe flags, or with intra-only codecs where every frame is a keyframe,
+    # decoding the keyframes is no cheaper than decoding the whole video.
+    if not any(keyframes) or all(keyframes):
+        return
+
+    return np.array(sizes), np.array(keyframes)
+
+
+def find_keyframe_changes(
+    video_path,
+    key_indices,
+    MIN_PERCENT_THRESH=FRAME_DIFF_MIN_PERCENT,
+    resize_width=COARSE_RESIZE_WIDTH,
+):
+    # With long groups of pictures, seeking to a keyframe only decodes that frame.
+    cap = cv2.VideoCapture(video_path)
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    kernel_size = get_kernel_size(frame_width, resize_width)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+
+    # (previous keyframe, keyframe) pairs whose pictures differ.
+    changes = []
+    prev_frame = None
+    prev_idx = 0
+
+    for frame_idx, frame in read_frames(cap, key_indices):
+        curr_frame = preprocess_frame(frame, resize_width)
+
+        if prev_frame is not None:
+            if get_diff_percent(curr_frame, prev_frame, kernel) >= MIN_PERCENT_THRESH:
+                changes.append((prev_idx, frame_idx))
+
+        prev_frame = curr_frame
+        prev_idx = frame_idx
+
+    cap.release()
+
+    return changes
+
+
+def find_change_frames(
+    sizes, keyframes, keyframe_changes, size_ratio=PACKET_SIZE_RATIO
+):
+    changed = np.zeros(len(sizes), dtype=bool)
+
+    # Inter frames encoding a change are much bigger than the ones repeating a slide.
+    inter = ~keyframes
+    big_packets = inter & (sizes > size_ratio * np.median(sizes[inter]))
+    changed |= big_packets
+
+    # The slide changed somewhere after the previous keyframe, at its biggest packet
+    # if one stands out, otherwise at the keyframe itself.
+    for prev_idx, frame_idx in keyframe_changes:
+        group = big_packets[prev_idx + 1 : frame_idx]
+        if group.any():
+            group_sizes = sizes[prev_idx + 1 : frame_idx] * group
+            changed[prev_idx + 1 + np.argmax(group_sizes)] = True
+        else:
+            changed[frame_idx] = True
+
+    return np.flatnonzero(changed)
+
+
+def group_changes(change_frames, group_frames=KEYFRAME_GROUP_FRAMES):
+    # Changes close to each other belong to the same transition or animation.
+    groups = []
+    for frame_idx in change_frames.tolist():
+        if groups and frame_idx - groups[-1][1] <= group_frames:
+            groups[-1][1] = frame_idx
+        else:
+            groups.append([frame_idx, frame_idx])
+
+    return groups
+
+
+def get_capture_frames(groups, num_frames, settle_frames=KEYFRAME_SETTLE_FRAMES):
+    # Capture each transition once it has settled, but before the next one starts.
+    capture_frames = [0]
+    for i, (_, last_frame) in enumerate(groups):
+        frame_idx = last_frame + settle_frames
+        if i + 1 < len(groups):
+            frame_idx = min(frame_idx, groups[i + 1][0] - 1)
+        frame_idx = min(frame_idx, num_frames - 1)
+
+        if frame_idx > capture_frames[-1]:
+            capture_frames.append(frame_idx)
+
+    return capture_frames
+
+
+def capture_slides_keyframes(
+    video_path,
+    output_dir_path,
+    MIN_PERCENT_THRESH=FRAME_DIFF_MIN_PERCENT,
+    settle_frames=KEYFRAME_SETTLE_FRAMES,
+    resize_width=None,
+    pipelined=False,
+    deduplicator=None,
+    pdf_path=None,
+    store=None,
+    roi=None,
+    **kwargs,
+):
+    # The other options of the capture engines, such as the frame stride, checkpoints
+    # and the motion signal, only apply to the frame differencing fallback.
+    packet_info = read_packet_info(video_path)
+    if packet_info is None:
+        print("No usable keyframe information, falling back to frame differencing...")
+        return capture_slides_frame_diff(
+            video_path,
+            output_dir_path,
+            MIN_PERCENT_THRESH=MIN_PERCENT_THRESH,
+            resize_width=resize_width,
+            pipelined=pipelined,
+            deduplicator=deduplicator,
+            pdf_path=pdf_path,
+            store=store,
+            roi=roi,
+            **kwargs,
+        )
+
+    sizes, keyframes = packet_info
+    key_indices = np.flatnonzero(keyframes).tolist()
+    keyframe_changes = find_keyframe_changes(
+        video_path, key_indices, MIN_PERCENT_THRESH
+    )
+    groups = group_changes(find_change_frames(sizes, keyframes, keyframe_changes))
+    capture_frames = get_capture_frames(groups, len(sizes), settle_frames)
+
+    print("Using keyframes and packet sizes to locate slide changes...")
+    print(f"Found {len(groups)} candidate transitions in {len(sizes)} frames")
+    print("---" * 10)
+
+    cap = cv2.VideoCapture(video_path)
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+
+    # Candidates are compared within the ROI, packet sizes cover the whole frame.
+    mask = None
+    if roi is not None:
+        frame_width = roi.width
+        resize_width = roi.scale_width(resize_width)
+
+    kernel_size = get_kernel_size(frame_width, resize_width)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+
+    screenshots_count = 0
+    slides = []
+    prev_frame = None
+    writer = create_image_writer(pipelined, pdf_path=pdf_path, store=store)
+
+    with writer:
+        for frame_idx, frame in read_frames(cap, capture_frames):
+            frame_gray = preprocess_frame(frame, resize_width, roi)
+            if roi is not None:
+                mask = roi.get_mask(frame_gray.shape)
+
+            # Candidates are only saved if they really differ from the last saved slide,
+            # packet sizes also grow with noise or a moving cursor.
+            if prev_frame is not None:
+                p_non_zero = get_diff_percent(frame_gray, prev_frame, kernel, mask)
+                if p_non_zero < MIN_PERCENT_THRESH:
+                    continue
+
+            prev_frame = frame_gray
+
+            if deduplicator is not None and deduplicator.is_duplicate_frame(frame):
+                continue
+
+            screenshots_count += 1
+
+            filename = f"{screenshots_count:03}.jpg"
+            out_file_path = os.path.join(output_dir_path, filename)
+            writer.write(out_file_path, frame, frame_idx)
+            slides.append((frame_idx, out_file_path))
+
+    cap.release()
+
+    print(f"Decoded {len(key_indices) + len(capture_frames)} of {len(sizes)} frames")
+    print("Total Screenshots:", screenshots_count)
+    if deduplicator is not None:
+        print("Duplicate frames skipped:", deduplicator.num_duplicates)
+
+    return slides
@@ -0,0 +1,58 @@
+import json
+import os
+import numpy as np
+from array import array
+
+# The capture engines reduce every analyzed frame to a single number, the percentage
+# of changed (or foreground) pixels. Saving that signal lets the capture state machine
+# run again with other thresholds without decoding the video, only the frames it
+# selects are decoded to be saved.
+
+
+class MotionSignal:
+    def __init__(self, first_frame, frame_stride):
+        self.first_frame = first_frame
+        self.frame_stride = frame_stride
+        self.values = array("f")
+
+    def append(self, p_non_zero):
+        self.values.append(p_non_zero)
+
+    def save(self, signal_path, engine):
+        os.makedirs(os.path.dirname(signal_path) or ".", exist_ok=True)
+
+        # Write to temporary files first, so readers never see a partial signal.
+        tmp_path = signal_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.frombuffer(self.values, dtype=np.float32))
+        os.replace(tmp_path, signal_path)
+
+        meta = dict(
+            engine=engine,
+            first_frame=self.first_frame,
+            frame_stride=self.frame_stride,
+            num_values=len(self.values),
+        )
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, get_meta_path(signal_path))
+
+
+def get_meta_path(signal_path):
+    return os.path.splitext(signal_path)[0] + ".json"
+
+
+def load_motion_signal(signal_path):
+    meta_path = get_meta_path(signal_path)
+    if not os.path.exists(signal_path) or not os.path.exists(meta_path):
+        return None, None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    # Memory-mapped, so even signals of very long videos load instantly.
+    signal = np.load(signal_path, mmap_mode="r")
+    if len(signal) != meta["num_values"]:
+        return None, None
+
+    return signal, meta
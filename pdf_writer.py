@@ -0,0 +1,109 @@
+import os
+from PIL import Image
+
+# Writes a PDF one JPEG page at a time, with the same layout as img2pdf: the JPEG data is
+# embedded as is, on a page the size of the image at 96 dpi. Every page goes straight to
+# the output file and only the offsets of its objects are kept, so memory does not grow
+# with the number of slides. The page tree and the cross-reference table are written
+# when the writer is closed, the file only gets its final name then.
+
+PDF_DPI = 96
+COLOR_SPACES = {"RGB": "/DeviceRGB", "L": "/DeviceGray"}
+
+# Object 1 is the catalog and object 2 the page tree, both written last.
+CATALOG_ID = 1
+PAGES_ID = 2
+
+
+def is_streamable(image_path):
+    # Other images need to be converted by img2pdf.
+    with Image.open(image_path) as image:
+        return image.format == "JPEG" and image.mode in COLOR_SPACES
+
+
+class PDFWriter:
+    def __init__(self, pdf_path):
+        self.pdf_path = pdf_path
+        self.tmp_path = pdf_path + ".part"
+        self.file = open(self.tmp_path, "wb")
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = PAGES_ID + 1
+
+        # The comment with binary characters tells tools the file is binary.
+        self.file.write(b"%PDF-1.3\n%\xbf\xf7\xa2\xfe\n")
+
+    @property
+    def num_pages(self):
+        return len(self.page_ids)
+
+    def write_object(self, obj_id, obj, stream=None):
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(f"{obj_id} 0 obj\n{obj}".encode())
+        if stream is not None:
+            self.file.write(b"\nstream\n")
+            self.file.write(stream)
+            self.file.write(b"\nendstream")
+        self.file.write(b"\nendobj\n")
+
+    def add_page(self, jpeg_data, width, height, color_space="/DeviceRGB"):
+        image_id, content_id, page_id = range(self.next_id, self.next_id + 3)
+        self.next_id += 3
+
+        page_width = width * 72 / PDF_DPI
+        page_height = height * 72 / PDF_DPI
+        jpeg_data = memoryview(jpeg_data).cast("B")
+
+        self.write_object(
+            image_id,
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode "
+            f"/Length {len(jpeg_data)} >>",
+            jpeg_data,
+        )
+
+        content = f"q {page_width:g} 0 0 {page_height:g} 0 0 cm /Im0 Do Q".encode()
+        self.write_object(content_id, f"<< /Length {len(content)} >>", content)
+
+        self.write_object(
+            page_id,
+            f"<< /Type /Page /Parent {PAGES_ID} 0 R "
+            f"/MediaBox [0 0 {page_width:g} {page_height:g}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>",
+        )
+        self.page_ids.append(page_id)
+
+    def add_jpeg_file(self, image_path):
+        with Image.open(image_path) as image:
+            width, height = image.size
+            color_space = COLOR_SPACES[image.mode]
+
+        with open(image_path, "rb") as f:
+            self.add_page(f.read(), width, height, color_space)
+
+    def close(self):
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self.write_object(
+            PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {self.num_pages} >>"
+        )
+        self.write_object(CATALOG_ID, f"<< /Type /Catalog /Pages {PAGES_ID} 0 R >>")
+
+        # Every cross-reference entry is exactly 20 bytes long.
+        xref_offset = self.file.tell()
+        self.file.write(f"xref\n0 {self.next_id}\n0000000000 65535 f \n".encode())
+        for obj_id in range(1, self.next_id):
+            self.file.write(f"{self.offsets[obj_id]:010} 00000 n \n".encode())
+        self.file.write(
+            f"trailer\n<< /Size {self.next_id} /Root {CATALOG_ID} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+
+        self.file.close()
+        os.replace(self.tmp_path, self.pdf_path)
+
+        return self.pdf_path
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
@@ -0,0 +1,243 @@
+import cv2
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from config import PIPELINE_QUEUE_SIZE, PIPELINE_WRITERS, SLIDE_IMAGE_QUALITY
+from instrumentation import timed
+from pdf_writer import PDFWriter
+from slide_store import encode_image
+from utils import read_frame
+
+# OpenCV releases the GIL while decoding, converting and encoding frames,
+# so running these stages on separate threads lets a single video use several cores.
+# Queues are bounded so that a slow stage never lets frames pile up in memory.
+# Readers decode into reused buffers: a frame is only valid until the next
+# read, a frame that has to outlive it must be copied.
+
+
+class FrameReader:
+    def __init__(self, cap, frame_stride=1):
+        self.cap = cap
+        self.frame_stride = frame_stride
+        self.frame = None
+
+    def read(self):
+        ret, frame = read_frame(self.cap, self.frame_stride, self.frame)
+        if ret:
+            self.frame = frame
+
+        return ret, frame
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ThreadedFrameReader:
+    def __init__(self, cap, frame_stride=1, queue_size=PIPELINE_QUEUE_SIZE):
+        self.cap = cap
+        self.frame_stride = frame_stride
+        self.queue = Queue(maxsize=queue_size)
+        # Buffers the consumer is done with, so only as many frames as are ever in
+        # flight at once get allocated.
+        self.free_frames = Queue()
+        self.frame = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._decode, daemon=True)
+        self.thread.start()
+
+    def _decode(self):
+        while not self.stopped.is_set():
+            try:
+                image = self.free_frames.get_nowait()
+            except Empty:
+                image = None
+            ret, frame = read_frame(self.cap, self.frame_stride, image)
+
+            # Retry until the consumer takes the frame or asks us to stop.
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put((ret, frame), timeout=0.1)
+                    break
+                except Full:
+                    continue
+
+            if not ret:
+                break
+
+    def read(self):
+        # The previous frame is no longer used once the next one is requested.
+        if self.frame is not None:
+            self.free_frames.put(self.frame)
+
+        ret, self.frame = self.queue.get()
+        return ret, self.frame
+
+    def release(self):
+        self.stopped.set()
+
+        # Unblock the decoder thread if it is waiting on a full queue.
+        try:
+            while True:
+                self.queue.get_nowait()
+        except Empty:
+            pass
+
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # The decoder thread is stopped even if the capture fails.
+        self.release()
+
+
+def write_jpeg(out_file_path, frame):
+    ret, jpeg_data = cv2.imencode(
+        ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, SLIDE_IMAGE_QUALITY]
+    )
+    if not ret:
+        raise ValueError(f"Unable to encode {out_file_path}")
+
+    with open(out_file_path, "wb") as f:
+        f.write(jpeg_data)
+
+    return jpeg_data
+
+
+class ImageWriter:
+    def __init__(
+        self, num_workers=0, max_pending=PIPELINE_QUEUE_SIZE, pdf_path=None, store=None
+    ):
+        self.executor = None
+        self.futures = deque()
+
+        if num_workers > 0:
+            self.executor = ThreadPoolExecutor(max_workers=num_workers)
+            self.pending = threading.BoundedSemaphore(max_pending)
+
+        # Saved slides are also appended to the PDF as they come, in capture order.
+        self.pdf_writer = PDFWriter(pdf_path) if pdf_path is not None else None
+
+        # Slides are appended to the slide store instead of being written as files.
+        self.store = store
+
+    def add_page(self, jpeg_data, frame):
+        if self.pdf_writer is not None:
+            height, width = frame.shape[:2]
+            self.pdf_writer.add_page(jpeg_data, width, height)
+
+    def add_saved_image(self, out_file_path):
+        # Slides saved before resuming from a checkpoint.
+        if self.pdf_writer is not None:
+            self.pdf_writer.add_jpeg_file(out_file_path)
+
+    def encode(self, out_file_path, frame):
+        # Runs on the worker threads in pipelined mode.
+        if self.store is None:
+            return timed("jpeg_encode", write_jpeg, out_file_path, frame), None
+
+        data, comp_hash = timed("image_encode", self.store.encode, frame)
+        jpeg_data = data if self.store.image_format == "jpg" else None
+        if self.pdf_writer is not None and jpeg_data is None:
+            jpeg_data = timed("jpeg_encode", encode_image, frame, "jpg")
+
+        return jpeg_data, (data, comp_hash)
+
+    def add_slide(self, encoded, out_file_path, frame, frame_idx):
+        jpeg_data, stored = encoded
+        if stored is not None:
+            data, comp_hash = stored
+            name = os.path.basename(out_file_path)
+            self.store.add(name, frame_idx, data, frame.shape, comp_hash)
+
+        self.add_page(jpeg_data, frame)
+
+    def write(self, out_file_path, frame, frame_idx=None):
+        if self.executor is None:
+            encoded = self.encode(out_file_path, frame)
+            self.add_slide(encoded, out_file_path, frame, frame_idx)
+            return
+
+        # The reader reuses the frame buffers, so the frames waiting to be encoded are
+        # copied. Only the saved slides are ever copied at full resolution.
+        frame = frame.copy()
+
+        # Block the analysis stage while too many frames are waiting to be encoded.
+        self.pending.acquire()
+        future = self.executor.submit(self.encode, out_file_path, frame)
+        future.add_done_callback(lambda _: self.pending.release())
+        self.futures.append((future, out_file_path, frame, frame_idx))
+
+        # Slides are added once the frames before them are encoded too.
+        while self.futures and self.futures[0][0].done():
+            future, *slide = self.futures.popleft()
+            self.add_slide(future.result(), *slide)
+
+    def flush(self):
+        # Wait until every submitted frame is on disk and surface encoding errors
+        # from the worker threads.
+        while self.futures:
+            future, *slide = self.futures.popleft()
+            self.add_slide(future.result(), *slide)
+
+        if self.store is not None:
+            self.store.flush()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.flush()
+
+        if self.pdf_writer is not None:
+            self.pdf_writer.close()
+
+    def abort(self):
+        # The slides still waiting to be encoded are dropped, and the PDF being written
+        # is removed rather than left incomplete.
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        self.futures.clear()
+
+        if self.pdf_writer is not None:
+            self.pdf_writer.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # Closed when the capture completes, aborted if it fails.
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def create_frame_reader(
+    cap, frame_stride=1, pipelined=False, queue_size=PIPELINE_QUEUE_SIZE
+):
+    if pipelined:
+        return ThreadedFrameReader(cap, frame_stride, queue_size)
+
+    return FrameReader(cap, frame_stride)
+
+
+def create_image_writer(
+    pipelined=False,
+    num_workers=PIPELINE_WRITERS,
+    queue_size=PIPELINE_QUEUE_SIZE,
+    pdf_path=None,
+    store=None,
+):
+    if pipelined:
+        return ImageWriter(num_workers, queue_size, pdf_path, store)
+
+    return ImageWriter(pdf_path=pdf_path, store=store)
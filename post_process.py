@@ -1,58 +1,221 @@
+import cv2
 import imagehash
+import numpy as np
 import os
 from collections import deque
 from PIL import Image
-from tqdm import tqdm
+from batch_hash import batch_hash, hamming_distances
+from hash_index import BKTree
+from instrumentation import timed
+from progress import ProgressBar
+from slide_store import SlideStore, find_store
+
+
+class SlideDeduplicator:
+    def __init__(
+        self,
+        hash_size=8,
+        hashfunc=imagehash.dhash,
+        queue_len=5,
+        threshold=4,
+        global_index=False,
+        roi=None,
+    ):
+        self.hash_size = hash_size
+        self.hashfunc = hashfunc
+        self.threshold = threshold
+        self.hash_dict = {}
+        self.hash_queue = deque([], maxlen=queue_len)
+        self.num_duplicates = 0
+
+        # Only the pixels analyzed by the capture engines are hashed.
+        self.roi = roi
+
+        # In global mode every kept slide is compared against, not only the last queue_len.
+        self.hash_index = BKTree() if global_index else None
+
+    def state_dict(self):
+        # JSON friendly snapshot of the hash history, used to checkpoint long runs.
+        num_bytes = -(-self.hash_size * self.hash_size // 64) * 8
+        state = dict(
+            hash_dict=[[key.hex(), name] for key, name in self.hash_dict.items()],
+            hash_queue=[comp_hash.tobytes().hex() for comp_hash in self.hash_queue],
+            num_duplicates=self.num_duplicates,
+        )
+        if self.hash_index is not None:
+            state["hash_index"] = [
+                [node_hash.to_bytes(num_bytes, "little").hex(), name]
+                for node_hash, name in self.hash_index
+            ]
+
+        return state
+
+    def load_state_dict(self, state):
+        self.hash_dict = {bytes.fromhex(key): name for key, name in state["hash_dict"]}
+        self.hash_queue.clear()
+        for comp_hash in state["hash_queue"]:
+            self.hash_queue.append(np.frombuffer(bytes.fromhex(comp_hash), np.uint64))
+        self.num_duplicates = state["num_duplicates"]
+
+        if self.hash_index is not None:
+            self.hash_index = BKTree()
+            for comp_hash, name in state.get("hash_index", []):
+                self.hash_index.add(
+                    np.frombuffer(bytes.fromhex(comp_hash), np.uint64), name
+                )
+
+    def hash_images(self, images):
+        return timed("hashing", batch_hash, images, self.hash_size, self.hashfunc)
+
+    def is_duplicate_hash(self, comp_hash, name=None):
+        key = comp_hash.tobytes()
+        duplicate = False
+
+        if key not in self.hash_dict:
+            self.hash_dict[key] = name
+            if self.hash_index is not None:
+                duplicate = self.hash_index.contains(comp_hash, self.threshold)
+
+                if not duplicate:
+                    self.hash_index.add(comp_hash, name)
+            else:
+                # Compare with hash queue to find out potential duplicates
+                if self.hash_queue:
+                    distances = hamming_distances(comp_hash, np.stack(self.hash_queue))
+                    duplicate = bool((distances <= self.threshold).any())
+
+                if not duplicate:
+                    self.hash_queue.append(comp_hash)
+        else:
+            duplicate = True
+
+        if duplicate:
+            self.num_duplicates += 1
+
+        return duplicate
+
+    def mask_image(self, image):
+        return self.roi.mask_image(image) if self.roi is not None else image
+
+    def is_duplicate(self, image, name=None):
+        return self.is_duplicate_hash(self.hash_images([self.mask_image(image)])[0], name)
+
+    def hash_frame(self, frame):
+        # Hash the decoded BGR frame directly, so duplicates are never encoded to disk.
+        if self.roi is not None:
+            frame = self.roi.mask_frame(frame)
+        image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+        return self.hash_images([image])[0]
+
+    def is_duplicate_frame(self, frame, name=None):
+        return self.is_duplicate_hash(self.hash_frame(frame), name)
+
+
+def find_duplicates(deduplicator, names, get_hashes, batch_size=64):
+    duplicates = []
+
+    print("---" * 5, "Finding similar files", "---" * 5)
+
+    with ProgressBar(total=len(names)) as t:
+        for i in range(0, len(names), batch_size):
+            batch_names = names[i : i + batch_size]
+
+            for name, comp_hash in zip(batch_names, get_hashes(batch_names)):
+                if deduplicator.is_duplicate_hash(comp_hash, name):
+                    duplicates.append(name)
+                    t.set_postfix_str(f"Duplicate files: {deduplicator.num_duplicates}")
+                t.update(1)
+
+    return duplicates
 
 
 def find_similar_images(
-    base_dir, hash_size=8, hashfunc=imagehash.dhash, queue_len=5, threshold=4
+    base_dir,
+    hash_size=8,
+    hashfunc=imagehash.dhash,
+    queue_len=5,
+    threshold=4,
+    batch_size=64,
+    global_index=False,
+    roi=None,
 ):
     snapshots_files = sorted(os.listdir(base_dir))
 
-    hash_dict = {}
-    hash_queue = deque([], maxlen=queue_len)
-    duplicates = []
-    num_duplicates = 0
+    deduplicator = SlideDeduplicator(
+        hash_size, hashfunc, queue_len, threshold, global_index, roi
+    )
 
-    print("---" * 5, "Finding similar files", "---" * 5)
+    def hash_files(batch_files):
+        images = [
+            deduplicator.mask_image(Image.open(os.path.join(base_dir, file)))
+            for file in batch_files
+        ]
+        return deduplicator.hash_images(images)
 
-    with tqdm(snapshots_files) as t:
-        for file in t:
-            read_file = Image.open(os.path.join(base_dir, file))
-            comp_hash = hashfunc(read_file, hash_size=hash_size)
-            duplicate = False
+    duplicates = find_duplicates(deduplicator, snapshots_files, hash_files, batch_size)
 
-            if comp_hash not in hash_dict:
-                hash_dict[comp_hash] = file
-                # Compare with hash queue to find out potential duplicates
-                for img_hash in hash_queue:
-                    if img_hash - comp_hash <= threshold:
-                        duplicate = True
-                        break
+    return deduplicator.hash_dict, duplicates
 
-                if not duplicate:
-                    hash_queue.append(comp_hash)
-            else:
-                duplicate = True
 
-            if duplicate:
-                duplicates.append(file)
-                num_duplicates += 1
-                t.set_postfix_str(f"Duplicate files: {num_duplicates}")
+def find_similar_slides(
+    store,
+    hash_size=8,
+    hashfunc=imagehash.dhash,
+    queue_len=5,
+    threshold=4,
+    batch_size=64,
+    global_index=False,
+    roi=None,
+):
+    # Same as find_similar_images over the slides of a slide_store.SlideStore.
+    entries = {entry["name"]: entry for entry in store}
 
-    return hash_dict, duplicates
+    deduplicator = SlideDeduplicator(
+        hash_size, hashfunc, queue_len, threshold, global_index, roi
+    )
+
+    def hash_slides(batch_names):
+        # The hashes saved with the slides are used if they were computed the same way,
+        # the images are then not even decoded.
+        if roi is None and store.hash_size == hash_size and store.hashfunc is hashfunc:
+            return [store.get_hash(entries[name]) for name in batch_names]
+
+        images = [
+            deduplicator.mask_image(store.read_image(entries[name]))
+            for name in batch_names
+        ]
+        return deduplicator.hash_images(images)
+
+    duplicates = find_duplicates(deduplicator, list(entries), hash_slides, batch_size)
+
+    return deduplicator.hash_dict, duplicates
 
 
 def remove_duplicates(
-    base_dir, hash_size=8, hashfunc=imagehash.dhash, queue_len=5, threshold=4
+    base_dir,
+    hash_size=8,
+    hashfunc=imagehash.dhash,
+    queue_len=5,
+    threshold=4,
+    global_index=False,
+    roi=None,
 ):
+    store_path = find_store(base_dir)
+    if store_path is not None:
+        remove_store_duplicates(
+            store_path, hash_size, hashfunc, queue_len, threshold, global_index, roi
+        )
+        return
+
     _, duplicates = find_similar_images(
         base_dir,
         hash_size=hash_size,
         hashfunc=hashfunc,
         queue_len=queue_len,
         threshold=threshold,
+        global_index=global_index,
+        roi=roi,
     )
 
     if not len(duplicates):
@@ -73,5 +236,36 @@ def remove_duplicates(
     print("***" * 10, "\n")
 
 
+def remove_store_duplicates(
+    store_path,
+    hash_size=8,
+    hashfunc=imagehash.dhash,
+    queue_len=5,
+    threshold=4,
+    global_index=False,
+    roi=None,
+):
+    with SlideStore(store_path) as store:
+        _, duplicates = find_similar_slides(
+            store,
+            hash_size=hash_size,
+            hashfunc=hashfunc,
+            queue_len=queue_len,
+            threshold=threshold,
+            global_index=global_index,
+            roi=roi,
+        )
+
+        if not len(duplicates):
+            print("No duplicates found!")
+        else:
+            # A single rewrite of the store, without the duplicates.
+            print("Removing duplicates...")
+            store.remove(duplicates)
+            print("All duplicates removed!")
+
+    print("***" * 10, "\n")
+
+
 if __name__ == "__main__":
     remove_duplicates("sample_1")
@@ -0,0 +1,22 @@
+from tqdm import tqdm
+
+# Progress bars of the processing loops.
+# Besides the terminal bar, the progress is reported to an optional per-process callback,
+# which is how the job workers publish the progress of a job and cancel it.
+
+progress_callback = None
+
+
+def set_progress_callback(callback):
+    # callback(done, total) is called on every update, it can raise to stop the loop.
+    global progress_callback
+    progress_callback = callback
+
+
+class ProgressBar(tqdm):
+    def update(self, n=1):
+        displayed = super().update(n)
+        if progress_callback is not None:
+            progress_callback(self.n, self.total)
+
+        return displayed
@@ -0,0 +1,115 @@
+import cv2
+import os
+from bg_modeling import BgModelingState
+from config import (
+    FRAME_DIFF_ELAPSED_FRAMES,
+    FRAME_DIFF_MIN_PERCENT,
+    REPLAY_SEEK_FRAMES,
+)
+from frame_differencing import FrameDiffState
+from pipeline import create_image_writer
+from progress import ProgressBar
+from utils import open_video_capture, scale_frame_count
+
+# Replay runs the capture state machine over a saved motion signal with new thresholds,
+# then decodes only the selected frames.
+
+
+def select_frames(
+    signal,
+    meta,
+    MIN_PERCENT_THRESH,
+    MAX_PERCENT_THRESH=None,
+    ELAPSED_FRAME_THRESH=None,
+):
+    frame_stride = meta["frame_stride"]
+    frame_indices = []
+
+    if meta["engine"] == "frame_diff":
+        # Frame differencing always keeps the 1st frame.
+        frame_indices.append(0)
+        capture_state = FrameDiffState(
+            MIN_PERCENT_THRESH, scale_frame_count(ELAPSED_FRAME_THRESH, frame_stride)
+        )
+    else:
+        capture_state = BgModelingState(MIN_PERCENT_THRESH, MAX_PERCENT_THRESH)
+
+    for i, p_non_zero in enumerate(signal.tolist()):
+        if capture_state.update(p_non_zero):
+            frame_indices.append(meta["first_frame"] + i * frame_stride)
+
+    return frame_indices
+
+
+def read_frames(cap, frame_indices, seek_frames=REPLAY_SEEK_FRAMES):
+    # Seeking decodes from the previous keyframe, so close frames are reached
+    # by grabbing the frames in between instead.
+    pos = 0
+    prog_bar = ProgressBar(total=len(frame_indices))
+    for frame_idx in frame_indices:
+        if frame_idx - pos > seek_frames or frame_idx < pos:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        else:
+            for _ in range(frame_idx - pos):
+                cap.grab()
+
+        ret, frame = cap.read()
+        pos = frame_idx + 1
+        if not ret:
+            break
+
+        yield frame_idx, frame
+        prog_bar.update(1)
+
+    prog_bar.close()
+
+
+def replay_slides(
+    video_path,
+    output_dir_path,
+    signal,
+    meta,
+    MIN_PERCENT_THRESH=FRAME_DIFF_MIN_PERCENT,
+    MAX_PERCENT_THRESH=None,
+    ELAPSED_FRAME_THRESH=FRAME_DIFF_ELAPSED_FRAMES,
+    pipelined=False,
+    deduplicator=None,
+    pdf_path=None,
+    store=None,
+):
+    print("Replaying the saved motion signal...")
+    print("---" * 10)
+
+    frame_indices = select_frames(
+        signal, meta, MIN_PERCENT_THRESH, MAX_PERCENT_THRESH, ELAPSED_FRAME_THRESH
+    )
+
+    cap = open_video_capture(video_path)
+
+    if not cap.isOpened():
+        cap.release()
+        raise ValueError(f"Unable to open video file: {video_path}")
+
+    screenshots_count = 0
+    slides = []
+    writer = create_image_writer(pipelined, pdf_path=pdf_path, store=store)
+
+    with writer:
+        for frame_idx, frame in read_frames(cap, frame_indices):
+            if deduplicator is not None and deduplicator.is_duplicate_frame(frame):
+                continue
+
+            screenshots_count += 1
+
+            filename = f"{screenshots_count:03}.jpg"
+            out_file_path = os.path.join(output_dir_path, filename)
+            writer.write(out_file_path, frame, frame_idx)
+            slides.append((frame_idx, out_file_path))
+
+    cap.release()
+
+    print(f"Decoded {len(frame_indices)} of {meta['num_values']} analyzed frames")
+    if deduplicator is not None:
+        print("Duplicate frames skipped:", deduplicator.num_duplicates)
+
+    return slides
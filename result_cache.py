@@ -0,0 +1,160 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from config import CACHE_DIR, CACHE_MAX_SIZE_MB
+
+FINGERPRINT_CHUNK_SIZE = 1 << 20
+SIGNALS_DIR = ".signals"
+
+
+def fingerprint_video(video_path, chunk_size=FINGERPRINT_CHUNK_SIZE):
+    # Hash the size and a few sampled chunks instead of the whole file,
+    # so fingerprinting a multi-GB video only reads a few MB.
+    file_size = os.path.getsize(video_path)
+    digest = hashlib.sha256(str(file_size).encode())
+
+    with open(video_path, "rb") as f:
+        for offset in (0, file_size // 2, max(0, file_size - chunk_size)):
+            f.seek(offset)
+            digest.update(f.read(chunk_size))
+
+    return digest.hexdigest()
+
+
+def make_cache_key(video_path, params):
+    key = {"video": fingerprint_video(video_path), "params": params}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def link_or_copy(src, dst):
+    # Hard links make cache hits nearly free when both paths are on the same filesystem.
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def get_dir_size(dir_path):
+    return sum(
+        os.path.getsize(os.path.join(dir_path, file)) for file in os.listdir(dir_path)
+    )
+
+
+def get_signal_files(signal_path):
+    # The signal and its metadata, ignoring the temporary files of a signal being saved.
+    stem = os.path.splitext(signal_path)[0]
+    return [
+        file_path
+        for file_path in (stem + ".npy", stem + ".json")
+        if os.path.isfile(file_path)
+    ]
+
+
+class ResultCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_size_mb=CACHE_MAX_SIZE_MB):
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key, output_dir_path):
+        entry_path = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry_path):
+            return False
+
+        for file in os.listdir(entry_path):
+            out_file_path = os.path.join(output_dir_path, file)
+            if os.path.exists(out_file_path):
+                os.remove(out_file_path)
+            link_or_copy(os.path.join(entry_path, file), out_file_path)
+
+        # The entry modification time is used as its last access time for LRU eviction.
+        os.utime(entry_path)
+        print("Loaded results from cache:", entry_path)
+        print("***" * 10, "\n")
+
+        return True
+
+    def put(self, key, output_dir_path):
+        entry_path = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry_path):
+            return
+
+        # Build the entry under a temporary name, so readers never see a partial entry.
+        tmp_path = os.path.join(self.cache_dir, f".{key}.{uuid.uuid4().hex}")
+        os.makedirs(tmp_path)
+        for file in os.listdir(output_dir_path):
+            file_path = os.path.join(output_dir_path, file)
+            if os.path.isfile(file_path):
+                link_or_copy(file_path, os.path.join(tmp_path, file))
+
+        try:
+            os.rename(tmp_path, entry_path)
+        except OSError:
+            # Another process stored the same result in the meantime.
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        self.evict()
+
+    def get_signal_path(self, key):
+        # Motion signals share the size budget and the LRU eviction of the results.
+        signal_path = os.path.join(self.cache_dir, SIGNALS_DIR, f"{key}.npy")
+        for file_path in get_signal_files(signal_path):
+            os.utime(file_path)
+
+        return signal_path
+
+    def get_signal_entries(self):
+        signals_dir_path = os.path.join(self.cache_dir, SIGNALS_DIR)
+        if not os.path.isdir(signals_dir_path):
+            return []
+
+        entries = []
+        for file in os.listdir(signals_dir_path):
+            if not file.endswith(".npy"):
+                continue
+            file_paths = get_signal_files(os.path.join(signals_dir_path, file))
+            try:
+                entries.append(
+                    (
+                        max(os.path.getmtime(path) for path in file_paths),
+                        sum(os.path.getsize(path) for path in file_paths),
+                        file_paths,
+                    )
+                )
+            except (OSError, ValueError):
+                # Removed by another process in the meantime.
+                continue
+
+        return entries
+
+    def evict(self):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, key)
+            if key.startswith(".") or not os.path.isdir(entry_path):
+                continue
+            entries.append(
+                (os.path.getmtime(entry_path), get_dir_size(entry_path), [entry_path])
+            )
+        entries.extend(self.get_signal_entries())
+
+        total_size = sum(size for _, size, _ in entries)
+
+        # Remove least recently used entries until the cache fits in its budget.
+        for _, size, paths in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            for path in paths:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    with contextlib.suppress(OSError):
+                        os.remove(path)
+            total_size -= size
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
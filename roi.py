@@ -0,0 +1,197 @@
+import cv2
+import hashlib
+import numpy as np
+from PIL import Image
+from config import (
+    ROI_AUTO_CHANGE_RATIO,
+    ROI_AUTO_GAP_SECS,
+    ROI_AUTO_SAMPLES,
+    ROI_AUTO_WIDTH,
+)
+from utils import open_video_capture, resize_image_frame
+
+# Restricts the analysis to the slide area of the frame. Frames are cropped to the ROI
+# rectangle before anything else, so only its pixels are resized, converted and
+# subtracted. Ignored pixels inside the rectangle, e.g. a webcam overlapping the slide,
+# are masked out of the motion percentages and blanked before hashing.
+
+
+class RegionOfInterest:
+    def __init__(self, frame_width, frame_height, rect=None, ignore_mask=None):
+        # rect is (x, y, w, h) in pixels, ignore_mask an 8 bit image of any size,
+        # non-zero where the pixels are ignored.
+        x, y, w, h = rect or (0, 0, frame_width, frame_height)
+        self.x = min(max(0, int(x)), frame_width - 1)
+        self.y = min(max(0, int(y)), frame_height - 1)
+        self.width = max(1, min(int(w), frame_width - self.x))
+        self.height = max(1, min(int(h), frame_height - self.y))
+        self.frame_width = frame_width
+
+        # 255 where the pixels are analyzed, None if they all are.
+        self.mask = None
+        if ignore_mask is not None:
+            ignore_mask = cv2.resize(
+                ignore_mask, (frame_width, frame_height), interpolation=cv2.INTER_NEAREST
+            )
+            mask = np.where(self.crop(ignore_mask) > 0, 0, 255).astype(np.uint8)
+            if not mask.all():
+                self.mask = mask
+        self.masks = {}
+
+    def __repr__(self):
+        # Used in the cache keys.
+        mask = "" if self.mask is None else hashlib.sha1(self.mask.tobytes()).hexdigest()[:12]
+        return f"RegionOfInterest({self.x}, {self.y}, {self.width}, {self.height}, mask={mask!r})"
+
+    def crop(self, frame):
+        # A view, the pixels are not copied.
+        return frame[self.y : self.y + self.height, self.x : self.x + self.width]
+
+    def scale_width(self, resize_width):
+        # Width to resize the cropped frames to, with the same pixel density as
+        # full frames resized to resize_width.
+        if not resize_width:
+            return resize_width
+
+        return max(1, round(resize_width * self.width / self.frame_width))
+
+    def get_mask(self, shape):
+        # The mask at the size of the analyzed frames, None without ignored pixels.
+        if self.mask is None:
+            return None
+
+        size = (shape[1], shape[0])
+        if size not in self.masks:
+            self.masks[size] = cv2.resize(
+                self.mask, size, interpolation=cv2.INTER_NEAREST
+            )
+
+        return self.masks[size]
+
+    def mask_frame(self, frame):
+        frame = self.crop(frame)
+        if self.mask is None:
+            return frame
+
+        return cv2.bitwise_and(frame, frame, mask=self.mask)
+
+    def mask_image(self, image):
+        # Same as mask_frame for the PIL images read back from the output directory.
+        image = image.crop(
+            (self.x, self.y, self.x + self.width, self.y + self.height)
+        )
+        if self.mask is None:
+            return image
+
+        black = Image.new(image.mode, image.size)
+        return Image.composite(image, black, Image.fromarray(self.mask))
+
+
+def parse_rect(rect, frame_width, frame_height):
+    # "x,y,w,h" in pixels, or in fractions of the frame size if they are all at most 1.
+    values = [float(value) for value in rect.split(",")]
+    if len(values) != 4:
+        raise ValueError(f"The ROI must be given as x,y,w,h, got {rect}")
+
+    if all(value <= 1 for value in values):
+        scale = (frame_width, frame_height, frame_width, frame_height)
+        values = [value * size for value, size in zip(values, scale)]
+
+    return [round(value) for value in values]
+
+
+def detect_moving_region(
+    cap,
+    num_samples=ROI_AUTO_SAMPLES,
+    gap_secs=ROI_AUTO_GAP_SECS,
+    resize_width=ROI_AUTO_WIDTH,
+    change_ratio=ROI_AUTO_CHANGE_RATIO,
+):
+    # Compares pairs of frames gap_secs apart, spread over the video. Slides change in
+    # few of them, a webcam, a ticker or a clock in most. Returns a mask of the
+    # rectangles that keep changing, at the analyzed size, or None.
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    gap = max(1, round(gap_secs * fps))
+    if num_frames <= gap:
+        return None
+
+    changes = None
+    num_pairs = 0
+    for frame_idx in np.linspace(0, num_frames - gap - 1, num_samples).astype(int):
+        pair = []
+        for pos in (frame_idx, frame_idx + gap):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(pos))
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame = resize_image_frame(frame, resize_width)
+            pair.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+
+        if len(pair) < 2:
+            continue
+
+        _, diff = cv2.threshold(cv2.absdiff(*pair), 25, 1, cv2.THRESH_BINARY)
+        changes = diff.astype(np.uint16) if changes is None else changes + diff
+        num_pairs += 1
+
+    if not num_pairs:
+        return None
+
+    moving = np.where(changes >= change_ratio * num_pairs, 255, 0).astype(np.uint8)
+
+    # Ignore the whole box around each moving area, not only the pixels that moved.
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    moving = cv2.dilate(moving, kernel)
+    contours, _ = cv2.findContours(moving, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+
+    mask = np.zeros_like(moving)
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        cv2.rectangle(mask, (x - 2, y - 2), (x + w + 1, y + h + 1), 255, -1)
+
+    return mask
+
+
+def load_roi(video_path, rect=None, ignore_mask_path=None, auto=False):
+    # Returns None if the whole frame is analyzed.
+    if rect is None and ignore_mask_path is None and not auto:
+        return None
+
+    cap = open_video_capture(video_path)
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    ignore_mask = None
+    if ignore_mask_path is not None:
+        ignore_mask = cv2.imread(ignore_mask_path, cv2.IMREAD_GRAYSCALE)
+        if ignore_mask is None:
+            cap.release()
+            raise ValueError(f"Unable to read the ignore mask {ignore_mask_path}")
+
+    if auto:
+        print("Scanning the video for regions that keep moving...")
+        moving = detect_moving_region(cap)
+        if moving is not None:
+            moving = cv2.resize(
+                moving, (frame_width, frame_height), interpolation=cv2.INTER_NEAREST
+            )
+            ignore_mask = moving if ignore_mask is None else np.maximum(
+                moving,
+                cv2.resize(
+                    ignore_mask,
+                    (frame_width, frame_height),
+                    interpolation=cv2.INTER_NEAREST,
+                ),
+            )
+    cap.release()
+
+    if rect is not None:
+        rect = parse_rect(rect, frame_width, frame_height)
+
+    roi = RegionOfInterest(frame_width, frame_height, rect, ignore_mask)
+    print("Analyzing", roi)
+
+    return roi
@@ -0,0 +1,142 @@
+import cv2
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from batch_hash import batch_hash, hamming_distances
+from config import HASH_FUNC_DICT, HASH_FUNC, HASH_SIZE, SEGMENT_WARMUP_FRAMES
+from bg_modeling import capture_slides_bg_modeling
+from frame_differencing import capture_slides_frame_diff
+
+
+def split_segments(num_frames, num_segments):
+    # Without a frame count, as with some streams, the video is processed in one pass.
+    if num_frames <= 0:
+        return [(0, None)]
+
+    segment_len = -(-num_frames // num_segments)
+    segments = []
+
+    for start_frame in range(0, num_frames, segment_len):
+        end_frame = min(start_frame + segment_len, num_frames)
+        segments.append((start_frame, end_frame))
+
+    return segments
+
+
+def capture_segment(
+    video_path, segment_dir_path, type_bgsub, start_frame, end_frame, kwargs
+):
+    os.makedirs(segment_dir_path, exist_ok=True)
+
+    if type_bgsub.lower() == "frame_diff":
+        return capture_slides_frame_diff(
+            video_path,
+            segment_dir_path,
+            start_frame=start_frame,
+            end_frame=end_frame,
+            **kwargs,
+        )
+
+    return capture_slides_bg_modeling(
+        video_path,
+        segment_dir_path,
+        type_bgsub=type_bgsub,
+        start_frame=start_frame,
+        end_frame=end_frame,
+        **kwargs,
+    )
+
+
+def is_boundary_duplicate(file_a, file_b, hash_size, hashfunc, threshold):
+    hash_a, hash_b = batch_hash(
+        [Image.open(file_a), Image.open(file_b)], hash_size, hashfunc
+    )
+
+    return hamming_distances(hash_a, hash_b) <= threshold
+
+
+def stitch_segments(
+    segment_slides, output_dir_path, hash_size, hashfunc, threshold
+):
+    screenshots_count = 0
+    slides = []
+    num_duplicates = 0
+
+    for seg_slides in segment_slides:
+        for i, (frame_idx, file_path) in enumerate(seg_slides):
+            # The warm-up overlap can capture the last slide of the previous segment again.
+            if i == 0 and slides and is_boundary_duplicate(
+                slides[-1][1], file_path, hash_size, hashfunc, threshold
+            ):
+                num_duplicates += 1
+                continue
+
+            screenshots_count += 1
+
+            filename = f"{screenshots_count:03}.jpg"
+            out_file_path = os.path.join(output_dir_path, filename)
+            os.replace(file_path, out_file_path)
+            slides.append((frame_idx, out_file_path))
+
+    print(f"Removed {num_duplicates} duplicates at segment boundaries")
+
+    return slides
+
+
+def capture_slides_parallel(
+    video_path,
+    output_dir_path,
+    type_bgsub,
+    num_segments,
+    warmup_frames=SEGMENT_WARMUP_FRAMES,
+    hash_size=HASH_SIZE,
+    hashfunc=HASH_FUNC_DICT[HASH_FUNC],
+    hash_threshold=4,
+    **kwargs,
+):
+    cap = cv2.VideoCapture(video_path)
+
+    if not cap.isOpened():
+        cap.release()
+        raise ValueError(f"Unable to open video file: {video_path}")
+
+    num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    segments = split_segments(num_frames, num_segments)
+    if segments[0][1] is None:
+        print("Unknown number of frames, processing the video sequentially...")
+    else:
+        print(f"Processing {len(segments)} segments in parallel...")
+    print("---" * 10)
+
+    with ProcessPoolExecutor(max_workers=len(segments)) as executor:
+        futures = []
+        for i, (start_frame, end_frame) in enumerate(segments):
+            segment_dir_path = os.path.join(output_dir_path, f".segment_{i:03}")
+            futures.append(
+                executor.submit(
+                    capture_segment,
+                    video_path,
+                    segment_dir_path,
+                    type_bgsub,
+                    start_frame,
+                    end_frame,
+                    dict(kwargs, warmup_frames=warmup_frames),
+                )
+            )
+
+        segment_slides = [future.result() for future in futures]
+
+    slides = stitch_segments(
+        segment_slides, output_dir_path, hash_size, hashfunc, hash_threshold
+    )
+
+    for i in range(len(segments)):
+        shutil.rmtree(os.path.join(output_dir_path, f".segment_{i:03}"))
+
+    print("Total Screenshots:", len(slides))
+    print("***" * 10, "\n")
+
+    return slides
@@ -0,0 +1,270 @@
+import cv2
+import hashlib
+import io
+import json
+import os
+import struct
+import threading
+import numpy as np
+from PIL import Image
+from batch_hash import HASH_METHODS, batch_hash
+from config import (
+    HASH_FUNC,
+    HASH_FUNC_DICT,
+    HASH_SIZE,
+    SLIDE_IMAGE_QUALITY,
+    SLIDE_STORE_FORMAT,
+)
+
+# Single file container for the slides of a run, instead of one image file per slide.
+# The file is a header followed by records, each a 1 byte tag and a 4 byte length:
+#   H  JSON header: image format, fps and the perceptual hash settings
+#   B  image blob: sha256 of the encoded image followed by the image
+#   E  JSON index entry: name, frame index, timestamp, perceptual hash and the offset
+#      and length of its blob
+# Blobs are content-addressed, a slide encoded to the same bytes as an earlier one only
+# adds an index entry. Records are only ever appended, a run that stops halfway leaves a
+# readable store of the slides written so far. Removing slides rewrites the file.
+
+STORE_EXT = ".slides"
+MAGIC = b"V2SSTORE1\n"
+RECORD_HEADER = struct.Struct("<cI")
+
+IMAGE_FORMATS = {
+    "jpg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, SLIDE_IMAGE_QUALITY]),
+    "webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, SLIDE_IMAGE_QUALITY]),
+    "png": (".png", [cv2.IMWRITE_PNG_COMPRESSION, 3]),
+}
+
+
+def get_store_path(output_dir_path):
+    return os.path.join(output_dir_path, os.path.basename(output_dir_path) + STORE_EXT)
+
+
+def find_store(output_dir_path):
+    # Path of the slide store in an output directory, None if the slides are loose files.
+    store_path = get_store_path(output_dir_path)
+    return store_path if os.path.isfile(store_path) else None
+
+
+def encode_image(frame, image_format="jpg"):
+    ext, params = IMAGE_FORMATS[image_format]
+    ret, data = cv2.imencode(ext, frame, params)
+    if not ret:
+        raise ValueError(f"Unable to encode the slide as {image_format}")
+
+    return data
+
+
+class SlideStore:
+    def __init__(
+        self,
+        path,
+        mode="r",
+        image_format=SLIDE_STORE_FORMAT,
+        fps=None,
+        hash_size=HASH_SIZE,
+        hashfunc=HASH_FUNC_DICT[HASH_FUNC],
+    ):
+        # mode "w" creates a new store, "r" opens an existing one, whose header then
+        # overrides the other arguments.
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Please choose {', '.join(IMAGE_FORMATS)} as image format")
+
+        self.path = path
+        self.header = dict(
+            image_format=image_format,
+            fps=fps,
+            hash_size=hash_size,
+            hash_func=HASH_METHODS[hashfunc],
+        )
+        self.entries = []
+        self.blobs = {}
+        self.lock = threading.Lock()
+
+        if mode == "w":
+            self.file = open(path, "w+b")
+            self.file.write(MAGIC)
+            self.write_record(b"H", json.dumps(self.header).encode())
+        else:
+            self.file = open(path, "r+b")
+            self.load()
+
+    @property
+    def image_format(self):
+        return self.header["image_format"]
+
+    @property
+    def hash_size(self):
+        return self.header["hash_size"]
+
+    @property
+    def hashfunc(self):
+        return HASH_FUNC_DICT[self.header["hash_func"]]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_record(self, tag, payload, prefix=b""):
+        # Returns the offset of the payload after the prefix.
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(RECORD_HEADER.pack(tag, len(prefix) + len(payload)))
+        self.file.write(prefix)
+        offset = self.file.tell()
+        self.file.write(payload)
+
+        return offset
+
+    def load(self):
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{self.path} is not a slide store")
+
+        # Only the record headers, digests and index entries are read, blobs are skipped.
+        file_size = os.fstat(self.file.fileno()).st_size
+        while True:
+            record_header = self.file.read(RECORD_HEADER.size)
+            if len(record_header) < RECORD_HEADER.size:
+                break
+
+            tag, length = RECORD_HEADER.unpack(record_header)
+            start = self.file.tell()
+            # A record cut short by an interrupted run is dropped.
+            if start + length > file_size:
+                break
+
+            if tag == b"B":
+                digest = self.file.read(32).hex()
+                self.blobs[digest] = (start + 32, length - 32)
+                self.file.seek(start + length)
+            elif tag == b"E":
+                self.entries.append(json.loads(self.file.read(length)))
+            elif tag == b"H":
+                self.header.update(json.loads(self.file.read(length)))
+            else:
+                self.file.seek(start + length)
+
+    def hash_data(self, data):
+        # The encoded image is hashed, like post-processing hashes the saved files.
+        with Image.open(io.BytesIO(data)) as image:
+            return batch_hash([image], self.hash_size, self.hashfunc)[0]
+
+    def encode(self, frame):
+        # Thread safe, the pipelined writers encode and hash on their worker threads.
+        data = encode_image(frame, self.image_format)
+        return data, self.hash_data(data)
+
+    def add(self, name, frame_idx, data, shape, comp_hash):
+        data = memoryview(data).cast("B")
+        digest = hashlib.sha256(data).digest()
+        fps = self.header["fps"]
+        timestamp = None
+        if fps and frame_idx is not None:
+            timestamp = round(frame_idx / fps, 3)
+
+        with self.lock:
+            # Identical images are stored once.
+            blob = self.blobs.get(digest.hex())
+            if blob is None:
+                blob = self.blobs[digest.hex()] = (
+                    self.write_record(b"B", data, digest),
+                    len(data),
+                )
+
+            entry = dict(
+                name=name,
+                frame_idx=frame_idx,
+                timestamp=timestamp,
+                hash=comp_hash.tobytes().hex(),
+                blob=digest.hex(),
+                offset=blob[0],
+                length=blob[1],
+                width=shape[1],
+                height=shape[0],
+            )
+            self.write_record(b"E", json.dumps(entry).encode())
+            self.entries.append(entry)
+
+        return entry
+
+    def add_frame(self, name, frame_idx, frame):
+        data, comp_hash = self.encode(frame)
+        return self.add(name, frame_idx, data, frame.shape, comp_hash)
+
+    def add_image_file(self, image_path, frame_idx=None):
+        # Loose slide files, kept as they are if they already have the store format.
+        frame = cv2.imread(image_path)
+        if os.path.splitext(image_path)[1].lower() == IMAGE_FORMATS[self.image_format][0]:
+            with open(image_path, "rb") as f:
+                data = f.read()
+        else:
+            data = encode_image(frame, self.image_format)
+
+        name = os.path.basename(image_path)
+        return self.add(name, frame_idx, data, frame.shape, self.hash_data(data))
+
+    def read(self, entry):
+        with self.lock:
+            self.file.seek(entry["offset"])
+            return self.file.read(entry["length"])
+
+    def read_image(self, entry):
+        return Image.open(io.BytesIO(self.read(entry)))
+
+    def get_hash(self, entry):
+        return np.frombuffer(bytes.fromhex(entry["hash"]), np.uint64)
+
+    def remove(self, names):
+        # Rewrites the store without the removed slides and the blobs only they used.
+        names = set(names)
+        entries = [entry for entry in self.entries if entry["name"] not in names]
+
+        tmp_path = self.path + ".part"
+        with SlideStore(
+            tmp_path,
+            "w",
+            self.image_format,
+            self.header["fps"],
+            self.hash_size,
+            self.hashfunc,
+        ) as store:
+            for entry in entries:
+                data = self.read(entry)
+                store.add(
+                    entry["name"],
+                    entry["frame_idx"],
+                    data,
+                    (entry["height"], entry["width"]),
+                    self.get_hash(entry),
+                )
+
+        self.file.close()
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, "r+b")
+        self.entries, self.blobs = [], {}
+        self.load()
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+        return self.path
+
+
+def pack_image_files(store, slides):
+    # Moves the [(frame_idx, path)] slides saved as files into the store.
+    for frame_idx, image_path in slides:
+        store.add_image_file(image_path, frame_idx)
+        os.remove(image_path)
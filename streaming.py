@@ -0,0 +1,112 @@
+import cv2
+import threading
+import time
+from instrumentation import add_time
+
+# Downloads that are still being written to disk, keyed by file path.
+# Capture engines opening one of these paths get a ProgressiveVideoCapture,
+# which waits at the end of the file for more bytes instead of stopping.
+_active_downloads = {}
+_lock = threading.Lock()
+
+
+class StreamingDownload:
+    def __init__(self, path):
+        self.path = path
+        self.bytes_written = 0
+        self.error = None
+        self.finished = threading.Event()
+
+    def start(self, write_chunks):
+        with _lock:
+            _active_downloads[self.path] = self
+
+        self.thread = threading.Thread(
+            target=self._run, args=(write_chunks,), daemon=True
+        )
+        self.thread.start()
+
+    def _run(self, write_chunks):
+        start = time.perf_counter()
+        try:
+            for num_bytes in write_chunks():
+                self.bytes_written += num_bytes
+        except Exception as e:
+            self.error = e
+            print("An error occurred while downloading the video:", str(e))
+        finally:
+            add_time("download", time.perf_counter() - start)
+            with _lock:
+                _active_downloads.pop(self.path, None)
+            self.finished.set()
+
+    def wait(self, timeout=None):
+        self.finished.wait(timeout)
+        return self.error is None
+
+
+def get_active_download(path):
+    with _lock:
+        return _active_downloads.get(path)
+
+
+class ProgressiveVideoCapture:
+    def __init__(self, download, poll_interval=0.5):
+        self.download = download
+        self.poll_interval = poll_interval
+        self.pos = 0
+        self.synced = False
+        self.cap = cv2.VideoCapture(download.path)
+
+        # The container header may not have arrived yet.
+        while not self.cap.isOpened() and not self.download.finished.is_set():
+            time.sleep(self.poll_interval)
+            self.cap = cv2.VideoCapture(download.path)
+
+    def _reopen(self):
+        # Reopen the file to pick up the bytes written since it was opened,
+        # then seek back to the next frame to read.
+        self.cap.release()
+        self.cap = cv2.VideoCapture(self.download.path)
+        if self.pos > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.pos)
+
+    def _next(self, read):
+        while True:
+            done = self.download.finished.is_set()
+            result = read(self.cap)
+            ret = result[0] if isinstance(result, tuple) else result
+
+            if ret:
+                self.pos += 1
+                return result
+
+            # Only give up once the file has been reopened after the download finished,
+            # the last chunk may have been written after the file was opened.
+            if done and self.synced:
+                return result
+
+            if not done:
+                time.sleep(self.poll_interval)
+            self.synced = done
+            self._reopen()
+
+    def read(self, image=None):
+        return self._next(lambda cap: cap.read(image))
+
+    def grab(self):
+        return self._next(lambda cap: cap.grab())
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop_id):
+        return self.cap.get(prop_id)
+
+    def set(self, prop_id, value):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            self.pos = int(value)
+        return self.cap.set(prop_id, value)
+
+    def release(self):
+        self.cap.release()
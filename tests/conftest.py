@@ -0,0 +1,25 @@
+import http.server
+import os
+import sys
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def serve():
+    # Serves requests with the given handler class on a local port, returns its url.
+    servers = []
+
+    def start(handler_class):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/video.mp4"
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
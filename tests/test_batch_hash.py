@@ -0,0 +1,54 @@
+import imagehash
+import numpy as np
+import pytest
+from PIL import Image
+from batch_hash import batch_hash, hamming_distances, to_image_hash
+
+HASH_FUNCS = [imagehash.dhash, imagehash.phash, imagehash.average_hash]
+
+
+def make_images():
+    # Noise, smooth gradients and flat images, at several sizes and in color or gray.
+    rng = np.random.default_rng(0)
+    images = []
+    for height, width in [(48, 64), (120, 160), (37, 91)]:
+        images.append(Image.fromarray(rng.integers(0, 256, (height, width, 3), np.uint8)))
+        images.append(Image.fromarray(rng.integers(0, 256, (height, width), np.uint8)))
+
+        gradient = np.linspace(0, 255, width, dtype=np.uint8)[None].repeat(height, 0)
+        images.append(Image.fromarray(gradient))
+        images.append(Image.fromarray(np.full((height, width, 3), 128, np.uint8)))
+
+    # Slightly different versions of the same image, which should be near duplicates.
+    base = rng.integers(0, 256, (15, 20, 3), np.uint8).repeat(8, 0).repeat(8, 1)
+    for i in range(4):
+        noisy = base.astype(int) + rng.integers(-10 * i, 10 * i + 1, base.shape)
+        images.append(Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8)))
+
+    return images
+
+
+@pytest.fixture(scope="module")
+def images():
+    return make_images()
+
+
+@pytest.mark.parametrize("hashfunc", HASH_FUNCS)
+@pytest.mark.parametrize("hash_size", [8, 16])
+def test_batch_hash_matches_imagehash(images, hashfunc, hash_size):
+    hashes = batch_hash(images, hash_size, hashfunc)
+    ref_hashes = [hashfunc(image, hash_size=hash_size) for image in images]
+
+    assert [to_image_hash(packed, hash_size) for packed in hashes] == ref_hashes
+
+
+@pytest.mark.parametrize("hashfunc", HASH_FUNCS)
+@pytest.mark.parametrize("hash_size", [8, 16])
+def test_hamming_distances_match_imagehash(images, hashfunc, hash_size):
+    hashes = batch_hash(images, hash_size, hashfunc)
+    ref_hashes = [hashfunc(image, hash_size=hash_size) for image in images]
+
+    for i, ref_hash in enumerate(ref_hashes):
+        assert hamming_distances(hashes[i], hashes).tolist() == [
+            ref_hash - other for other in ref_hashes
+        ]
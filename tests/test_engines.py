@@ -0,0 +1,89 @@
+import cv2
+import numpy as np
+import pytest
+from api import iter_slides
+from bg_modeling import capture_slides_bg_modeling
+from config import DIST_THRESH, FRAME_BUFFER_HISTORY, MAX_PERCENT, MIN_PERCENT
+from ensemble import capture_slides_ensemble
+from frame_differencing import capture_slides_frame_diff
+from replay import replay_slides
+from segment_parallel import capture_slides_parallel
+from two_pass import capture_slides_two_pass
+
+NUM_FRAMES = 120
+BG_KWARGS = dict(
+    history=FRAME_BUFFER_HISTORY,
+    threshold=DIST_THRESH,
+    MIN_PERCENT_THRESH=MIN_PERCENT,
+    MAX_PERCENT_THRESH=MAX_PERCENT,
+)
+
+
+def make_video(video_path):
+    # A few static slides, each a different pattern.
+    writer = cv2.VideoWriter(
+        str(video_path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (160, 120)
+    )
+    rng = np.random.default_rng(0)
+    for i in range(NUM_FRAMES):
+        if i % 30 == 0:
+            slide = rng.integers(0, 256, (12, 16, 3), np.uint8).repeat(10, 0).repeat(10, 1)
+        writer.write(slide)
+    writer.release()
+
+
+@pytest.fixture
+def video(tmp_path):
+    video_path = tmp_path / "video.avi"
+    make_video(video_path)
+    return str(video_path)
+
+
+@pytest.mark.parametrize(
+    "capture",
+    [
+        lambda path, out: capture_slides_frame_diff(path, out),
+        lambda path, out: capture_slides_bg_modeling(path, out, "KNN", **BG_KWARGS),
+        lambda path, out: capture_slides_ensemble(path, {"KNN": out}),
+        lambda path, out: capture_slides_two_pass(path, out, "Frame_Diff"),
+        lambda path, out: capture_slides_parallel(path, out, "Frame_Diff", 2),
+        lambda path, out: replay_slides(
+            path,
+            out,
+            np.zeros(1),
+            dict(engine="frame_diff", first_frame=1, frame_stride=1, num_values=1),
+        ),
+    ],
+)
+def test_unopenable_video_raises(capture, tmp_path):
+    with pytest.raises(ValueError, match="Unable to open video file"):
+        capture(str(tmp_path / "missing.mp4"), str(tmp_path))
+
+
+@pytest.mark.parametrize("frame_stride", [1, 5])
+def test_api_yields_the_engine_slides(video, tmp_path, frame_stride):
+    frame_diff = capture_slides_frame_diff(
+        video, str(tmp_path), frame_stride=frame_stride
+    )
+    knn = capture_slides_bg_modeling(
+        video, str(tmp_path), "KNN", frame_stride=frame_stride, **BG_KWARGS
+    )
+
+    for engine_slides, type_bgsub in ((frame_diff, "Frame_Diff"), (knn, "KNN")):
+        detector_kwargs = dict(resize_width=None) if type_bgsub == "Frame_Diff" else {}
+        slides = list(
+            iter_slides(
+                video,
+                type_bgsub,
+                analysis_fps=None,
+                frame_stride=frame_stride,
+                dedup=False,
+                **detector_kwargs,
+            )
+        )
+        assert [slide.frame_idx for slide in slides] == [
+            frame_idx for frame_idx, _ in engine_slides
+        ]
+        # Every yielded frame is its own copy.
+        assert len({id(slide.image) for slide in slides}) == len(slides)
+        assert all(slide.image.shape == (120, 160, 3) for slide in slides)
@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+import pytest
+import instrumentation
+from bg_modeling import capture_slides_bg_modeling
+from config import DIST_THRESH, FRAME_BUFFER_HISTORY, MAX_PERCENT, MIN_PERCENT
+from ensemble import capture_slides_ensemble
+
+NUM_FRAMES = 120
+FRAME_STRIDE = 5
+
+
+def make_video(video_path):
+    # A few static slides, each a different pattern.
+    writer = cv2.VideoWriter(
+        str(video_path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (160, 120)
+    )
+    rng = np.random.default_rng(0)
+    for i in range(NUM_FRAMES):
+        if i % 30 == 0:
+            slide = rng.integers(0, 256, (12, 16, 3), np.uint8).repeat(10, 0).repeat(10, 1)
+        writer.write(slide)
+    writer.release()
+
+
+@pytest.fixture
+def video(tmp_path):
+    video_path = tmp_path / "video.avi"
+    make_video(video_path)
+    return str(video_path)
+
+
+def count_decoded_frames(func, *args, **kwargs):
+    instrumentation.enable()
+    try:
+        slides = func(*args, **kwargs)
+        report = instrumentation.profiler.get_report()
+    finally:
+        instrumentation.disable()
+
+    return report["timers"]["decode"]["calls"], slides
+
+
+def test_ensemble_decodes_like_a_single_engine(video, tmp_path):
+    engine_dir = tmp_path / "KNN"
+    engine_dir.mkdir()
+    engine_decoded, engine_slides = count_decoded_frames(
+        capture_slides_bg_modeling,
+        video,
+        str(engine_dir),
+        "KNN",
+        FRAME_BUFFER_HISTORY,
+        DIST_THRESH,
+        MIN_PERCENT,
+        MAX_PERCENT,
+        frame_stride=FRAME_STRIDE,
+    )
+
+    output_dir_paths = {}
+    for name in ("Frame_Diff", "GMG", "KNN"):
+        output_dir_paths[name] = str(tmp_path / "ensemble" / name)
+        (tmp_path / "ensemble" / name).mkdir(parents=True)
+    ensemble_decoded, ensemble_slides = count_decoded_frames(
+        capture_slides_ensemble, video, output_dir_paths, frame_stride=FRAME_STRIDE
+    )
+
+    assert engine_decoded == NUM_FRAMES // FRAME_STRIDE
+    assert ensemble_decoded == engine_decoded
+    assert [frame_idx for frame_idx, _ in ensemble_slides["KNN"]] == [
+        frame_idx for frame_idx, _ in engine_slides
+    ]
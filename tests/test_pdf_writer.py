@@ -0,0 +1,84 @@
+import os
+import cv2
+import img2pdf
+import numpy as np
+import pikepdf
+import pytest
+from pdf_writer import PDFWriter
+
+SIZES = [(160, 120), (64, 48), (37, 91)]
+
+
+@pytest.fixture
+def image_paths(tmp_path):
+    # Color JPEGs of different sizes and a grayscale one.
+    rng = np.random.default_rng(0)
+    paths = []
+    for i, (width, height) in enumerate(SIZES):
+        image_path = str(tmp_path / f"{i + 1:03}.jpg")
+        cv2.imwrite(image_path, rng.integers(0, 256, (height, width, 3), np.uint8))
+        paths.append(image_path)
+
+    image_path = str(tmp_path / "gray.jpg")
+    cv2.imwrite(image_path, rng.integers(0, 256, (48, 64), np.uint8))
+    paths.append(image_path)
+
+    return paths
+
+
+def open_pdf(pdf_path):
+    # A wrong cross-reference table fails instead of being rebuilt.
+    return pikepdf.open(pdf_path, attempt_recovery=False)
+
+
+def get_media_boxes(pdf_path):
+    with open_pdf(pdf_path) as pdf:
+        assert pdf.check_pdf_syntax() == []
+        return [[float(v) for v in page.mediabox] for page in pdf.pages]
+
+
+def test_pages_match_img2pdf(image_paths, tmp_path):
+    pdf_path = str(tmp_path / "slides.pdf")
+    writer = PDFWriter(pdf_path)
+    for image_path in image_paths[:-1]:
+        writer.add_jpeg_file(image_path)
+
+    # Pages added from the encoded frames of a capture.
+    with open(image_paths[-1], "rb") as f:
+        writer.add_page(f.read(), 64, 48, "/DeviceGray")
+
+    assert writer.close() == pdf_path
+    assert not os.path.exists(pdf_path + ".part")
+
+    ref_path = str(tmp_path / "ref.pdf")
+    with open(ref_path, "wb") as f:
+        f.write(img2pdf.convert(image_paths))
+
+    media_boxes = get_media_boxes(pdf_path)
+    assert len(media_boxes) == len(image_paths)
+    assert media_boxes == get_media_boxes(ref_path)
+
+    with open_pdf(pdf_path) as pdf:
+        for page, image_path in zip(pdf.pages, image_paths):
+            image = page.Resources.XObject.Im0
+            height, width = cv2.imread(image_path, cv2.IMREAD_UNCHANGED).shape[:2]
+            assert (image.Width, image.Height) == (width, height)
+            with open(image_path, "rb") as f:
+                assert image.read_raw_bytes() == f.read()
+
+
+def test_empty_pdf(tmp_path):
+    pdf_path = str(tmp_path / "slides.pdf")
+    PDFWriter(pdf_path).close()
+
+    assert get_media_boxes(pdf_path) == []
+
+
+def test_abort_leaves_no_file(image_paths, tmp_path):
+    pdf_path = str(tmp_path / "slides.pdf")
+    writer = PDFWriter(pdf_path)
+    writer.add_jpeg_file(image_paths[0])
+    writer.abort()
+
+    assert not os.path.exists(pdf_path)
+    assert not os.path.exists(pdf_path + ".part")
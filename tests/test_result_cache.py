@@ -0,0 +1,49 @@
+import os
+import time
+from result_cache import ResultCache
+
+MB = 1024 * 1024
+
+
+def write_file(file_path, size):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as f:
+        f.write(b"\0" * size)
+
+
+def put_result(cache, key, tmp_path, size):
+    output_dir_path = tmp_path / key
+    write_file(str(output_dir_path / "slides.pdf"), size)
+    cache.put(key, str(output_dir_path))
+
+
+def test_signals_are_evicted_with_the_results(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_size_mb=1)
+
+    signal_path = cache.get_signal_path("old")
+    write_file(signal_path, MB // 2)
+    write_file(os.path.splitext(signal_path)[0] + ".json", 10)
+    time.sleep(0.05)
+
+    # The oldest entry is a signal, it is evicted first.
+    put_result(cache, "result", tmp_path, MB // 2 + 100)
+    assert not os.path.exists(signal_path)
+    assert os.listdir(os.path.dirname(signal_path)) == []
+    assert cache.get("result", str(tmp_path))
+
+
+def test_signals_count_as_used_when_looked_up(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_size_mb=1)
+
+    signal_path = cache.get_signal_path("signal")
+    write_file(signal_path, MB // 2)
+    time.sleep(0.05)
+    put_result(cache, "old", tmp_path, MB // 4)
+    time.sleep(0.05)
+
+    # Looking up the signal again makes the result the least recently used entry.
+    assert cache.get_signal_path("signal") == signal_path
+    time.sleep(0.05)
+    put_result(cache, "new", tmp_path, MB // 4 + 100)
+    assert os.path.exists(signal_path)
+    assert not os.path.exists(os.path.join(cache.cache_dir, "old"))
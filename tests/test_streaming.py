@@ -0,0 +1,101 @@
+import http.server
+import time
+import cv2
+import numpy as np
+import pytest
+import download_video
+import streaming
+from download_video import download_video_from_url
+from utils import open_video_capture
+
+NUM_FRAMES = 40
+NUM_CHUNKS = 8
+
+
+def make_video(video_path):
+    # Motion JPEG in AVI, a partial file is readable up to its last complete frame.
+    writer = cv2.VideoWriter(
+        str(video_path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48)
+    )
+    for i in range(NUM_FRAMES):
+        writer.write(np.full((48, 64, 3), i * 5, np.uint8))
+    writer.release()
+
+
+def read_all(cap):
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+
+    return frames
+
+
+def make_handler(data):
+    # Sends the video slowly in a few chunks, like a download outpaced by the capture.
+    class SlowHandler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "video/x-msvideo")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+
+            chunk_size = -(-len(data) // NUM_CHUNKS)
+            for start in range(0, len(data), chunk_size):
+                self.wfile.write(data[start : start + chunk_size])
+                self.wfile.flush()
+                time.sleep(0.25)
+
+    return SlowHandler
+
+
+@pytest.fixture
+def video(tmp_path):
+    video_path = tmp_path / "video.avi"
+    make_video(video_path)
+    return video_path
+
+
+def test_progressive_capture_reads_growing_file(serve, video, tmp_path, monkeypatch):
+    monkeypatch.setattr(download_video, "DOWNLOAD_CHUNK_SIZE", 1024)
+
+    # Record the position of every reopen, those at a temporary end of file seek back
+    # to the middle of the video.
+    reopens = []
+    reopen = streaming.ProgressiveVideoCapture._reopen
+
+    def recording_reopen(self):
+        reopens.append(self.pos)
+        reopen(self)
+
+    monkeypatch.setattr(streaming.ProgressiveVideoCapture, "_reopen", recording_reopen)
+
+    url = serve(make_handler(video.read_bytes()))
+    video_path = download_video_from_url(
+        url, str(tmp_path / "downloads"), progressive=True
+    )
+    download = streaming.get_active_download(video_path)
+    assert download is not None
+
+    cap = open_video_capture(video_path)
+    assert isinstance(cap, streaming.ProgressiveVideoCapture)
+    frames = read_all(cap)
+    assert download.wait()
+
+    expected = read_all(cv2.VideoCapture(str(video)))
+    assert len(expected) == NUM_FRAMES
+    assert len(frames) == len(expected)
+    assert all(np.array_equal(a, b) for a, b in zip(frames, expected))
+    assert any(0 < pos < NUM_FRAMES for pos in reopens)
+
+
+def test_finished_download_uses_regular_capture(video):
+    cap = open_video_capture(str(video))
+    assert not isinstance(cap, streaming.ProgressiveVideoCapture)
+    assert len(read_all(cap)) == NUM_FRAMES
@@ -0,0 +1,164 @@
+import cv2
+import os
+import shutil
+from config import (
+    COARSE_ANALYSIS_FPS,
+    COARSE_MARGIN_FRAMES,
+    COARSE_RESIZE_WIDTH,
+    FRAME_DIFF_ELAPSED_FRAMES,
+    FRAME_DIFF_MIN_PERCENT,
+    HASH_FUNC_DICT,
+    HASH_FUNC,
+    HASH_SIZE,
+)
+from frame_differencing import get_diff_percent, get_kernel_size, preprocess_frame
+from pipeline import create_frame_reader
+from progress import ProgressBar
+from segment_parallel import capture_segment, stitch_segments
+from utils import BufferPool, get_frame_stride, open_video_capture
+
+# Slides are static most of the time, so a cheap scan at low resolution and low
+# frame rate is enough to find where they change. The regular capture engines then
+# only run, at full rate and resolution, inside the windows around those changes.
+
+
+def scan_transitions(
+    video_path,
+    analysis_fps=COARSE_ANALYSIS_FPS,
+    resize_width=COARSE_RESIZE_WIDTH,
+    MIN_PERCENT_THRESH=FRAME_DIFF_MIN_PERCENT,
+    roi=None,
+):
+    cap = open_video_capture(video_path)
+
+    if not cap.isOpened():
+        cap.release()
+        raise ValueError(f"Unable to open video file: {video_path}")
+
+    frame_stride = get_frame_stride(cap, analysis_fps)
+    num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    mask = None
+    if roi is not None:
+        frame_width = roi.width
+        resize_width = roi.scale_width(resize_width)
+    kernel_size = get_kernel_size(frame_width, resize_width)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+
+    print(f"Scanning every {frame_stride} frames for slide transitions...")
+    prog_bar = ProgressBar(total=num_frames)
+    reader = create_frame_reader(cap, frame_stride)
+
+    # Frame indices of the samples that differ from the previous sample.
+    change_frames = []
+    prev_frame = None
+    buffers = BufferPool()
+    gray_names = ["gray0", "gray1"]
+    frame_idx = -frame_stride
+
+    while True:
+        ret, frame = reader.read()
+        if not ret:
+            break
+
+        frame_idx += frame_stride
+        curr_frame = preprocess_frame(frame, resize_width, roi, buffers, gray_names[0])
+        gray_names.reverse()
+        if roi is not None:
+            mask = roi.get_mask(curr_frame.shape)
+
+        if prev_frame is not None:
+            p_non_zero = get_diff_percent(
+                curr_frame, prev_frame, kernel, mask, buffers
+            )
+            if p_non_zero >= MIN_PERCENT_THRESH:
+                change_frames.append(frame_idx)
+
+        prev_frame = curr_frame
+        prog_bar.update(frame_stride)
+
+    reader.release()
+    prog_bar.close()
+    cap.release()
+
+    return change_frames, frame_stride, max(num_frames, frame_idx + 1)
+
+
+def get_refine_windows(
+    change_frames, frame_stride, num_frames, settle_frames, margin_frames
+):
+    # The change happened somewhere between the previous sample and this one,
+    # the capture engines then need settle_frames more to pick the settled frame.
+    # The 1st window always covers the start of the video, where the 1st slide is.
+    windows = [(0, min(num_frames, settle_frames + margin_frames))]
+
+    for frame_idx in change_frames:
+        start_frame = max(0, frame_idx - frame_stride - margin_frames)
+        end_frame = min(num_frames, frame_idx + settle_frames + margin_frames)
+
+        # Merge overlapping windows, so an animation spanning several samples
+        # is refined in one go.
+        if start_frame <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end_frame))
+        else:
+            windows.append((start_frame, end_frame))
+
+    return windows
+
+
+def capture_slides_two_pass(
+    video_path,
+    output_dir_path,
+    type_bgsub,
+    coarse_fps=COARSE_ANALYSIS_FPS,
+    coarse_width=COARSE_RESIZE_WIDTH,
+    margin_frames=COARSE_MARGIN_FRAMES,
+    hash_size=HASH_SIZE,
+    hashfunc=HASH_FUNC_DICT[HASH_FUNC],
+    hash_threshold=4,
+    **kwargs,
+):
+    change_frames, frame_stride, num_frames = scan_transitions(
+        video_path, coarse_fps, coarse_width, roi=kwargs.get("roi")
+    )
+
+    # Number of frames the capture engine needs after a change to capture the slide.
+    if type_bgsub.lower() == "frame_diff":
+        settle_frames = kwargs.get("ELAPSED_FRAME_THRESH", FRAME_DIFF_ELAPSED_FRAMES)
+    else:
+        settle_frames = kwargs["history"]
+
+    windows = get_refine_windows(
+        change_frames, frame_stride, num_frames, settle_frames, margin_frames
+    )
+    num_refined = sum(end_frame - start_frame for start_frame, end_frame in windows)
+    print(
+        f"Refining {len(windows)} windows, {num_refined} of {num_frames} frames..."
+    )
+    print("---" * 10)
+
+    # Every window primes the detector state on the frames just before it.
+    kwargs.setdefault("warmup_frames", margin_frames)
+
+    window_slides = []
+    for i, (start_frame, end_frame) in enumerate(windows):
+        window_dir_path = os.path.join(output_dir_path, f".window_{i:03}")
+        window_slides.append(
+            capture_segment(
+                video_path, window_dir_path, type_bgsub, start_frame, end_frame, kwargs
+            )
+        )
+
+    # Consecutive windows can capture the same slide, once at the end of a window
+    # and once while the next one warms up.
+    slides = stitch_segments(
+        window_slides, output_dir_path, hash_size, hashfunc, hash_threshold
+    )
+
+    for i in range(len(windows)):
+        shutil.rmtree(os.path.join(output_dir_path, f".window_{i:03}"))
+
+    print("Total Screenshots:", len(slides))
+    print("***" * 10, "\n")
+
+    return slides
@@ -3,7 +3,12 @@ import re
 import cv2
 import shutil
 import img2pdf
+import numpy as np
 from imutils import paths
+from instrumentation import timed
+from pdf_writer import PDFWriter, is_streamable
+from slide_store import SlideStore, find_store
+from streaming import ProgressiveVideoCapture, get_active_download
 
 # PIL can also be used to convert the image set into PDFs.
 # However, using PIL requires opening each of the images in the set.
@@ -19,22 +24,95 @@ def sanitize_file_name(string):
     return sanitized_string
 
 
-def resize_image_frame(frame, resize_width):
-    ht, wd, _ = frame.shape
-    new_height = resize_width * ht / wd
-    frame = cv2.resize(
-        frame, (resize_width, int(new_height)), interpolation=cv2.INTER_AREA
+class BufferPool:
+    # Images reused from one frame to the next instead of being allocated for every frame.
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = self.buffers[name] = np.empty(shape, dtype)
+
+        return buffer
+
+
+def resize_image_frame(
+    frame, resize_width, interpolation=cv2.INTER_AREA, buffers=None, name="resized"
+):
+    ht, wd = frame.shape[:2]
+    new_height = int(resize_width * ht / wd)
+
+    dst = None
+    if buffers is not None:
+        dst = buffers.get(name, (new_height, resize_width) + frame.shape[2:])
+
+    frame = timed(
+        "resize",
+        cv2.resize,
+        frame,
+        (resize_width, new_height),
+        dst=dst,
+        interpolation=interpolation,
     )
 
     return frame
 
 
-def create_output_directory(video_path, output_path, type_bgsub):
+def open_video_capture(video_path):
+    # Files that are still downloading are read progressively.
+    download = get_active_download(video_path)
+    if download is not None:
+        return ProgressiveVideoCapture(download)
+
+    return cv2.VideoCapture(video_path)
+
+
+def get_frame_stride(cap, analysis_fps=None, frame_stride=1):
+    # Derive the stride from the requested analysis rate if the video reports its fps.
+    if analysis_fps:
+        video_fps = cap.get(cv2.CAP_PROP_FPS)
+        if video_fps > 0:
+            frame_stride = round(video_fps / analysis_fps)
+
+    return max(1, int(frame_stride))
+
+
+def scale_frame_count(num_frames, frame_stride):
+    # Convert a duration expressed in video frames into analyzed frames.
+    return max(1, round(num_frames / frame_stride))
+
+
+def read_frame(cap, frame_stride=1, image=None):
+    # Skipped frames are only grabbed, so they are never retrieved or converted.
+    # The frame is decoded into image if it is given and has the right size.
+    for _ in range(frame_stride - 1):
+        if not timed("grab", cap.grab):
+            return False, None
+
+    return timed("decode", cap.read, image)
+
+
+def seek_video(cap, start_frame=0, warmup_frames=0):
+    # Start a few frames early so that the detector state is primed at start_frame.
+    seek_frame = max(0, start_frame - warmup_frames)
+    if seek_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, seek_frame)
+
+    return seek_frame
+
+
+def get_output_directory(video_path, output_path, type_bgsub):
     vid_file_name = video_path.rsplit(os.sep)[-1].split(".")[0]
-    output_dir_path = os.path.join(output_path, vid_file_name, type_bgsub)
+    return os.path.join(output_path, vid_file_name, type_bgsub)
+
+
+def create_output_directory(video_path, output_path, type_bgsub, clean=True):
+    output_dir_path = get_output_directory(video_path, output_path, type_bgsub)
 
     # Remove the output directory if there is already one.
-    if os.path.exists(output_dir_path):
+    # A resumed run keeps it, it holds the checkpoint and the slides saved so far.
+    if clean and os.path.exists(output_dir_path):
         shutil.rmtree(output_dir_path)
 
     # Create output directory.
@@ -57,10 +135,55 @@ def convert_slides_to_pdf(img_dir, output_path=None):
         print("Output PDF Path:", output_path)
 
     print("Converting captured slide images to PDF...")
-    with open(output_path, "wb") as f:
-        f.write(img2pdf.convert(sorted(paths.list_images(img_dir))))
+    store_path = find_store(img_dir)
+    if store_path is not None:
+        if convert_store_to_pdf(store_path, output_path) is None:
+            return
+    else:
+        image_paths = sorted(paths.list_images(img_dir))
+        if not image_paths:
+            print("No slides to convert to PDF!")
+            return
+
+        # JPEG images are written one page at a time, img2pdf builds the whole PDF
+        # in memory.
+        if all(is_streamable(image_path) for image_path in image_paths):
+            pdf_writer = PDFWriter(output_path)
+            for image_path in image_paths:
+                timed("pdf_assembly", pdf_writer.add_jpeg_file, image_path)
+            pdf_writer.close()
+        else:
+            with open(output_path, "wb") as f:
+                f.write(timed("pdf_assembly", img2pdf.convert, image_paths))
 
     print("PDF Created!")
     print("***" * 10, "\n")
 
     return output_path
+
+
+def convert_store_to_pdf(store_path, output_path):
+    # The images are embedded straight from the slide store, without listing or opening
+    # any file.
+    with SlideStore(store_path) as store:
+        if len(store) == 0:
+            print("No slides to convert to PDF!")
+            return
+
+        if store.image_format == "jpg":
+            pdf_writer = PDFWriter(output_path)
+            for entry in store:
+                timed(
+                    "pdf_assembly",
+                    pdf_writer.add_page,
+                    store.read(entry),
+                    entry["width"],
+                    entry["height"],
+                )
+            pdf_writer.close()
+        else:
+            images = [store.read(entry) for entry in store]
+            with open(output_path, "wb") as f:
+                f.write(timed("pdf_assembly", img2pdf.convert, images))
+
+    return output_path
@@ -1,21 +1,46 @@
 import argparse
+import cv2
 import os
 import validators
+import instrumentation
 from config import *
 from download_video import download_video
+from ensemble import VOTE_DIR, capture_slides_ensemble
+from checkpoint import get_checkpoint_path, has_checkpoint
 from bg_modeling import capture_slides_bg_modeling
 from frame_differencing import capture_slides_frame_diff
-from post_process import remove_duplicates
-from utils import create_output_directory, convert_slides_to_pdf
+from keyframe_scan import capture_slides_keyframes
+from motion_signal import load_motion_signal
+from post_process import SlideDeduplicator, remove_duplicates
+from replay import replay_slides
+from roi import load_roi
+from result_cache import ResultCache, make_cache_key
+from segment_parallel import capture_slides_parallel
+from slide_store import IMAGE_FORMATS, SlideStore, get_store_path, pack_image_files
+from streaming import get_active_download
+from two_pass import capture_slides_two_pass
+from utils import convert_slides_to_pdf, create_output_directory, get_output_directory
 
 
-if __name__ == "__main__":
+def build_parser():
     parser = argparse.ArgumentParser(
         description="This script is used to convert video frames into slide PDFs."
     )
     parser.add_argument(
         "-v", "--video_path", help="Path to the video file, video url, or YouTube video link", type=str
     )
+    parser.add_argument(
+        "--progressive-download",
+        action="store_true",
+        default=False,
+        help="flag to start extracting slides while a video url is still downloading",
+    )
+    parser.add_argument(
+        "--connections",
+        help="Number of concurrent byte range requests used to download a video url",
+        default=DOWNLOAD_CONNECTIONS,
+        type=int,
+    )
     parser.add_argument(
         "-o",
         "--out_dir",
@@ -27,9 +52,109 @@ if __name__ == "__main__":
         "--type",
         help="type of background subtraction to be used",
         default="GMG",
-        choices=["Frame_Diff", "GMG", "KNN"],
+        choices=["Frame_Diff", "GMG", "KNN", "Keyframe", "Ensemble"],
+        type=str,
+    )
+    parser.add_argument(
+        "--detectors",
+        help="Comma separated detectors run on a single decode of the video with --type Ensemble, each saving its slides like a run with its own --type",
+        default=ENSEMBLE_DETECTORS,
         type=str,
     )
+    parser.add_argument(
+        "--vote",
+        help="With --type Ensemble, also save the slides captured by at least N detectors within ENSEMBLE_VOTE_WINDOW seconds. 0 to only save the slides of each detector",
+        default=0,
+        type=int,
+    )
+    parser.add_argument(
+        "--analysis-fps",
+        help="Number of frames per second to analyze. Skipped frames are grabbed without being decoded. Overrides --frame-stride",
+        default=ANALYSIS_FPS,
+        type=float,
+    )
+    parser.add_argument(
+        "--frame-stride",
+        help="Analyze every N-th frame of the video",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--resize-width",
+        help="Width of the frames analyzed by frame differencing, 0 to analyze at full resolution",
+        default=FRAME_DIFF_RESIZE_WIDTH,
+        type=int,
+    )
+    parser.add_argument(
+        "--frame-diff-min-percent",
+        help="Percentage of changed pixels between frames detected as motion by frame differencing",
+        default=FRAME_DIFF_MIN_PERCENT,
+        type=float,
+    )
+    parser.add_argument(
+        "--frame-diff-elapsed-frames",
+        help="Number of frames frame differencing waits after motion starts before capturing the slide",
+        default=FRAME_DIFF_ELAPSED_FRAMES,
+        type=int,
+    )
+    parser.add_argument(
+        "--min-percent",
+        help="Percentage of foreground pixels over which GMG and KNN detect motion, to capture the next slide",
+        default=MIN_PERCENT,
+        type=float,
+    )
+    parser.add_argument(
+        "--max-percent",
+        help="Percentage of foreground pixels under which GMG and KNN consider motion to have stopped, capturing the slide",
+        default=MAX_PERCENT,
+        type=float,
+    )
+    parser.add_argument(
+        "--roi",
+        help="Only analyze and hash the x,y,w,h rectangle of the frames, in pixels or in fractions of the frame size",
+        type=str,
+    )
+    parser.add_argument(
+        "--ignore-mask",
+        help="Path to an image, scaled to the frame size, whose non-zero pixels are left out of the analysis and hashing",
+        type=str,
+    )
+    parser.add_argument(
+        "--auto-roi",
+        action="store_true",
+        default=False,
+        help="flag to pre-scan the video and ignore the regions that keep moving, like a webcam, a ticker or a clock",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        default=False,
+        help="flag to decode, analyze and encode frames on separate threads",
+    )
+    parser.add_argument(
+        "--segments",
+        help="Split the video into N time segments processed in parallel worker processes",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--two-pass",
+        action="store_true",
+        default=False,
+        help="flag to scan the video at low resolution and frame rate first, then only analyze the windows around slide transitions at full rate",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="flag to resume an interrupted run from its last checkpoint in the output directory",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        default=False,
+        help="flag to re-run slide detection with the current thresholds over the motion signal saved by a previous run, decoding only the selected frames",
+    )
     parser.add_argument(
         "-hf",
         "--hash-func",
@@ -60,26 +185,380 @@ if __name__ == "__main__":
         default=HASH_BUFFER_HISTORY,
         type=int,
     )
+    parser.add_argument(
+        "--global-dedup",
+        action="store_true",
+        default=False,
+        help="flag to compare each image against every kept image instead of the last QUEUE_LEN images. Only effective if post-processing is enabled",
+    )
+    parser.add_argument(
+        "--online-dedup",
+        action="store_true",
+        default=False,
+        help="flag to remove duplicate slides in memory during capture instead of post-processing the output directory. With --segments the output directory is still post-processed for duplicates across segments",
+    )
     parser.add_argument(
         "--no_post_process",
         action="store_true",
         default=False,
         help="flag to apply post processing or not",
     )
+    parser.add_argument(
+        "--slide-store",
+        action="store_true",
+        default=False,
+        help="flag to save the slides in a single content-addressed file instead of one image file per slide",
+    )
+    parser.add_argument(
+        "--image-format",
+        help="Image format of the slides saved with --slide-store",
+        default=SLIDE_STORE_FORMAT,
+        choices=list(IMAGE_FORMATS),
+        type=str,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=CACHE_DIR,
+        help="Path to the result cache directory",
+        type=str,
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="flag to always process the video instead of reusing cached results",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Path to a JSON report of the time spent in each processing stage. Stages running in --segments worker processes are not included",
+        type=str,
+    )
     parser.add_argument(
         "--convert_to_pdf",
         action="store_true",
         default=False,
         help="flag to convert the entire image set to pdf or not",
     )
-    args = parser.parse_args()
 
+    return parser
+
+
+def get_thresholds(args, type_bg_sub=None):
+    # Detection thresholds of the capture state machine, the only parameters a replay of
+    # the motion signal can change.
+    if (type_bg_sub or args.type).lower() in ("frame_diff", "keyframe"):
+        return dict(
+            MIN_PERCENT_THRESH=args.frame_diff_min_percent,
+            ELAPSED_FRAME_THRESH=args.frame_diff_elapsed_frames,
+        )
+
+    return dict(MIN_PERCENT_THRESH=args.min_percent, MAX_PERCENT_THRESH=args.max_percent)
+
+
+def get_signal_params(args, roi=None):
+    # Every parameter that changes the motion signal, but not the detection thresholds.
+    params = dict(
+        type=args.type,
+        analysis_fps=args.analysis_fps,
+        frame_stride=args.frame_stride,
+    )
+    if roi is not None:
+        params.update(roi=repr(roi))
+
+    if args.type.lower() in ("frame_diff", "keyframe"):
+        params.update(resize_width=args.resize_width)
+    else:
+        params.update(
+            history=FRAME_BUFFER_HISTORY, dec_thresh=DEC_THRESH, dist_thresh=DIST_THRESH
+        )
+
+    return params
+
+
+def get_cache_params(args, roi=None):
+    # Every parameter that changes the extracted slides or the PDF.
+    params = dict(
+        type=args.type,
+        analysis_fps=args.analysis_fps,
+        frame_stride=args.frame_stride,
+        segments=args.segments,
+        two_pass=args.two_pass,
+        hash_func=args.hash_func,
+        hash_size=args.hash_size,
+        threshold=args.threshold,
+        queue_len=args.queue_len,
+        global_dedup=args.global_dedup,
+        online_dedup=args.online_dedup,
+        no_post_process=args.no_post_process,
+        convert_to_pdf=args.convert_to_pdf,
+    )
+    if roi is not None:
+        params.update(roi=repr(roi))
+    if args.slide_store:
+        params.update(slide_store=args.image_format)
+
+    if args.type.lower() in ("frame_diff", "keyframe"):
+        params.update(resize_width=args.resize_width)
+    else:
+        params.update(
+            history=FRAME_BUFFER_HISTORY, dec_thresh=DEC_THRESH, dist_thresh=DIST_THRESH
+        )
+    params.update(get_thresholds(args))
+
+    return params
+
+
+def create_slide_store(video_path, output_dir_path, args):
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+
+    store_path = get_store_path(output_dir_path)
+    print("Slide store path:", store_path)
+
+    return SlideStore(
+        store_path,
+        "w",
+        args.image_format,
+        fps,
+        args.hash_size,
+        HASH_FUNC_DICT.get(args.hash_func),
+    )
+
+
+def extract_ensemble_slides(video_path, output_dir_path, args, roi=None):
+    # Each detector saves its slides where a run with its own --type would, the slides
+    # merged by vote go to the Ensemble directory.
+    output_dir_paths = {}
+    for type_bg_sub in args.detectors.split(","):
+        output_dir_paths[type_bg_sub.strip()] = create_output_directory(
+            video_path, args.out_dir, type_bg_sub.strip()
+        )
+    if args.vote > 0:
+        output_dir_paths[VOTE_DIR] = output_dir_path
+
+    hash_size = args.hash_size
+    hash_func = HASH_FUNC_DICT.get(args.hash_func)
+    diff_threshold = int(hash_size * hash_size * (100 - args.threshold) / 100)
+
+    deduplicators = {}
+    if args.online_dedup and not args.no_post_process:
+        deduplicators = {
+            name: SlideDeduplicator(
+                hash_size,
+                hash_func,
+                args.queue_len,
+                diff_threshold,
+                args.global_dedup,
+                roi,
+            )
+            for name in output_dir_paths
+        }
+
+    stream_pdf = args.convert_to_pdf and (args.online_dedup or args.no_post_process)
+    pdf_paths = {}
+    if stream_pdf:
+        pdf_paths = {
+            name: os.path.join(path, os.path.basename(path) + ".pdf")
+            for name, path in output_dir_paths.items()
+        }
+
+    stores = {}
+    if args.slide_store:
+        stores = {
+            name: create_slide_store(video_path, path, args)
+            for name, path in output_dir_paths.items()
+        }
+
+    capture_slides_ensemble(
+        video_path,
+        output_dir_paths,
+        analysis_fps=args.analysis_fps,
+        frame_stride=args.frame_stride,
+        pipelined=args.pipeline,
+        resize_width=args.resize_width,
+        min_votes=args.vote,
+        deduplicators=deduplicators,
+        pdf_paths=pdf_paths,
+        stores=stores,
+        report_path=os.path.join(os.path.dirname(output_dir_path), VOTE_DIR + ".json"),
+        roi=roi,
+        thresholds={
+            name: get_thresholds(args, name)
+            for name in output_dir_paths
+            if name != VOTE_DIR
+        },
+    )
+    for store in stores.values():
+        store.close()
+
+    for path in output_dir_paths.values():
+        if not args.no_post_process and not args.online_dedup:
+            remove_duplicates(
+                path,
+                hash_size,
+                hash_func,
+                args.queue_len,
+                diff_threshold,
+                args.global_dedup,
+                roi,
+            )
+
+        if args.convert_to_pdf and not stream_pdf:
+            convert_slides_to_pdf(path)
+
+
+def extract_slides(video_path, output_dir_path, args, signal_path=None, roi=None):
     queue_len = args.queue_len
-    if queue_len <= 0:
+    type_bg_sub = args.type
+
+    hash_size = args.hash_size
+    hash_func = HASH_FUNC_DICT.get(args.hash_func)
+    sim_threshold = args.threshold
+    diff_threshold = int(hash_size * hash_size * (100 - sim_threshold) / 100)
+
+    capture_kwargs = dict(
+        analysis_fps=args.analysis_fps,
+        frame_stride=args.frame_stride,
+        pipelined=args.pipeline,
+    )
+    if roi is not None:
+        capture_kwargs.update(roi=roi)
+    if args.online_dedup and not args.no_post_process:
+        capture_kwargs.update(
+            deduplicator=SlideDeduplicator(
+                hash_size, hash_func, queue_len, diff_threshold, args.global_dedup, roi
+            )
+        )
+
+    capture_kwargs.update(get_thresholds(args))
+    if type_bg_sub.lower() in ("frame_diff", "keyframe"):
+        capture_kwargs.update(resize_width=args.resize_width)
+    else:
+        if type_bg_sub.lower() == "gmg":
+            thresh = DEC_THRESH
+        elif type_bg_sub.lower() == "knn":
+            thresh = DIST_THRESH
+
+        capture_kwargs.update(history=FRAME_BUFFER_HISTORY, threshold=thresh)
+
+    signal, signal_meta = None, None
+    if args.replay and signal_path is not None:
+        signal, signal_meta = load_motion_signal(signal_path)
+        if signal is None:
+            print("No saved motion signal found, processing the whole video...")
+
+    # Segments and refinement windows only cover part of the video, they are
+    # not checkpointed.
+    if args.segments <= 1 and not args.two_pass:
+        capture_kwargs.update(
+            checkpoint_path=get_checkpoint_path(output_dir_path),
+            resume=args.resume,
+            signal_path=signal_path,
+        )
+
+    # Slides are final once saved, unless duplicates are removed afterwards. The PDF is
+    # then written page by page during capture.
+    stream_pdf = (
+        args.convert_to_pdf
+        and (args.online_dedup or args.no_post_process)
+        and args.segments <= 1
+        and not args.two_pass
+    )
+    if stream_pdf:
+        pdf_path = os.path.join(
+            output_dir_path, os.path.basename(output_dir_path) + ".pdf"
+        )
+        capture_kwargs.update(pdf_path=pdf_path)
+        print("Output PDF Path:", pdf_path)
+
+    # Segments and refinement windows are saved as files first, they are moved into the
+    # slide store once they are stitched.
+    store = None
+    if args.slide_store:
+        store = create_slide_store(video_path, output_dir_path, args)
+        if signal is not None or (args.segments <= 1 and not args.two_pass):
+            capture_kwargs.update(store=store)
+
+    if signal is not None:
+        replay_kwargs = dict(
+            pipelined=args.pipeline,
+            deduplicator=capture_kwargs.get("deduplicator"),
+            pdf_path=capture_kwargs.get("pdf_path"),
+            store=store,
+            **get_thresholds(args),
+        )
+
+        replay_slides(video_path, output_dir_path, signal, signal_meta, **replay_kwargs)
+    elif type_bg_sub.lower() == "keyframe":
+        capture_slides_keyframes(video_path, output_dir_path, **capture_kwargs)
+    elif args.two_pass:
+        slides = capture_slides_two_pass(
+            video_path,
+            output_dir_path,
+            type_bg_sub,
+            hash_size=hash_size,
+            hashfunc=hash_func,
+            hash_threshold=diff_threshold,
+            **capture_kwargs,
+        )
+    elif args.segments > 1:
+        slides = capture_slides_parallel(
+            video_path,
+            output_dir_path,
+            type_bg_sub,
+            args.segments,
+            hash_size=hash_size,
+            hashfunc=hash_func,
+            hash_threshold=diff_threshold,
+            **capture_kwargs,
+        )
+    elif type_bg_sub.lower() == "frame_diff":
+        capture_slides_frame_diff(video_path, output_dir_path, **capture_kwargs)
+    else:
+        capture_slides_bg_modeling(
+            video_path, output_dir_path, type_bgsub=type_bg_sub, **capture_kwargs
+        )
+
+    if store is not None:
+        if "store" not in capture_kwargs:
+            pack_image_files(store, slides)
+        store.close()
+
+    # Segments are captured in separate processes, each with its own copy of the online
+    # deduplicator, so duplicates across segments are only found by post-processing.
+    split_dedup = args.online_dedup and signal is None and args.segments > 1
+
+    # Perform post-processing using difference hashing technique to remove duplicate slides.
+    if not args.no_post_process and (not args.online_dedup or split_dedup):
+        remove_duplicates(
+            output_dir_path,
+            hash_size,
+            hash_func,
+            queue_len,
+            diff_threshold,
+            args.global_dedup,
+            roi,
+        )
+
+    if args.convert_to_pdf and not stream_pdf:
+        convert_slides_to_pdf(output_dir_path)
+
+
+def save_profile(args):
+    if args.profile:
+        instrumentation.print_report(instrumentation.save_report(args.profile))
+
+
+def main(args):
+    if args.queue_len <= 0:
         print(
             f"Warnings: queue_len argument must be positive. Fallback to {HASH_BUFFER_HISTORY}"
         )
-        queue_len = HASH_BUFFER_HISTORY
+        args.queue_len = HASH_BUFFER_HISTORY
+
+    if args.profile:
+        instrumentation.enable()
 
     video_path = args.video_path
     output_dir_path = args.out_dir
@@ -87,7 +566,11 @@ if __name__ == "__main__":
     temp_file = False
 
     if validators.url(video_path):
-        video_path = download_video(video_path)
+        video_path = download_video(
+            video_path,
+            progressive=args.progressive_download,
+            num_connections=args.connections,
+        )
         temp_file = True
         if video_path is None:
             exit(1)
@@ -96,39 +579,120 @@ if __name__ == "__main__":
             "The video doesn't exist or isn't a valid URL. Please check your video path again"
         )
 
-    output_dir_path = create_output_directory(video_path, output_dir_path, type_bg_sub)
+    if args.resume and (args.segments > 1 or args.two_pass):
+        print(
+            "Warnings: --resume is not supported with --segments or --two-pass. Starting over"
+        )
+        args.resume = False
 
-    if type_bg_sub.lower() == "frame_diff":
-        capture_slides_frame_diff(video_path, output_dir_path)
-    else:
-        if type_bg_sub.lower() == "gmg":
-            thresh = DEC_THRESH
-        elif type_bg_sub.lower() == "knn":
-            thresh = DIST_THRESH
+    if args.resume and args.slide_store:
+        print("Warnings: --resume is not supported with --slide-store. Starting over")
+        args.resume = False
 
-        capture_slides_bg_modeling(
-            video_path,
-            output_dir_path,
-            type_bgsub=type_bg_sub,
-            history=FRAME_BUFFER_HISTORY,
-            threshold=thresh,
-            MIN_PERCENT_THRESH=MIN_PERCENT,
-            MAX_PERCENT_THRESH=MAX_PERCENT,
+    if args.type.lower() == "keyframe" and (
+        args.segments > 1
+        or args.two_pass
+        or args.analysis_fps
+        or args.frame_stride > 1
+        or args.resume
+        or args.replay
+    ):
+        print(
+            "Warnings: Keyframe scanning already skips most frames. Ignoring --segments, --two-pass, --analysis-fps, --frame-stride, --resume and --replay"
         )
+        args.segments = 1
+        args.two_pass = False
+        args.analysis_fps = ANALYSIS_FPS
+        args.frame_stride = 1
+        args.resume = False
+        args.replay = False
 
-    # Perform post-processing using difference hashing technique to remove duplicate slides.
-    if not args.no_post_process:
-        hash_size = args.hash_size
-        hash_func = HASH_FUNC_DICT.get(args.hash_func)
-        sim_threshold = args.threshold
+    if args.type.lower() == "ensemble" and (
+        args.segments > 1 or args.two_pass or args.resume or args.replay
+    ):
+        print(
+            "Warnings: Ensemble runs every detector in a single pass. Ignoring --segments, --two-pass, --resume and --replay"
+        )
+        args.segments = 1
+        args.two_pass = False
+        args.resume = False
+        args.replay = False
 
-        diff_threshold = int(hash_size * hash_size * (100 - sim_threshold) / 100)
-        remove_duplicates(
-            output_dir_path, hash_size, hash_func, queue_len, diff_threshold
+    if args.two_pass and args.segments > 1:
+        print("Warnings: --two-pass refines windows sequentially. Ignoring --segments")
+        args.segments = 1
+
+    # The output directory is only kept if it holds a checkpoint to resume from,
+    # otherwise slides left over from a previous run would end up in the output.
+    if args.resume and not has_checkpoint(
+        get_checkpoint_path(
+            get_output_directory(video_path, output_dir_path, type_bg_sub)
+        ),
+        video_path,
+    ):
+        print("No checkpoint found, starting from the beginning...")
+        args.resume = False
+
+    output_dir_path = create_output_directory(
+        video_path, output_dir_path, type_bg_sub, clean=not args.resume
+    )
+
+    # Segments are read by other processes, keyframes are read from the container and
+    # the ROI pre-scan samples the whole video, they need the complete file.
+    download = get_active_download(video_path)
+    needs_complete_file = (
+        args.segments > 1 or type_bg_sub.lower() == "keyframe" or args.auto_roi
+    )
+    if download is not None and needs_complete_file:
+        download.wait()
+        download = None
+
+    roi = load_roi(video_path, args.roi, args.ignore_mask, args.auto_roi)
+
+    # The slides of an ensemble are spread over several directories, they are not cached.
+    if type_bg_sub.lower() == "ensemble":
+        extract_ensemble_slides(video_path, output_dir_path, args, roi)
+
+        if download is not None and not download.wait():
+            exit(1)
+
+        save_profile(args)
+
+        return output_dir_path
+
+    # Reuse the results of a previous run on the same video with the same parameters.
+    # A video that is still downloading can only be fingerprinted once it is complete.
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    if cache is not None and download is None and not args.resume:
+        cache_key = make_cache_key(video_path, get_cache_params(args, roi))
+        # A cache hit still reports the time spent restoring the cached slides.
+        if instrumentation.timed("cache_lookup", cache.get, cache_key, output_dir_path):
+            save_profile(args)
+            return output_dir_path
+
+    # The motion signal is stored with the cache, keyed by the video and the parameters
+    # it depends on.
+    signal_path = None
+    if cache is not None and download is None:
+        signal_path = cache.get_signal_path(
+            make_cache_key(video_path, get_signal_params(args, roi))
         )
 
-    if args.convert_to_pdf:
-        convert_slides_to_pdf(output_dir_path)
+    extract_slides(video_path, output_dir_path, args, signal_path, roi)
+
+    if download is not None and not download.wait():
+        exit(1)
+
+    if cache is not None:
+        cache.put(make_cache_key(video_path, get_cache_params(args, roi)), output_dir_path)
+
+    save_profile(args)
 
     # if temp_file:
     #     os.remove(video_path)
+
+    return output_dir_path
+
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
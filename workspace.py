@@ -0,0 +1,140 @@
+import os
+import shutil
+import threading
+import time
+from config import (
+    WORKSPACE_GC_INTERVAL,
+    WORKSPACE_MAX_SIZE_MB,
+    WORKSPACE_ROOT,
+    WORKSPACE_TTL,
+)
+
+# Every job of the Gradio app works in its own directory under the workspace root,
+# named after the job, so concurrent jobs never share a path. Nothing is deleted on
+# the request path: a background thread removes the inputs and slide images of
+# finished jobs, then whole workspaces once they expire or, least recently finished
+# first, while the root is over its quota.
+
+INPUT_DIR = "input"
+SLIDES_DIR = "slides"
+RESULT_DIR = "result"
+DONE_MARKER = ".done"
+
+# Only needed while the job runs.
+SCRATCH_DIRS = (INPUT_DIR, SLIDES_DIR)
+
+
+def get_tree_size(dir_path):
+    total_size = 0
+    for root, _, files in os.walk(dir_path):
+        for file in files:
+            try:
+                total_size += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                # Removed by the job in the meantime.
+                pass
+
+    return total_size
+
+
+class WorkspaceManager:
+    def __init__(
+        self,
+        root=WORKSPACE_ROOT,
+        max_size_mb=WORKSPACE_MAX_SIZE_MB,
+        ttl=WORKSPACE_TTL,
+    ):
+        self.root = root
+        self.max_size = max_size_mb * 1024 * 1024
+        self.ttl = ttl
+        self.size = 0
+        os.makedirs(root, exist_ok=True)
+
+    def get_path(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def create(self, job_id):
+        # A job run again after a restart keeps its input, but starts over.
+        workspace_path = self.get_path(job_id)
+        shutil.rmtree(os.path.join(workspace_path, SLIDES_DIR), ignore_errors=True)
+        if os.path.exists(os.path.join(workspace_path, DONE_MARKER)):
+            os.remove(os.path.join(workspace_path, DONE_MARKER))
+
+        for dir_name in (INPUT_DIR, SLIDES_DIR, RESULT_DIR):
+            os.makedirs(os.path.join(workspace_path, dir_name), exist_ok=True)
+
+        return workspace_path
+
+    def finish(self, job_id):
+        # The marker time is when the job finished, for expiration and eviction.
+        with open(os.path.join(self.get_path(job_id), DONE_MARKER), "w"):
+            pass
+
+    def is_full(self):
+        # Disk usage measured by the last garbage collection pass.
+        return self.size >= self.max_size
+
+    def remove(self, workspace_path):
+        shutil.rmtree(workspace_path, ignore_errors=True)
+
+    def collect(self, is_active=None):
+        now = time.time()
+        finished = []
+        total_size = 0
+
+        for job_id in os.listdir(self.root):
+            workspace_path = os.path.join(self.root, job_id)
+            if not os.path.isdir(workspace_path):
+                continue
+
+            marker_path = os.path.join(workspace_path, DONE_MARKER)
+            if os.path.exists(marker_path):
+                for dir_name in SCRATCH_DIRS:
+                    shutil.rmtree(os.path.join(workspace_path, dir_name), ignore_errors=True)
+
+                finished_at = os.path.getmtime(marker_path)
+                if now - finished_at > self.ttl:
+                    self.remove(workspace_path)
+                    continue
+
+                size = get_tree_size(workspace_path)
+                finished.append((finished_at, size, workspace_path))
+            elif (
+                is_active is not None
+                and not is_active(job_id)
+                and now - os.path.getmtime(workspace_path) > self.ttl
+            ):
+                # Left behind by a worker that crashed before finishing its job.
+                self.remove(workspace_path)
+                continue
+            else:
+                size = get_tree_size(workspace_path)
+
+            total_size += size
+
+        # Running jobs are never evicted, the oldest finished ones go first.
+        for _, size, workspace_path in sorted(finished):
+            if total_size <= self.max_size:
+                break
+            self.remove(workspace_path)
+            total_size -= size
+
+        self.size = total_size
+        return total_size
+
+
+def start_gc(collect, interval=WORKSPACE_GC_INTERVAL):
+    # Runs collect() on a background thread every interval seconds.
+    def run():
+        while True:
+            try:
+                collect()
+            except Exception as e:
+                # Keep collecting, the next pass may succeed.
+                print("Garbage collection failed:", e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    return thread